@@ -6,7 +6,8 @@ from langchain_core.prompts import (
 )
 from langchain_core.runnables import (
     RunnablePassthrough,
-    RunnableSequence
+    RunnableSequence,
+    RunnableLambda
 )
 from langchain.prompts.few_shot import FewShotChatMessagePromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -19,25 +20,171 @@ from utils import (
 )
 
 from operator import itemgetter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
+from faq_ingest import load_or_build_index, index_version, saved_index_version, index_embeddings
+from faq_retrieval import HybridRetriever
+from faq_cache import AnswerCache
+from governor import CircuitOpenError
 import os
+import asyncio
+import threading
+
+RETRIEVAL_MODE = os.getenv('FAQ_RETRIEVAL_MODE', 'hybrid')
+
+
+def pergunta_original(text):
+    '''
+    ### Extrai a PERGUNTA_ORIGINAL do protocolo do roteador (ou devolve o texto como veio)
+    - Buscar com o protocolo inteiro (PERSONA etc.) só polui a recuperação
+    '''
+    for line in text.split('\n'):
+        if line.startswith('PERGUNTA_ORIGINAL='):
+            return line.split('=', 1)[1].strip()
+    return text
+
+
+def _nada():
+    pass
+
 
 class FaqAgent():
 
     def __init__(self):
-        PDF_PATH = 'faq_tools.pdf'
-        loader = PyPDFLoader(PDF_PATH)
-        docs = loader.load()
-        splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=150)
-        chunks = splitter.split_documents(docs)
-        db = FAISS.from_documents(chunks, embeddings)
-        self.chain = self.get_chain(db)
-
-    def get_faq_context(self, question, db):
-        results = db.similarity_search(question, k=6)
-        return results
+        self.cache = AnswerCache()
+        self._reload_lock = threading.Lock()
+        self.reload()
+        self.chain = RunnableLambda(self.answer, afunc=self.aanswer)
+
+    def reload(self):
+        '''
+        ### (Re)sincroniza o índice do FAQ; se ele mudou, o cache de respostas é esvaziado
+        '''
+        db, manifest, _ = load_or_build_index()
+        self.retriever = HybridRetriever(db)
+        self.rag_chain = self.get_chain(db)
+        self.cache.set_version(index_version(manifest))
+
+    def _index_stale(self):
+        # índice reconstruído em disco (ex.: `python faq_ingest.py` com o servidor no ar) desde o último reload
+        saved = saved_index_version()
+        return saved is not None and saved != self.cache.version
+
+    def sync_index(self):
+        '''
+        ### Recarrega o índice (e esvazia o cache de respostas) se ele foi reconstruído em disco
+        '''
+        if self._index_stale():
+            with self._reload_lock:
+                if self._index_stale():
+                    self.reload()
+
+    async def async_sync_index(self):
+        if self._index_stale():
+            await asyncio.to_thread(self.sync_index)
+
+    def answer(self, inputs):
+        '''
+        ### Responde pelo cache quando der; senão roda retrieval -> llm_fast e guarda a resposta
+        - A busca por similaridade só acontece quando a retrieval já ia calcular o embedding da pergunta (mesmo vetor)
+        '''
+        self.sync_index()
+        question = pergunta_original(inputs['input'])
+        version = self.cache.version
+        cached = self.cache.get_exact(question)
+        if cached is not None:
+            return cached
+
+        vector = None
+        if not self.retriever.is_lexical(question):
+            vector = self._query_vector(question)
+            cached = self.cache.get_similar(vector) if vector is not None else None
+            if cached is not None:
+                return cached
+
+        self.cache.miss()
+        answer = self.rag_chain.invoke(inputs)
+        self.cache.put(question, answer, vector, version=version)
+        return answer
+
+    async def aanswer(self, inputs):
+        '''
+        ### Versão async de `answer` (mesma ordem: cache exato, cache semântico, RAG)
+        '''
+        answer, guardar = await self.aanswer_deferred(inputs)
+        guardar()
+        return answer
+
+    async def aanswer_deferred(self, inputs):
+        '''
+        ### Como `aanswer`, mas devolve (resposta, guardar)
+        - a resposta só entra no cache quando `guardar()` for chamado
+        - usado pelo prefetch especulativo do main.py: resposta descartada não vai para o cache
+        '''
+        await self.async_sync_index()
+        question = pergunta_original(inputs['input'])
+        version = self.cache.version
+        cached = self.cache.get_exact(question)
+        if cached is not None:
+            return cached, _nada
+
+        vector = None
+        if not self.retriever.is_lexical(question):
+            vector = await self._aquery_vector(question)
+            cached = self.cache.get_similar(vector) if vector is not None else None
+            if cached is not None:
+                return cached, _nada
+
+        self.cache.miss()
+        answer = await self.rag_chain.ainvoke(inputs)
+        return answer, lambda: self.cache.put(question, answer, vector, version=version)
+
+    async def astream_answer(self, inputs, config=None):
+        '''
+        ### Como `aanswer`, mas gera a resposta em pedaços conforme o LLM produz (cache sai de uma vez)
+        '''
+        await self.async_sync_index()
+        question = pergunta_original(inputs['input'])
+        version = self.cache.version
+        cached = self.cache.get_exact(question)
+        vector = None
+        if cached is None and not self.retriever.is_lexical(question):
+            vector = await self._aquery_vector(question)
+            cached = self.cache.get_similar(vector) if vector is not None else None
+        if cached is not None:
+            yield cached
+            return
+
+        self.cache.miss()
+        parts = []
+        async for chunk in self.rag_chain.astream(inputs, config=config):
+            parts.append(chunk)
+            yield chunk
+        self.cache.put(question, ''.join(parts), vector, version=version)
+
+    @staticmethod
+    def _query_vector(question):
+        # embeddings fora do ar (circuit breaker aberto): sem cache semântico, a retrieval cai para o BM25
+        try:
+            return index_embeddings.embed_query(question)
+        except CircuitOpenError:
+            return None
+
+    @staticmethod
+    async def _aquery_vector(question):
+        try:
+            return await index_embeddings.aembed_query(question)
+        except CircuitOpenError:
+            return None
+
+    def _context(self, inputs):
+        # contexto já buscado (ex.: prefetch especulativo do main.py) é reaproveitado
+        if inputs.get('context') is not None:
+            return inputs['context']
+        return self.get_faq_context(inputs['input'])
+
+    def get_faq_context(self, question):
+        docs = self.retriever.retrieve(pergunta_original(question), mode=RETRIEVAL_MODE)
+        # só o texto dos trechos; o repr do Document (metadata etc.) só gastava token
+        return '\n---\n'.join(doc.page_content for doc in docs)
 
     def get_chain(self, db):
         system_prompt = ("system",
@@ -79,4 +226,4 @@ class FaqAgent():
              "Responda com base APENAS no CONTEXTO."))
         ])
 
-        return (RunnablePassthrough.assign( question=itemgetter("input"), context= lambda x: self.get_faq_context(x['input'], db), chat_history=lambda x: []) | prompt | llm_fast | StrOutputParser())
\ No newline at end of file
+        return (RunnablePassthrough.assign( question=itemgetter("input"), context=self._context, chat_history=lambda x: []) | prompt | llm_fast | StrOutputParser())
\ No newline at end of file
@@ -15,6 +15,7 @@ from utils import (
     llm,
     get_session_history
 )
+from history_window import compact_history
 from pg_tools import AGENDA_TOOLS
 
 class AgendaAgent(RunnableWithMessageHistory):
@@ -27,7 +28,9 @@ class AgendaAgent(RunnableWithMessageHistory):
 
 
             ### TAREFAS
-
+            - Nunca invente horários: use `list_events` para consultar/listar, `find_free_slots` para disponibilidade e `find_conflicts` para conflitos.
+            - Para criar, alterar ou cancelar use `create_event`, `update_event` e `cancel_event` (IDs vêm de `list_events`); se a tool devolver `conflicts`, avise o usuário.
+            - Datas/horários nas tools sempre no horário local (YYYY-MM-DD / YYYY-MM-DDTHH:MM).
 
 
             ### CONTEXTO
@@ -40,7 +43,7 @@ class AgendaAgent(RunnableWithMessageHistory):
 
 
             ### REGRAS
-            - Use o {chat_history} para resolver referências ao contexto recente.
+            - Use o histórico da conversa (mensagens anteriores) para resolver referências ao contexto recente.
 
 
             ### SAÍDA (JSON)
@@ -54,10 +57,6 @@ class AgendaAgent(RunnableWithMessageHistory):
             - esclarecer     : pergunta mínima de clarificação
             - janela_tempo   : {{"de":"YYYY-MM-DDTHH:MM","ate":"YYYY-MM-DDTHH:MM","rotulo":"ex.: 'amanhã 09:00–10:00'"}}
             - evento         : {{"titulo":"...","data":"YYYY-MM-DD","inicio":"HH:MM","fim":"HH:MM","local":"...","participantes":["..."]}}
-
-
-            ### HISTÓRICO DA CONVERSA
-            {chat_history}
             """
         )
 
@@ -89,6 +88,7 @@ class AgendaAgent(RunnableWithMessageHistory):
 
         prompt = ChatPromptTemplate.from_messages([
             system_prompt,
+            MessagesPlaceholder("history_summary", optional=True),   # resumo dos turnos antigos, junto do system prompt
             fewshots,
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
@@ -98,7 +98,7 @@ class AgendaAgent(RunnableWithMessageHistory):
         agent = create_tool_calling_agent(llm, AGENDA_TOOLS, prompt)
         executor = AgentExecutor(agent=agent, tools=AGENDA_TOOLS, verbose=False)
 
-        return executor
+        return compact_history('agenda', prompt) | executor
     
     def __init__(self):
         super().__init__(
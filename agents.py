@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import asyncio
+import importlib
+import threading
+
+AGENT_WARMUP = os.getenv('AGENT_WARMUP', '')   # agentes construídos em segundo plano na subida: 'all' ou lista por vírgula
+
+# tempos de subida em ms: import do módulo e construção de cada agente (ver `startup_profile`)
+_profile = {'import_ms': {}, 'build_ms': {}}
+_profile_lock = threading.Lock()
+
+
+def _record(kind, name, started):
+    with _profile_lock:
+        _profile[kind][name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _import(module):
+    # o primeiro import paga o custo (LangChain, agentes, FAISS...); os seguintes saem do sys.modules
+    if module in sys.modules:
+        return sys.modules[module]
+    started = time.perf_counter()
+    loaded = importlib.import_module(module)
+    _record('import_ms', module, started)
+    return loaded
+
+
+class LazyAgent():
+    '''
+    ### Agente construído só no primeiro uso (thread-safe: threads concorrentes esperam a mesma construção)
+    - `get()` bloqueia enquanto constrói; no event loop use `await aget()`, que constrói numa thread
+    - `factory(module)` recebe o módulo já importado e devolve o agente
+    '''
+
+    def __init__(self, name, module, factory):
+        self.name = name
+        self.module = module
+        self.factory = factory
+        self._agent = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self):
+        return self._agent is not None
+
+    def get(self):
+        if self._agent is None:
+            with self._lock:
+                if self._agent is None:
+                    module = _import(self.module)
+                    started = time.perf_counter()
+                    agent = self.factory(module)
+                    _record('build_ms', self.name, started)
+                    self._agent = agent
+        return self._agent
+
+    async def aget(self):
+        if self._agent is not None:
+            return self._agent
+        return await asyncio.to_thread(self.get)
+
+
+AGENTS = {
+    'router': LazyAgent('router', 'router', lambda m: m.FastRouter(m.RouterAgent())),
+    'orchestrator': LazyAgent('orchestrator', 'orchestrator', lambda m: m.OrchestratorAgent()),
+    'financeiro': LazyAgent('financeiro', 'financial', lambda m: m.FinancialAgent()),
+    'agenda': LazyAgent('agenda', 'agenda', lambda m: m.AgendaAgent()),
+    'faq': LazyAgent('faq', 'FAQ', lambda m: m.FaqAgent()),
+}
+
+
+def warm(names=AGENT_WARMUP):
+    '''
+    ### Constrói os agentes `names` ('all' ou lista por vírgula) numa thread de fundo, na ordem dada
+    - Quem precisar de um agente antes disso só espera a construção dele (mesmo lock)
+    - Retorna a thread (daemon), ou None se não houver o que aquecer
+    '''
+    if isinstance(names, str):
+        names = list(AGENTS) if names.strip() == 'all' else [n.strip() for n in names.split(',') if n.strip()]
+    pending = [AGENTS[n] for n in names if not AGENTS[n].built]
+    if not pending:
+        return None
+
+    def run():
+        for agent in pending:
+            try:
+                agent.get()
+            except Exception as e:
+                # o erro aparece de novo (e com contexto) no primeiro uso de verdade
+                print(f"[agents] falha ao aquecer '{agent.name}': {e}", file=sys.stderr)
+
+    thread = threading.Thread(target=run, name='agent-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_profile():
+    '''
+    ### Tempos de subida em ms: import de cada módulo e construção de cada agente já construído
+    '''
+    with _profile_lock:
+        return {'import_ms': dict(_profile['import_ms']), 'build_ms': dict(_profile['build_ms']),
+                'built': [name for name, agent in AGENTS.items() if agent.built]}
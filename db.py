@@ -0,0 +1,269 @@
+import os
+import time
+import atexit
+import asyncio
+import threading
+import contextvars
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import psycopg2
+from psycopg2 import extensions
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Fuso dos "dias locais": o mesmo no Python (utils.TZ) e no SQL (função local_day, migração 0010)
+LOCAL_TIMEZONE = os.getenv("LOCAL_TIMEZONE", "America/Sao_Paulo")
+
+# Configuração do pool (todas opcionais, via .env)
+POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "10"))          # segundos esperando uma conexão livre
+POOL_CHECK_AFTER = float(os.getenv("PG_POOL_CHECK_AFTER", "30"))  # conexões ociosas há mais tempo levam um SELECT 1 antes de sair
+POOL_MAX_LIFETIME = float(os.getenv("PG_POOL_MAX_LIFETIME", "3600"))  # conexões mais velhas que isso são recicladas
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool():
+    '''
+    ### Pool de conexões psycopg2 compartilhado pelo processo
+    - Reaproveita conexões abertas em vez de fazer o handshake TCP+auth a cada tool
+    - Faz health check na retirada e recicla conexões quebradas ou velhas
+    - Bloqueia (até `timeout`) quando todas as `max_size` conexões estão em uso
+    '''
+
+    def __init__(self, dsn, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 check_after=POOL_CHECK_AFTER, max_lifetime=POOL_MAX_LIFETIME):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conn, último uso)
+        self._born = {}        # conn -> momento da criação
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._metrics = {
+            "created": 0,
+            "recycled": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+        for _ in range(min(self.min_size, self.max_size)):
+            conn = self._connect()
+            with self._cond:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        with self._cond:
+            self._born[conn] = time.monotonic()
+            self._metrics["created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._born.pop(conn, None)
+            self._size -= 1
+            self._metrics["recycled"] += 1
+            self._cond.notify()
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._born.get(conn, 0) > self.max_lifetime:
+            return False
+        if time.monotonic() - last_used < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        '''
+        ### Retira uma conexão saudável do pool
+        - Levanta PoolTimeout se nenhuma ficar livre dentro de `timeout`
+        '''
+        start = time.monotonic()
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("Pool de conexões encerrado.")
+                while not self._idle and self._size >= self.max_size:
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self._metrics["timeouts"] += 1
+                        raise PoolTimeout(f"Nenhuma conexão livre em {self.timeout}s (max={self.max_size}).")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(conn, last_used):
+                self._discard(conn)
+                continue
+
+            wait = time.monotonic() - start
+            with self._cond:
+                self._in_use += 1
+                self._metrics["checkouts"] += 1
+                if waited:
+                    self._metrics["waits"] += 1
+                self._metrics["wait_time_total"] += wait
+                self._metrics["wait_time_max"] = max(self._metrics["wait_time_max"], wait)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        '''
+        ### Devolve a conexão ao pool
+        - Transações esquecidas abertas são desfeitas para a próxima tool não herdar estado
+        '''
+        with self._cond:
+            self._in_use -= 1
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        # try/finally: a conexão volta ao pool em qualquer saída, inclusive GeneratorExit,
+        # KeyboardInterrupt e CancelledError (que não herdam de Exception)
+        conn = self.getconn()
+        ok = False
+        try:
+            yield conn
+            ok = True
+        finally:
+            if ok:
+                self.putconn(conn)
+            else:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                self.putconn(conn, discard=bool(conn.closed))
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._metrics)
+            stats.update({
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+        checkouts = stats["checkouts"] or 1
+        stats["wait_time_avg"] = stats["wait_time_total"] / checkouts
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    '''
+    ### Função que retorna o pool do processo (criado na primeira chamada)
+    '''
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE_URL)
+    return _pool
+
+def get_conn():
+    '''
+    ### Context manager que empresta uma conexão do pool
+    - Uso: `with get_conn() as conn:`; a conexão volta ao pool mesmo em caso de erro
+    '''
+    return get_pool().connection()
+
+def pool_stats():
+    '''
+    ### Métricas do pool: espera, conexões em uso, criadas e recicladas
+    '''
+    if _pool is None:
+        return {}
+    return _pool.stats()
+
+_executor = None
+
+async def run_db(func, *args, **kwargs):
+    '''
+    ### Roda uma função de banco (psycopg2, bloqueante) sem travar o event loop
+    - Usa um pool de threads do mesmo tamanho do pool de conexões, então nunca há mais threads
+      esperando do que conexões disponíveis
+    '''
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=POOL_MAX_SIZE, thread_name_prefix='db')
+    loop = asyncio.get_running_loop()
+    # copia o contexto (contextvars) para a thread, como o asyncio.to_thread faz (ex.: trace do turno)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, partial(context.run, func, *args, **kwargs))
+
+@atexit.register
+def _close_pool():
+    if _pool is not None:
+        _pool.close()
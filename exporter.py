@@ -0,0 +1,60 @@
+import sys
+import csv
+import json
+import argparse
+from datetime import date, datetime
+from decimal import Decimal
+
+from pg_tools import iter_transactions, TRANSACTION_COLUMNS
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def export_transactions(out, file_format="jsonl", columns=None, **filters) -> int:
+    '''
+    ### Grava as transações dos filtros em `out` (arquivo aberto), em streaming pelo cursor nomeado
+    - file_format: 'jsonl' ou 'csv'; a memória não cresce com o tamanho da exportação
+    - Retorna quantas linhas foram gravadas
+    '''
+    columns = columns or list(TRANSACTION_COLUMNS)
+    writer = None
+    if file_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+    count = 0
+    for row in iter_transactions(columns=columns, **filters):
+        if writer:
+            writer.writerow([_plain(row[c]) for c in columns])
+        else:
+            out.write(json.dumps({c: _plain(v) for c, v in row.items()}, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta transações (CSV ou JSONL) sem carregar tudo na memória")
+    parser.add_argument("output", help="Arquivo de saída ('-' para a saída padrão)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--columns", help="Colunas separadas por vírgula (padrão: todas)")
+    parser.add_argument("--text")
+    parser.add_argument("--type-name")
+    parser.add_argument("--date-from", help="YYYY-MM-DD")
+    parser.add_argument("--date-to", help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    filters = {"text": args.text, "type_name": args.type_name,
+               "date_from_local": args.date_from, "date_to_local": args.date_to}
+    columns = args.columns.split(",") if args.columns else None
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        total = export_transactions(out, args.format, columns, **filters)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{total} transação(ões) exportada(s).", file=sys.stderr)
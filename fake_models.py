@@ -0,0 +1,154 @@
+import json
+import time
+import random
+import asyncio
+import hashlib
+from datetime import timedelta
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from faq_retrieval import tokenize
+
+# Tools que o modelo falso sabe chamar, com argumentos fixos (a primeira disponível é usada)
+FAKE_TOOL_CALLS = {
+    'total_balance': lambda today: {},
+    'query_transactions': lambda today: {'date_from_local': (today - timedelta(days=30)).isoformat(), 'limit': 20},
+    'list_events': lambda today: {'date_from_local': today.isoformat(),
+                                  'date_to_local': (today + timedelta(days=6)).isoformat()},
+}
+
+
+class FakeChatModel(BaseChatModel):
+    '''
+    ### Chat model determinístico para benchmark/teste offline (nenhuma chamada de rede)
+    - Responde cada prompt do sistema no formato que o agente espera: protocolo do roteador, tool call +
+      JSON do especialista, texto do FAQ/orquestrador e resumo do histórico
+    - `latency` (s) e `jitter` (fração) simulam o tempo do modelo; `seed` deixa o jitter reproduzível
+    '''
+
+    model: str = 'fake-chat'
+    latency: float = 0.0
+    jitter: float = 0.0
+    seed: int = 0
+    _rng: Any = None
+    _calls: int = 0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self):
+        return 'fake-chat'
+
+    @property
+    def _identifying_params(self):
+        return {'model': self.model, 'latency': self.latency}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t)['function']['name'] for t in tools], **kwargs)
+
+    def _delay(self):
+        if not self.latency:
+            return 0.0
+        return max(self.latency * (1 + self._rng.uniform(-self.jitter, self.jitter)), 0.0)
+
+    def _reply(self, messages, tools):
+        from protocol import route_message, likely_routes
+        from utils import today
+
+        last = messages[-1]
+        text = str(last.content)
+        self._calls += 1
+
+        if tools:
+            dominio = 'agenda' if any('event' in name for name in tools) else 'financeiro'
+            intencao = 'consultar' if dominio == 'financeiro' else 'listar'
+            if not isinstance(last, ToolMessage):
+                for name, args in FAKE_TOOL_CALLS.items():
+                    if name in tools:
+                        return AIMessage(content='', tool_calls=[
+                            {'name': name, 'args': args(today), 'id': f'call_{self._calls}'}])
+            resposta = f"Resultado: {text[:80]}" if isinstance(last, ToolMessage) else 'Nada para consultar.'
+            return AIMessage(content=json.dumps({'dominio': dominio, 'intencao': intencao, 'resposta': resposta},
+                                                ensure_ascii=False))
+
+        if text.startswith('ESPECIALISTA_JSON'):
+            return AIMessage(content=text.split('\n', 1)[-1][:200])
+        if 'CONTEXTO (trechos' in text:
+            contexto = text.split('CONTEXTO (trechos do documento):', 1)[-1].strip()
+            return AIMessage(content=f"Segundo o FAQ: {contexto[:160]}")
+        if 'NOVO RESUMO' in text:
+            return AIMessage(content='Resumo: o usuário conversou sobre finanças e agenda.')
+
+        rotas = likely_routes(text)
+        return AIMessage(content=route_message(rotas[0] if rotas else 'faq', text))
+
+    def _result(self, messages, kwargs):
+        message = self._reply(messages, kwargs.get('tools') or [])
+        tokens_in = sum(len(str(m.content)) for m in messages) // 4
+        message.usage_metadata = {'input_tokens': tokens_in, 'output_tokens': len(str(message.content)) // 4,
+                                  'total_tokens': tokens_in + len(str(message.content)) // 4}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        time.sleep(self._delay())
+        return self._result(messages, kwargs)
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._result(messages, kwargs)
+
+
+class FakeEmbeddings(Embeddings):
+    '''
+    ### Embeddings determinísticos por "bag of words" com hashing (textos com as mesmas palavras ficam próximos)
+    - `latency` (s) por chamada, como uma ida à API
+    '''
+
+    def __init__(self, size=256, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.model = f'fake-embedding-{size}'
+
+    def _vector(self, text):
+        vector = np.zeros(self.size, dtype='float32')
+        for token in tokenize(text) or [text]:
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            vector[int.from_bytes(digest[:4], 'little') % self.size] += 1 if digest[4] & 1 else -1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+
+def install_fakes(llm_latency=0.0, embedding_latency=0.0, jitter=0.0, seed=0):
+    '''
+    ### Troca `utils.llm`, `utils.llm_fast` e `utils.embeddings` pelos modelos falsos
+    - Tem que rodar ANTES de importar os agentes (eles fazem `from utils import llm`)
+    '''
+    import utils
+    utils.llm = FakeChatModel(model='fake-llm', latency=llm_latency, jitter=jitter, seed=seed)
+    utils.llm_fast = FakeChatModel(model='fake-llm-fast', latency=llm_latency, jitter=jitter, seed=seed + 1)
+    utils.embeddings = FakeEmbeddings(latency=embedding_latency)
+    return utils
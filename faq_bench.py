@@ -0,0 +1,74 @@
+import json
+import time
+import argparse
+import statistics
+
+from faq_ingest import load_or_build_index
+from faq_retrieval import HybridRetriever, normalize
+
+MODES = ('lexical', 'vector', 'hybrid')
+
+
+def load_questions(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _hit(docs, expected):
+    texts = [normalize(doc.page_content) for doc in docs]
+    return any(normalize(e) in t for e in expected for t in texts)
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run(questions, retriever, ks=(1, 3, 6)):
+    '''
+    ### Mede recall@k e latência de cada modo de recuperação sobre as perguntas rotuladas
+    - Um acerto é algum trecho recuperado conter um dos textos esperados (sem acento/maiúsculas)
+    '''
+    report = {}
+    for mode in MODES:
+        hits = {k: 0 for k in ks}
+        latencies = []
+        retriever.stats = dict.fromkeys(retriever.stats, 0)
+        for item in questions:
+            start = time.perf_counter()
+            if mode == 'lexical':
+                docs = retriever.lexical(item['question'], max(ks))
+            elif mode == 'vector':
+                docs = retriever.vector(item['question'], max(ks))
+            else:
+                # o híbrido já corta por relevância; recall@k olha os k primeiros do que ele devolveu
+                docs = retriever.retrieve(item['question'])
+            latencies.append((time.perf_counter() - start) * 1000)
+            for k in ks:
+                hits[k] += _hit(docs[:k], item['expected'])
+        report[mode] = {
+            **{f"recall@{k}": hits[k] / len(questions) for k in ks},
+            'p50_ms': statistics.median(latencies),
+            'p95_ms': _percentile(latencies, 95),
+            'lexical_only_rate': retriever.stats['lexical_only'] / len(questions) if mode == 'hybrid' else None,
+            # consultas do híbrido que caíram no léxico porque o embedding falhou (circuito aberto etc.)
+            'degraded': retriever.stats['degraded'] if mode == 'hybrid' else None,
+        }
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark de recuperação do FAQ (recall@k e latência)")
+    parser.add_argument('--questions', default='faq_bench.jsonl')
+    parser.add_argument('--json', action='store_true', help="Imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    db, _, _ = load_or_build_index()
+    report = run(load_questions(args.questions), HybridRetriever(db, k=6))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for mode, metrics in report.items():
+            line = '  '.join(f"{name}={value:.3f}" if isinstance(value, float) else f"{name}={value}"
+                             for name, value in metrics.items() if value is not None)
+            print(f"{mode:8} {line}")
@@ -0,0 +1,109 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from faq_retrieval import normalize
+
+CACHE_MAX_SIZE = int(os.getenv('FAQ_CACHE_MAX_SIZE', '512'))
+CACHE_TTL = float(os.getenv('FAQ_CACHE_TTL', '86400'))            # segundos
+CACHE_THRESHOLD = float(os.getenv('FAQ_CACHE_THRESHOLD', '0.92'))  # similaridade de cosseno mínima
+
+
+def normalize_question(text):
+    '''
+    ### Forma canônica da pergunta para o cache exato ("Qual o E-mail do suporte??" == "qual o e-mail do suporte")
+    '''
+    return ' '.join(re.sub(r'[^\w@\-\s]', ' ', normalize(text)).split())
+
+
+class AnswerCache():
+    '''
+    ### Cache de respostas do FAQ
+    - Primeiro procura a pergunta normalizada; depois a pergunta mais parecida pelo embedding (cosseno >= threshold)
+    - Tamanho limitado (LRU) e validade por TTL
+    - Amarrado à versão do índice: as chaves levam a versão, e se o índice muda o cache é esvaziado;
+      resposta gerada com um índice anterior (`put(..., version=)` de outra versão) não é guardada
+    '''
+
+    def __init__(self, version=None, max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL, threshold=CACHE_THRESHOLD):
+        self.version = version
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (versão, pergunta normalizada) -> (resposta, vetor normalizado ou None, criado em)
+        self.stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def set_version(self, version):
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self.stats['invalidations'] += 1
+                self.version = version
+                self._entries.clear()
+
+    def _expired(self, created):
+        return self.ttl and time.monotonic() - created > self.ttl
+
+    def get_exact(self, question):
+        with self._lock:
+            key = (self.version, normalize_question(question))
+            entry = self._entries.get(key)
+            if entry and self._expired(entry[2]):
+                del self._entries[key]
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                self.stats['exact_hits'] += 1
+                return entry[0]
+        return None
+
+    def get_similar(self, vector):
+        '''
+        ### Resposta da pergunta mais parecida já respondida, se passar do threshold
+        '''
+        query = _unit(vector)
+        with self._lock:
+            keys = [k for k, (_, v, created) in self._entries.items()
+                    if k[0] == self.version and v is not None and not self._expired(created)]
+            if keys:
+                matrix = np.stack([self._entries[k][1] for k in keys])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.stats['semantic_hits'] += 1
+                    return self._entries[keys[best]][0]
+        return None
+
+    def miss(self):
+        with self._lock:
+            self.stats['misses'] += 1
+
+    def put(self, question, answer, vector=None, version=None):
+        with self._lock:
+            if version is not None and version != self.version:
+                return   # o índice mudou enquanto a resposta era gerada
+            key = (self.version, normalize_question(question))
+            self._entries[key] = (answer, _unit(vector) if vector is not None else None, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, size=len(self._entries), version=self.version)
+        lookups = stats['exact_hits'] + stats['semantic_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['exact_hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype='float32')
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
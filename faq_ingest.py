@@ -0,0 +1,241 @@
+from utils import embeddings
+
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.embeddings import Embeddings
+from collections import OrderedDict
+import threading
+import faiss
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import argparse
+
+PDF_PATH = 'faq_tools.pdf'
+DOCS_DIR = os.getenv('FAQ_DOCS_DIR', 'faq_docs')
+INDEX_DIR = os.getenv('FAQ_INDEX_DIR', '.faq_index')
+CACHE_DIR = os.getenv('FAQ_EMBEDDING_CACHE', '.faq_cache')
+INDEX_MMAP = os.getenv('FAQ_INDEX_MMAP', '1') == '1'
+CHUNK_SIZE = 700
+CHUNK_OVERLAP = 150
+
+LOADERS = {
+    '.pdf': PyPDFLoader,
+    '.txt': lambda path: TextLoader(path, encoding='utf-8'),
+    '.md': lambda path: TextLoader(path, encoding='utf-8'),
+}
+
+EMBEDDING_MODEL = getattr(embeddings, 'model', type(embeddings).__name__)
+
+# Embeddings com cache em disco por hash do texto do chunk: chunk que não mudou nunca é re-embedado,
+# mesmo que o documento em volta tenha mudado ou o índice tenha sido apagado
+cached_embeddings = CacheBackedEmbeddings.from_bytes_store(
+    embeddings,
+    LocalFileStore(os.path.join(CACHE_DIR, 'embeddings')),
+    namespace=EMBEDDING_MODEL,
+)
+
+
+class QueryMemoEmbeddings(Embeddings):
+    '''
+    ### Guarda em memória os últimos embeddings de pergunta
+    - O cache de respostas e a busca vetorial usam o mesmo vetor sem pagar duas chamadas
+    '''
+
+    def __init__(self, inner, max_size=1024):
+        self.inner = inner
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self._lock:
+            if text in self._memo:
+                self._memo.move_to_end(text)
+                return self._memo[text]
+        vector = self.inner.embed_query(text)
+        with self._lock:
+            self._memo[text] = vector
+            while len(self._memo) > self.max_size:
+                self._memo.popitem(last=False)
+        return vector
+
+
+index_embeddings = QueryMemoEmbeddings(cached_embeddings)
+
+
+def list_sources(docs_dir=DOCS_DIR):
+    '''
+    ### Documentos da base do FAQ: tudo que tiver loader dentro de `docs_dir`, ou só o PDF padrão se a pasta não existir
+    - Retorna {caminho relativo: caminho no disco}
+    '''
+    if not os.path.isdir(docs_dir):
+        return {os.path.basename(PDF_PATH): PDF_PATH}
+    sources = {}
+    for root, _, files in os.walk(docs_dir):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in LOADERS:
+                path = os.path.join(root, name)
+                sources[os.path.relpath(path, docs_dir)] = path
+    return sources
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _settings_key():
+    return f"{CHUNK_SIZE}|{CHUNK_OVERLAP}|{EMBEDDING_MODEL}"
+
+
+def _chunk(rel_path, path, doc_hash):
+    docs = LOADERS[os.path.splitext(path)[1].lower()](path).load()
+    for doc in docs:
+        doc.metadata['source'] = rel_path
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_documents(docs)
+    ids = [f"{rel_path}#{i}@{doc_hash[:12]}" for i in range(len(chunks))]
+    return chunks, ids
+
+
+def _load_index(folder, mmap=False):
+    # Mesmo formato do FAISS.save_local (index.faiss + index.pkl), mas podendo ler o índice com mmap
+    path = os.path.join(folder, 'index.faiss')
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+        except Exception:
+            index = None
+    if index is None:
+        index = faiss.read_index(path)
+    with open(os.path.join(folder, 'index.pkl'), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(index_embeddings, index, docstore, index_to_docstore_id)
+
+
+def _save_index(db, manifest, index_dir):
+    # grava numa pasta temporária e troca no final, pra nunca deixar um índice pela metade
+    tmp_dir = index_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    db.save_local(tmp_dir)
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+
+
+def index_version(manifest):
+    '''
+    ### Versão do índice: muda sempre que algum documento ou configuração muda
+    '''
+    payload = json.dumps([manifest['settings'], sorted((k, v['hash']) for k, v in manifest['docs'].items())])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+_saved_versions = {}   # caminho do manifest -> (mtime, versão)
+
+
+def saved_index_version(index_dir=INDEX_DIR):
+    '''
+    ### Versão do índice salvo em disco, ou None se não houver índice
+    - Só relê o manifest quando o mtime dele muda: dá para chamar a cada pergunta
+    - Pega também as reconstruções feitas por outro processo (`python faq_ingest.py`)
+    '''
+    path = os.path.join(index_dir, 'manifest.json')
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    saved = _saved_versions.get(path)
+    if saved and saved[0] == mtime:
+        return saved[1]
+    try:
+        with open(path) as f:
+            version = index_version(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None   # manifest sendo trocado agora: confere de novo na próxima pergunta
+    _saved_versions[path] = (mtime, version)
+    return version
+
+
+def load_or_build_index(docs_dir=DOCS_DIR, index_dir=INDEX_DIR):
+    '''
+    ### Sincroniza o índice FAISS com os documentos do FAQ
+    - Só re-chunka documentos adicionados/alterados e remove do índice os chunks dos alterados/removidos
+    - Sem mudanças, só carrega o índice salvo (com mmap)
+    - Retorna (db, manifest, resumo das mudanças)
+    '''
+    sources = list_sources(docs_dir)
+    if not sources:
+        raise ValueError(f"Nenhum documento do FAQ encontrado em {docs_dir}.")
+    hashes = {rel: _file_hash(path) for rel, path in sources.items()}
+
+    manifest_path = os.path.join(index_dir, 'manifest.json')
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('settings') != _settings_key():
+            manifest = None  # splitter ou modelo mudou: todos os chunks mudam de id
+
+    old_docs = manifest['docs'] if manifest else {}
+    added = [rel for rel in hashes if rel not in old_docs]
+    changed = [rel for rel in hashes if rel in old_docs and old_docs[rel]['hash'] != hashes[rel]]
+    removed = [rel for rel in old_docs if rel not in hashes]
+    summary = {'added': added, 'changed': changed, 'removed': removed, 'chunks_added': 0, 'chunks_removed': 0}
+
+    if manifest and not (added or changed or removed):
+        return _load_index(index_dir, mmap=INDEX_MMAP), manifest, summary
+
+    new_docs = {rel: old_docs[rel] for rel in hashes if rel in old_docs and rel not in changed}
+    chunks, ids = [], []
+    for rel in added + changed:
+        doc_chunks, doc_ids = _chunk(rel, sources[rel], hashes[rel])
+        chunks.extend(doc_chunks)
+        ids.extend(doc_ids)
+        new_docs[rel] = {'hash': hashes[rel], 'ids': doc_ids}
+    stale_ids = [i for rel in changed + removed for i in old_docs[rel]['ids']]
+
+    if manifest and new_docs.keys() - set(added + changed):
+        db = _load_index(index_dir)
+        if stale_ids:
+            db.delete(stale_ids)
+        if chunks:
+            db.add_documents(chunks, ids=ids)
+    else:
+        if not chunks:
+            raise ValueError("Os documentos do FAQ não geraram nenhum trecho de texto.")
+        db = FAISS.from_documents(chunks, index_embeddings, ids=ids)
+
+    summary['chunks_added'] = len(chunks)
+    summary['chunks_removed'] = len(stale_ids)
+    manifest = {'settings': _settings_key(), 'docs': new_docs}
+    _save_index(db, manifest, index_dir)
+    return db, manifest, summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sincroniza o índice do FAQ com a pasta de documentos")
+    parser.add_argument('--docs-dir', default=DOCS_DIR)
+    parser.add_argument('--index-dir', default=INDEX_DIR)
+    args = parser.parse_args()
+
+    _, manifest, summary = load_or_build_index(args.docs_dir, args.index_dir)
+    for label in ('added', 'changed', 'removed'):
+        for rel in summary[label]:
+            print(f"{label:8} {rel}")
+    print(f"{len(manifest['docs'])} documento(s); +{summary['chunks_added']} / -{summary['chunks_removed']} chunks; "
+          f"versão {index_version(manifest)[:12]}")
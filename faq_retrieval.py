@@ -0,0 +1,125 @@
+import os
+import math
+from collections import Counter, defaultdict
+
+from tracing import traced
+from textnorm import normalize, tokenize
+from governor import CircuitOpenError
+
+LEXICAL_K = int(os.getenv('FAQ_LEXICAL_K', '20'))
+VECTOR_K = int(os.getenv('FAQ_VECTOR_K', '20'))
+FINAL_K = int(os.getenv('FAQ_FINAL_K', '6'))
+VECTOR_WEIGHT = float(os.getenv('FAQ_VECTOR_WEIGHT', '0.5'))
+MIN_SCORE = float(os.getenv('FAQ_MIN_SCORE', '0.35'))
+# Fração dos termos da pergunta que o melhor trecho precisa cobrir para responder sem chamar o embedding
+LEXICAL_ONLY_COVERAGE = float(os.getenv('FAQ_LEXICAL_ONLY_COVERAGE', '0.8'))
+
+
+class BM25Index():
+    '''
+    ### Índice invertido BM25 em memória sobre os trechos do FAQ
+    '''
+
+    def __init__(self, docs, k1=1.5, b=0.75):
+        self.docs = docs
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)   # termo -> {posição do doc: frequência}
+        self.lengths = []
+        for i, doc in enumerate(docs):
+            terms = Counter(tokenize(doc.page_content))
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term][i] = tf
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        n = len(docs)
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    def search(self, query, k=LEXICAL_K):
+        '''
+        ### Retorna [(doc, score, cobertura)] dos k melhores trechos
+        - cobertura: fração dos termos da pergunta que aparecem no trecho
+        '''
+        terms = set(tokenize(query))
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        for term in terms:
+            for i, tf in self.postings.get(term, {}).items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+                scores[i] += self.idf[term] * tf * (self.k1 + 1) / norm
+                matched[i] += 1
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [(self.docs[i], scores[i], matched[i] / len(terms)) for i in best]
+
+
+class HybridRetriever():
+    '''
+    ### Recuperação híbrida do FAQ: BM25 local + FAISS, com fusão de scores e corte por relevância
+    - Se o BM25 já cobre quase toda a pergunta, responde só com ele e pula a chamada de embedding
+    '''
+
+    def __init__(self, db, k=FINAL_K, vector_weight=VECTOR_WEIGHT, min_score=MIN_SCORE,
+                 lexical_only_coverage=LEXICAL_ONLY_COVERAGE):
+        self.db = db
+        self.k = k
+        self.vector_weight = vector_weight
+        self.min_score = min_score
+        self.lexical_only_coverage = lexical_only_coverage
+        self.bm25 = BM25Index([db.docstore.search(doc_id) for doc_id in db.index_to_docstore_id.values()])
+        self.stats = {'lexical_only': 0, 'hybrid': 0, 'degraded': 0}
+
+    def _strong_lexical(self, question, lexical):
+        if lexical and len(tokenize(question)) >= 2 and lexical[0][2] >= self.lexical_only_coverage:
+            top = lexical[0][1]
+            return [doc for doc, score, _ in lexical[:self.k] if score >= top * self.min_score]
+        return None
+
+    def is_lexical(self, question):
+        '''
+        ### True se a pergunta será respondida só pelo BM25 (ou seja, sem chamada de embedding)
+        '''
+        return self._strong_lexical(question, self.bm25.search(question, LEXICAL_K)) is not None
+
+    def lexical(self, question, k=None):
+        return [doc for doc, _, _ in self.bm25.search(question, k or self.k)]
+
+    def vector(self, question, k=None):
+        return self.db.similarity_search(question, k=k or self.k)
+
+    @traced('retrieval')
+    def retrieve(self, question, mode='hybrid'):
+        '''
+        ### Trechos relevantes para a pergunta
+        - mode: 'hybrid' (padrão), 'lexical' ou 'vector'
+        '''
+        if mode == 'lexical':
+            return self.lexical(question)
+        if mode == 'vector':
+            return self.vector(question)
+
+        lexical = self.bm25.search(question, LEXICAL_K)
+        strong = self._strong_lexical(question, lexical)
+        if strong is not None:
+            self.stats['lexical_only'] += 1
+            return strong
+
+        try:
+            similar = self.db.similarity_search_with_relevance_scores(question, k=VECTOR_K)
+        except CircuitOpenError:
+            # embeddings fora do ar (circuit breaker aberto): segue só com o BM25
+            self.stats['degraded'] += 1
+            return [doc for doc, _, _ in lexical[:self.k]]
+
+        self.stats['hybrid'] += 1
+        fused = {}   # texto do trecho -> [doc, score]
+        top_lexical = lexical[0][1] if lexical else 0
+        for doc, score, _ in lexical:
+            fused[doc.page_content] = [doc, (1 - self.vector_weight) * score / top_lexical]
+        for doc, relevance in similar:
+            entry = fused.setdefault(doc.page_content, [doc, 0.0])
+            entry[1] += self.vector_weight * max(relevance, 0.0)
+
+        ranked = sorted(fused.values(), key=lambda item: item[1], reverse=True)
+        kept = [doc for doc, score in ranked[:self.k] if score >= self.min_score]
+        # nunca devolve contexto vazio se houver algum candidato
+        return kept or [doc for doc, _ in ranked[:1]]
@@ -15,6 +15,7 @@ from utils import (
     llm,
     get_session_history
 )
+from history_window import compact_history
 from pg_tools import TOOLS
 
 class FinancialAgent(RunnableWithMessageHistory):
@@ -27,7 +28,8 @@ class FinancialAgent(RunnableWithMessageHistory):
 
 
                 ### TAREFAS
-            
+                - Para registrar vários lançamentos de uma vez (ex.: extrato colado), use UMA chamada de `add_transactions_batch` em vez de várias de `add_transaction`.
+                - Para totais e resumos (ex.: gastos do mês por categoria), use UMA chamada de `summarize_transactions` com o `group_by` certo; nunca some linhas de `query_transactions`.
 
 
                 ### CONTEXTO
@@ -40,7 +42,7 @@ class FinancialAgent(RunnableWithMessageHistory):
 
 
                 ### REGRAS
-                - Use o {chat_history} para resolver referências ao contexto recente.
+                - Use o histórico da conversa (mensagens anteriores) para resolver referências ao contexto recente.
 
 
 
@@ -57,10 +59,6 @@ class FinancialAgent(RunnableWithMessageHistory):
                 - escrita        : {{"operacao":"adicionar|atualizar|deletar","id":123}}
                 - janela_tempo   : {{"de":"YYYY-MM-DD","ate":"YYYY-MM-DD","rotulo":'mês passado'}}
                 - indicadores    : {{chaves livres e numéricas úteis ao log}}
-
-
-                ### HISTÓRICO DA CONVERSA
-                {chat_history}
             """
         )
 
@@ -92,6 +90,7 @@ class FinancialAgent(RunnableWithMessageHistory):
 
         prompt = ChatPromptTemplate.from_messages([
             system_prompt,
+            MessagesPlaceholder("history_summary", optional=True),   # resumo dos turnos antigos, junto do system prompt
             fewshots,
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
@@ -101,7 +100,7 @@ class FinancialAgent(RunnableWithMessageHistory):
         agent = create_tool_calling_agent(llm, TOOLS, prompt)
         executor = AgentExecutor(agent=agent, tools=TOOLS, verbose=False)
 
-        return executor
+        return compact_history('financial', prompt) | executor
     
     def __init__(self):
         super().__init__(
@@ -109,4 +108,4 @@ class FinancialAgent(RunnableWithMessageHistory):
             get_session_history=get_session_history,
             input_messages_key="input",
             history_messages_key="chat_history"
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,505 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+CANNED_REPLY = os.getenv(
+    'GOVERNOR_CANNED_REPLY',
+    "Estou com instabilidade para responder agora. Tente novamente em alguns instantes."
+)
+MAX_IN_FLIGHT = int(os.getenv('GOVERNOR_MAX_IN_FLIGHT', '16'))          # chamadas simultâneas somando os 3 clientes
+BREAKER_FAILURES = int(os.getenv('GOVERNOR_BREAKER_FAILURES', '5'))     # falhas seguidas para abrir o circuito
+BREAKER_RESET = float(os.getenv('GOVERNOR_BREAKER_RESET', '30'))        # segundos aberto antes de testar de novo
+HEDGE_MIN_SAMPLES = 20                                                  # latências observadas antes de começar a fazer hedge
+
+
+def _policy(prefix, rate, burst, timeout, deadline, retries, hedge):
+    env = lambda key, default: os.getenv(f'{prefix}_{key}', default)
+    return {
+        'rate': float(env('RATE', rate)),            # chamadas por segundo (token bucket); 0 = sem limite
+        'burst': int(env('BURST', burst)),
+        'timeout': float(env('TIMEOUT', timeout)),   # segundos por tentativa
+        'deadline': float(env('DEADLINE', deadline)),  # segundos no total, somando retries
+        'retries': int(env('RETRIES', retries)),
+        'hedge': env('HEDGE', hedge) == '1',         # 2ª tentativa em paralelo depois do p95 de latência
+    }
+
+
+POLICIES = {
+    'llm': _policy('LLM', '2', '5', '30', '60', '2', '0'),
+    'llm_fast': _policy('LLM_FAST', '5', '10', '15', '30', '2', '1'),
+    'embeddings': _policy('EMBEDDINGS', '10', '20', '10', '20', '2', '1'),
+}
+
+# Erros que valem uma nova tentativa (cota, indisponibilidade, timeout), pelo nome para não depender do SDK
+RETRYABLE_ERRORS = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded',
+    'GatewayTimeout', 'BadGateway', 'ServerError', 'Aborted',
+}
+
+
+class GovernorTimeout(TimeoutError):
+    pass
+
+
+class GovernorSaturated(GovernorTimeout):
+    # a fila local (taxa/em voo) estourou o prazo: não é culpa do provedor, não conta para o circuito
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_retryable(error):
+    return (isinstance(error, (TimeoutError, ConnectionError))
+            or type(error).__name__ in RETRYABLE_ERRORS
+            or getattr(error, 'code', None) in (429, 500, 502, 503, 504))
+
+
+class TokenBucket():
+    '''
+    ### Limite de taxa: `rate` fichas por segundo, acumulando até `burst`
+    '''
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # 0 se pegou a ficha; senão, quanto esperar pela próxima
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def try_acquire(self):
+        return self._take() == 0.0
+
+    def acquire(self, deadline):
+        while True:
+            wait_for = self._take()
+            if not wait_for:
+                return
+            if time.monotonic() + wait_for > deadline:
+                raise GovernorSaturated("Limite de taxa: sem ficha antes do prazo.")
+            time.sleep(wait_for)
+
+    async def aacquire(self, deadline):
+        while True:
+            wait_for = self._take()
+            if not wait_for:
+                return
+            if time.monotonic() + wait_for > deadline:
+                raise GovernorSaturated("Limite de taxa: sem ficha antes do prazo.")
+            await asyncio.sleep(wait_for)
+
+
+class CircuitBreaker():
+    '''
+    ### Abre depois de `failures` falhas seguidas; fechado de novo quando uma chamada de teste (half-open) dá certo
+    - `allow()` devolve None (bloqueado), 'closed' ou 'probe'; quem recebeu 'probe' é a única chamada de teste
+    - Toda chamada liberada termina em `release(ticket)`, mesmo saindo por cancelamento ou erro local:
+      sem isso um teste interrompido deixaria o circuito meio aberto para sempre
+    '''
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return 'closed'
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True   # só uma chamada de teste por vez
+                return 'probe'
+            return None
+
+    def success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._consecutive = 0
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._probing = False
+            if self.state == 'half_open' or self._consecutive >= self.failures:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def release(self, ticket):
+        # a chamada de teste terminou sem veredito (cancelada, fila local cheia, erro 4xx): outra pode testar
+        if ticket == 'probe':
+            with self._lock:
+                self._probing = False
+
+
+class InFlightLimit():
+    '''
+    ### Limite de chamadas em voo, dividido entre threads e event loops
+    - Threads esperam numa Condition; corrotinas esperam um Future que o `release` acorda (sem polling)
+    '''
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._waiters = deque()   # (loop, future) das corrotinas esperando vaga
+
+    def _saturated(self):
+        return GovernorSaturated(f"Mais de {self.limit} chamadas em voo até o prazo.")
+
+    def acquire(self, deadline):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._saturated()
+                self._cond.wait(remaining)
+            self.in_flight += 1
+
+    async def aacquire(self, deadline):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await asyncio.wait_for(waiter, max(deadline - time.monotonic(), 0))
+            except BaseException as e:
+                with self._cond:
+                    try:
+                        self._waiters.remove((loop, waiter))
+                    except ValueError:
+                        self._wake_one()   # já tinha sido acordada: passa a vaga para o próximo
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._saturated() from None
+                raise
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._wake_one()
+
+    def _wake_one(self):
+        # chamado com o lock: acorda uma thread e uma corrotina; quem perder a vaga volta a esperar
+        self._cond.notify()
+        while self._waiters:
+            loop, waiter = self._waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+                return
+            except RuntimeError:
+                continue   # event loop já fechado
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class CallGovernor():
+    '''
+    ### Governa as chamadas ao provedor (llm, llm_fast, embeddings)
+    - Token bucket por modelo, limite global de chamadas em voo, prazo por tentativa e por chamada
+    - Retries com backoff exponencial e jitter (só para erros transitórios)
+    - Hedge opcional: se a tentativa passar do p95 recente, dispara uma segunda e fica com a primeira que voltar
+    - Circuit breaker por modelo: aberto, falha na hora (`fallback`, se houver, ou CircuitOpenError);
+      só erros transitórios do provedor contam como falha (4xx, validação e fila local cheia não)
+    '''
+
+    def __init__(self, policies=POLICIES, max_in_flight=MAX_IN_FLIGHT):
+        self.policies = policies
+        self.buckets = {name: TokenBucket(p['rate'], p['burst']) for name, p in policies.items()}
+        self.breakers = {name: CircuitBreaker() for name in policies}
+        self.latencies = {name: deque(maxlen=200) for name in policies}
+        self.stats = {name: Counter() for name in policies}
+        self.max_in_flight = max_in_flight
+        self._slots = InFlightLimit(max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight * 2, thread_name_prefix='governor')
+
+    def _hedge_delay(self, name):
+        samples = self.latencies[name]
+        if not self.policies[name]['hedge'] or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(8.0, 0.5 * 2 ** attempt))   # "full jitter"
+
+    def _counts_as_failure(self, error):
+        return is_retryable(error) and not isinstance(error, GovernorSaturated)
+
+    def _open(self, name, fallback):
+        self.stats[name]['short_circuited'] += 1
+        if fallback is not None:
+            return fallback()
+        raise CircuitOpenError(f"Circuito de {name} aberto: provedor instável.")
+
+    # ---------- chamadas síncronas ----------
+
+    def _release_when_done(self, futures):
+        # a vaga só volta quando todas as tentativas terminam: uma thread que perdeu (ou estourou o prazo)
+        # continua falando com o provedor e tem que contar no limite de chamadas em voo
+        pending = [future for future in futures if not future.cancel() and not future.done()]
+        if not pending:
+            self._slots.release()
+            return
+        left = [len(pending)]
+        lock = threading.Lock()
+
+        def finished(_):
+            with lock:
+                left[0] -= 1
+                last = left[0] == 0
+            if last:
+                self._slots.release()
+
+        for future in pending:
+            future.add_done_callback(finished)
+
+    def _attempt(self, name, fn, deadline):
+        policy = self.policies[name]
+        self.buckets[name].acquire(deadline)
+        self._slots.acquire(deadline)
+        submitted = []
+        try:
+            started = time.monotonic()
+            limit = min(deadline, started + policy['timeout'])
+            hedge_at = self._hedge_delay(name)
+            submitted.append(self._pool.submit(fn))
+            futures = list(submitted)
+            hedged = None
+            error = None
+            while futures:
+                remaining = limit - time.monotonic()
+                if remaining <= 0:
+                    raise GovernorTimeout(f"{name}: tentativa passou de {policy['timeout']}s.")
+                timeout = remaining
+                if hedge_at is not None and hedged is None:
+                    timeout = min(timeout, max(started + hedge_at - time.monotonic(), 0))
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    futures.remove(future)
+                    if future.exception() is None:
+                        self.latencies[name].append(time.monotonic() - started)
+                        if future is hedged:
+                            self.stats[name]['hedge_wins'] += 1
+                        return future.result()
+                    error = future.exception()
+                if not done and hedged is None and hedge_at is not None and self.buckets[name].try_acquire():
+                    hedged = self._pool.submit(fn)
+                    submitted.append(hedged)
+                    futures.append(hedged)
+                    self.stats[name]['hedges'] += 1
+                elif not done and hedged is None:
+                    hedge_at = None
+            raise error
+        finally:
+            self._release_when_done(submitted)
+
+    def call(self, name, fn, fallback=None):
+        '''
+        ### Executa `fn()` sob a política de `name`
+        '''
+        breaker = self.breakers[name]
+        ticket = breaker.allow()
+        if not ticket:
+            return self._open(name, fallback)
+        try:
+            policy = self.policies[name]
+            deadline = time.monotonic() + policy['deadline']
+            self.stats[name]['calls'] += 1
+            attempt = 0
+            while True:
+                try:
+                    result = self._attempt(name, fn, deadline)
+                except Exception as e:
+                    pause = self._backoff(attempt)
+                    if not is_retryable(e) or attempt >= policy['retries'] or time.monotonic() + pause >= deadline:
+                        self.stats[name]['failures'] += 1
+                        if self._counts_as_failure(e):
+                            breaker.failure()
+                        raise
+                    self.stats[name]['retries'] += 1
+                    attempt += 1
+                    time.sleep(pause)
+                    continue
+                breaker.success()
+                return result
+        finally:
+            breaker.release(ticket)
+
+    # ---------- chamadas assíncronas ----------
+
+    async def _aattempt(self, name, factory, deadline):
+        policy = self.policies[name]
+        await self.buckets[name].aacquire(deadline)
+        await self._slots.aacquire(deadline)
+        tasks = []
+        try:
+            started = time.monotonic()
+            limit = min(deadline, started + policy['timeout'])
+            hedge_at = self._hedge_delay(name)
+            tasks.append(asyncio.ensure_future(factory()))
+            hedged = None
+            error = None
+            while tasks:
+                remaining = limit - time.monotonic()
+                if remaining <= 0:
+                    raise GovernorTimeout(f"{name}: tentativa passou de {policy['timeout']}s.")
+                timeout = remaining
+                if hedge_at is not None and hedged is None:
+                    timeout = min(timeout, max(started + hedge_at - time.monotonic(), 0))
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        self.latencies[name].append(time.monotonic() - started)
+                        if task is hedged:
+                            self.stats[name]['hedge_wins'] += 1
+                        return task.result()
+                    error = task.exception()
+                if not done and hedged is None and hedge_at is not None and self.buckets[name].try_acquire():
+                    hedged = asyncio.ensure_future(factory())
+                    tasks.append(hedged)
+                    self.stats[name]['hedges'] += 1
+                elif not done and hedged is None:
+                    hedge_at = None
+            raise error
+        finally:
+            # a tentativa que perdeu (ou estourou o prazo) é cancelada; se ela roda numa thread
+            # (asyncio.to_thread, ex.: embeddings), só deixamos de esperar: a thread vai até o fim por conta própria
+            for task in tasks:
+                task.cancel()
+            self._slots.release()
+
+    async def acall(self, name, factory, fallback=None):
+        '''
+        ### Versão async de `call`: `factory()` cria a coroutine de cada tentativa
+        '''
+        breaker = self.breakers[name]
+        ticket = breaker.allow()
+        if not ticket:
+            return self._open(name, fallback)
+        try:
+            policy = self.policies[name]
+            deadline = time.monotonic() + policy['deadline']
+            self.stats[name]['calls'] += 1
+            attempt = 0
+            while True:
+                try:
+                    result = await self._aattempt(name, factory, deadline)
+                except Exception as e:
+                    pause = self._backoff(attempt)
+                    if not is_retryable(e) or attempt >= policy['retries'] or time.monotonic() + pause >= deadline:
+                        self.stats[name]['failures'] += 1
+                        if self._counts_as_failure(e):
+                            breaker.failure()
+                        raise
+                    self.stats[name]['retries'] += 1
+                    attempt += 1
+                    await asyncio.sleep(pause)
+                    continue
+                breaker.success()
+                return result
+        finally:
+            breaker.release(ticket)
+
+    # ---------- streaming (sem retry/hedge: os tokens já saíram) ----------
+
+    @contextmanager
+    def guard(self, name):
+        breaker = self.breakers[name]
+        ticket = breaker.allow()
+        if not ticket:
+            self._open(name, None)
+        try:
+            deadline = time.monotonic() + self.policies[name]['deadline']
+            self.buckets[name].acquire(deadline)
+            self._slots.acquire(deadline)
+            self.stats[name]['calls'] += 1
+            try:
+                yield
+            except Exception as e:
+                self.stats[name]['failures'] += 1
+                if self._counts_as_failure(e):
+                    breaker.failure()
+                raise
+            else:
+                breaker.success()
+            finally:
+                self._slots.release()
+        finally:
+            breaker.release(ticket)
+
+    @asynccontextmanager
+    async def aguard(self, name):
+        breaker = self.breakers[name]
+        ticket = breaker.allow()
+        if not ticket:
+            self._open(name, None)
+        try:
+            deadline = time.monotonic() + self.policies[name]['deadline']
+            await self.buckets[name].aacquire(deadline)
+            await self._slots.aacquire(deadline)
+            self.stats[name]['calls'] += 1
+            try:
+                yield
+            except Exception as e:
+                self.stats[name]['failures'] += 1
+                if self._counts_as_failure(e):
+                    breaker.failure()
+                raise
+            else:
+                breaker.success()
+            finally:
+                self._slots.release()
+        finally:
+            breaker.release(ticket)
+
+    def snapshot(self):
+        report = {}
+        for name in self.policies:
+            samples = sorted(self.latencies[name])
+            report[name] = dict(self.stats[name], circuit=self.breakers[name].state,
+                                p95_s=samples[int(0.95 * (len(samples) - 1))] if samples else None)
+        return report
+
+
+GOVERNOR = CallGovernor()
+
+
+def governor_stats():
+    '''
+    ### Chamadas, retries, hedges, falhas e estado do circuito por modelo
+    '''
+    return GOVERNOR.snapshot()
@@ -0,0 +1,160 @@
+import os
+import time
+import json
+import atexit
+import threading
+from collections import OrderedDict
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain.memory import ChatMessageHistory
+from langchain_core.messages import message_to_dict, messages_from_dict
+from psycopg2.extras import execute_values
+
+from db import get_conn
+
+HISTORY_BACKEND = os.getenv('HISTORY_BACKEND', 'memory')             # memory | postgres
+HISTORY_MAX_SESSIONS = int(os.getenv('HISTORY_MAX_SESSIONS', '1000'))
+HISTORY_IDLE_TTL = float(os.getenv('HISTORY_IDLE_TTL', '3600'))      # segundos sem uso até a sessão sair da memória
+HISTORY_LOAD_LAST = int(os.getenv('HISTORY_LOAD_LAST', '50'))        # mensagens carregadas do banco por sessão
+HISTORY_FLUSH_EVERY = int(os.getenv('HISTORY_FLUSH_EVERY', '2'))     # mensagens acumuladas antes de gravar (2 = um turno)
+
+
+class HistoryStore():
+    '''
+    ### Guarda os históricos das sessões em memória com limite
+    - LRU: passando de `max_sessions`, a sessão usada há mais tempo sai
+    - TTL de ociosidade: sessões sem uso há mais de `idle_ttl` segundos saem
+    - `factory(session_id)` cria o histórico; se ele tiver `flush()`, é chamado antes de sair da memória
+    '''
+
+    def __init__(self, factory=lambda session_id: ChatMessageHistory(), max_sessions=HISTORY_MAX_SESSIONS,
+                 idle_ttl=HISTORY_IDLE_TTL):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()   # session_id -> (histórico, último acesso)
+        self.stats = {'created': 0, 'evicted_lru': 0, 'evicted_idle': 0}
+
+    def get(self, session_id):
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            # o mais antigo fica na frente, então basta olhar o começo da fila
+            while self._sessions and self.idle_ttl:
+                history, last = next(iter(self._sessions.values()))
+                if now - last <= self.idle_ttl:
+                    break
+                self._sessions.popitem(last=False)
+                evicted.append(history)
+                self.stats['evicted_idle'] += 1
+
+            if session_id in self._sessions:
+                history = self._sessions.pop(session_id)[0]
+            else:
+                history = self.factory(session_id)
+                self.stats['created'] += 1
+            self._sessions[session_id] = (history, now)
+
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[1][0])
+                self.stats['evicted_lru'] += 1
+
+        for old in evicted:
+            _flush(old)
+        return history
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def flush(self):
+        with self._lock:
+            histories = [history for history, _ in self._sessions.values()]
+        for history in histories:
+            _flush(history)
+
+
+def _flush(history):
+    if hasattr(history, 'flush'):
+        history.flush()
+
+
+class PostgresChatMessageHistory(BaseChatMessageHistory):
+    '''
+    ### Histórico de uma sessão na tabela `chat_messages` (só INSERT, nunca UPDATE)
+    - Carrega as últimas `load_last` mensagens só na primeira leitura
+    - Grava em lote a cada `flush_every` mensagens (e no flush/encerramento do processo)
+    '''
+
+    def __init__(self, session_id, load_last=HISTORY_LOAD_LAST, flush_every=HISTORY_FLUSH_EVERY):
+        self.session_id = session_id
+        self.load_last = load_last
+        self.flush_every = flush_every
+        self._lock = threading.RLock()
+        self._messages = None   # carregadas sob demanda
+        self._pending = []
+
+    def _load(self):
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT message FROM chat_messages
+                WHERE session_id = %s
+                ORDER BY id DESC
+                LIMIT %s
+            """, (self.session_id, self.load_last))
+            rows = cur.fetchall()
+        return messages_from_dict([row[0] for row in reversed(rows)])
+
+    @property
+    def messages(self):
+        with self._lock:
+            if self._messages is None:
+                self._messages = self._load()
+            return list(self._messages)
+
+    def add_messages(self, messages):
+        with self._lock:
+            if self._messages is None:
+                self._messages = self._load()
+            self._messages.extend(messages)
+            # a memória guarda só a cauda; o resto continua no banco
+            if len(self._messages) > self.load_last:
+                del self._messages[:-self.load_last]
+            self._pending.extend(messages)
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [(self.session_id, json.dumps(message_to_dict(m), ensure_ascii=False)) for m in self._pending]
+            with get_conn() as conn, conn.cursor() as cur:
+                execute_values(cur, "INSERT INTO chat_messages (session_id, message) VALUES %s", rows,
+                               template="(%s, %s::jsonb)")
+                conn.commit()
+            self._pending = []
+
+    def clear(self):
+        with self._lock:
+            with get_conn() as conn, conn.cursor() as cur:
+                cur.execute("DELETE FROM chat_messages WHERE session_id = %s", (self.session_id,))
+                conn.commit()
+            self._messages = []
+            self._pending = []
+
+
+def make_history_store(backend=HISTORY_BACKEND):
+    '''
+    ### Cria o store de históricos conforme HISTORY_BACKEND (memory | postgres)
+    '''
+    if backend == 'postgres':
+        store = HistoryStore(factory=PostgresChatMessageHistory)
+        atexit.register(store.flush)
+        return store
+    if backend == 'memory':
+        return HistoryStore()
+    raise ValueError(f"HISTORY_BACKEND inválido: {backend} (use memory ou postgres)")
@@ -0,0 +1,190 @@
+import os
+import logging
+import hashlib
+import threading
+from collections import OrderedDict, deque
+
+from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from utils import llm_fast
+
+logger = logging.getLogger(__name__)
+
+HISTORY_KEEP_TURNS = int(os.getenv('HISTORY_KEEP_TURNS', '3'))   # turnos mais recentes mantidos na íntegra
+HISTORY_MIN_FOLD = int(os.getenv('HISTORY_MIN_FOLD', '4'))       # mensagens novas acumuladas antes de refazer o resumo
+
+# Orçamento de tokens do prompt inteiro por agente (system prompt + few-shots + resumo + histórico + entrada);
+# o histórico fica com o que sobrar depois da parte fixa. Schemas das tools não entram na conta
+PROMPT_BUDGETS = {
+    'router': int(os.getenv('PROMPT_BUDGET_ROUTER', '1800')),
+    'orchestrator': int(os.getenv('PROMPT_BUDGET_ORCHESTRATOR', '1200')),
+    'financial': int(os.getenv('PROMPT_BUDGET_FINANCIAL', '3000')),
+    'agenda': int(os.getenv('PROMPT_BUDGET_AGENDA', '3000')),
+}
+
+SUMMARY_PROMPT = (
+    "Atualize o resumo de uma conversa entre o usuário e o Assessor.AI. "
+    "Mantenha só fatos úteis para os próximos turnos (valores, datas, compromissos, preferências, pendências), "
+    "em no máximo 5 frases curtas, em português.\n\n"
+    "RESUMO ATUAL:\n{summary}\n\nNOVAS MENSAGENS:\n{messages}\n\nNOVO RESUMO:"
+)
+
+
+def estimate_tokens(messages):
+    '''
+    ### Estimativa barata de tokens (~4 caracteres por token + overhead por mensagem)
+    - Não chama a API de contagem; serve para orçamento e para comparar antes/depois
+    '''
+    return sum(len(str(m.content)) // 4 + 4 for m in messages)
+
+
+def _render(messages):
+    return '\n'.join(f"{m.type}: {m.content}" for m in messages)
+
+
+class HistoryCompactor():
+    '''
+    ### Compacta o chat_history de um agente para o prompt inteiro caber num orçamento de tokens
+    - Os últimos `keep_turns` turnos vão na íntegra; os anteriores viram um resumo (SystemMessage), que o
+      prompt coloca logo depois do system prompt (placeholder `history_summary`), não no meio dos turnos
+    - Com `prompt`, a parte fixa (system prompt, few-shots, entrada) é descontada do orçamento
+    - O resumo é incremental e fica em cache pelo hash das mensagens já resumidas, então só é
+      recalculado quando pelo menos `min_fold` mensagens novas saem da janela
+    '''
+
+    def __init__(self, name, budget=None, prompt=None, keep_turns=HISTORY_KEEP_TURNS, min_fold=HISTORY_MIN_FOLD,
+                 summarizer=llm_fast, cache_size=256):
+        self.name = name
+        self.budget = budget if budget is not None else PROMPT_BUDGETS.get(name, 2500)
+        self.prompt = prompt
+        self.keep_turns = keep_turns
+        self.min_fold = min_fold
+        self.summarizer = summarizer
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._summaries = OrderedDict()   # hash do prefixo resumido -> resumo
+        self.reports = deque(maxlen=200)  # um registro por turno
+
+    def _split(self, messages):
+        # começa a janela recente numa mensagem do usuário, pra não cortar um turno ao meio
+        start = len(messages)
+        turns = 0
+        for i in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[i], HumanMessage):
+                turns += 1
+                start = i
+                if turns == self.keep_turns:
+                    break
+        return messages[:start], messages[start:]
+
+    def _summary(self, older):
+        '''
+        ### Resumo de `older`, aproveitando o maior prefixo já resumido
+        - Retorna (resumo, mensagens ainda não resumidas que ficam na íntegra)
+        '''
+        hashes, h = [], hashlib.sha1()
+        for m in older:
+            h.update(f"{m.type}\x00{m.content}\x01".encode('utf-8'))
+            hashes.append(h.hexdigest())
+
+        with self._lock:
+            done, summary = 0, ''
+            for i in range(len(hashes) - 1, -1, -1):
+                if hashes[i] in self._summaries:
+                    done, summary = i + 1, self._summaries[hashes[i]]
+                    self._summaries.move_to_end(hashes[i])
+                    break
+
+        pending = older[done:]
+        if len(pending) < self.min_fold and (summary or not pending):
+            return summary, pending
+
+        summary = self.summarizer.invoke(
+            SUMMARY_PROMPT.format(summary=summary or '(vazio)', messages=_render(pending))
+        ).content.strip()
+        with self._lock:
+            self._summaries[hashes[-1]] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary, []
+
+    def fixed_tokens(self, inputs):
+        '''
+        ### Tokens do prompt sem o histórico: system prompt, few-shots e a entrada do turno
+        '''
+        if self.prompt is None:
+            return estimate_tokens([HumanMessage(content=str(inputs.get('input', '')))])
+        # placeholders que ainda não existem nesta etapa (ex.: agent_scratchpad) entram vazios
+        values = {name: [] for name in self.prompt.input_variables}
+        values.update(inputs, chat_history=[], history_summary=[])
+        try:
+            return estimate_tokens(self.prompt.format_messages(**values))
+        except (KeyError, ValueError, TypeError):
+            return estimate_tokens([HumanMessage(content=str(inputs.get('input', '')))])
+
+    def __call__(self, messages, fixed=0):
+        '''
+        ### Retorna (resumo, histórico): resumo é [SystemMessage] ou []; `fixed` = tokens do resto do prompt
+        '''
+        messages = list(messages or [])
+        before = estimate_tokens(messages)
+        limit = self.budget - fixed
+        head, compacted = [], messages
+        summarized = 0
+
+        if before > limit:
+            older, recent = self._split(messages)
+            summary, pending = self._summary(older) if older else ('', [])
+            summarized = len(older) - len(pending)
+            head = [SystemMessage(content=f"Resumo da conversa anterior: {summary}")] if summary else []
+            compacted = pending + recent
+            # se ainda estourar, corta as mensagens mais antigas da janela (sempre sobra o último turno)
+            while estimate_tokens(head + compacted) > limit and len(compacted) > 2:
+                del compacted[0]
+
+        after = estimate_tokens(head + compacted)
+        report = {'agent': self.name, 'messages': len(messages), 'history_tokens_before': before,
+                  'history_tokens_after': after, 'prompt_tokens_before': fixed + before,
+                  'prompt_tokens_after': fixed + after, 'summarized_messages': summarized}
+        self.reports.append(report)
+        logger.info("prompt %(agent)s: %(prompt_tokens_before)d -> %(prompt_tokens_after)d tokens "
+                    "(historico %(history_tokens_before)d -> %(history_tokens_after)d)", report)
+        return head, compacted
+
+    def stats(self):
+        reports = list(self.reports)
+        if not reports:
+            return {'agent': self.name, 'turns': 0}
+        before = sum(r['history_tokens_before'] for r in reports)
+        after = sum(r['history_tokens_after'] for r in reports)
+        prompt_after = sum(r['prompt_tokens_after'] for r in reports)
+        return {'agent': self.name, 'turns': len(reports), 'budget': self.budget,
+                'avg_tokens_before': before / len(reports), 'avg_tokens_after': after / len(reports),
+                'avg_prompt_tokens': prompt_after / len(reports),
+                'saved_ratio': 1 - after / before if before else 0.0}
+
+
+COMPACTORS = {}
+
+
+def compact_history(name, prompt=None, **kwargs):
+    '''
+    ### Runnable que troca o `chat_history` da entrada pela versão compactada e preenche `history_summary`
+    - Use antes do prompt/executor: `compact_history('financial', prompt) | executor`
+    - O prompt precisa de `MessagesPlaceholder("history_summary", optional=True)` logo depois do system prompt
+    '''
+    compactor = COMPACTORS[name] = HistoryCompactor(name, prompt=prompt, **kwargs)
+
+    def compact(inputs):
+        summary, history = compactor(inputs.get('chat_history'), compactor.fixed_tokens(inputs))
+        return {**inputs, 'chat_history': history, 'history_summary': summary}
+
+    return RunnableLambda(compact)
+
+
+def compaction_stats():
+    '''
+    ### Tokens médios do histórico antes/depois da compactação e do prompt inteiro, por agente
+    '''
+    return {name: compactor.stats() for name, compactor in COMPACTORS.items()}
@@ -0,0 +1,181 @@
+import re
+import csv
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+
+from utils import TZ
+from pg_tools import insert_transactions_batch
+
+# Nomes de coluna aceitos no CSV (comparados em minúsculas), cobrindo os cabeçalhos mais comuns dos bancos
+CSV_COLUMNS = {
+    "occurred_at": ["occurred_at", "data", "date", "data lançamento", "data lancamento"],
+    "amount": ["amount", "valor", "value", "valor (r$)"],
+    "description": ["description", "descricao", "descrição", "historico", "histórico", "lançamento", "lancamento"],
+    "type_name": ["type", "type_name", "tipo"],
+    "payment_method": ["payment_method", "forma de pagamento", "forma_pagamento", "pagamento"],
+    "category_id": ["category_id", "categoria_id"],
+}
+
+
+def parse_amount(raw: str) -> Decimal:
+    '''
+    ### Converte valores no formato brasileiro ou americano ("R$ 1.234,56", "-45.00") em Decimal
+    '''
+    value = raw.strip().replace("R$", "").replace(" ", "")
+    if "," in value and "." in value:
+        if value.rfind(",") > value.rfind("."):
+            value = value.replace(".", "").replace(",", ".")
+        else:
+            value = value.replace(",", "")
+    elif "," in value:
+        value = value.replace(",", ".")
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"Valor inválido: {raw.strip()}") from None
+
+
+def parse_date(raw: str) -> datetime:
+    raw = raw.strip()
+    for fmt in ("%d/%m/%Y %H:%M", "%d/%m/%Y", "%d/%m/%y"):
+        try:
+            return datetime.strptime(raw, fmt).replace(tzinfo=TZ)
+        except ValueError:
+            pass
+    try:
+        parsed = datetime.fromisoformat(raw)
+    except ValueError:
+        raise ValueError(f"Data inválida: {raw}") from None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=TZ)
+
+
+def _signed_row(amount: Decimal, row: dict) -> dict:
+    # Extrato vem com sinal: negativo é saída, positivo é entrada (se o arquivo não disser o tipo)
+    if not row.get("type_name"):
+        row["type_name"] = "EXPENSES" if amount < 0 else "INCOME"
+    row["amount"] = abs(amount)
+    return row
+
+
+def read_csv(path: Path, delimiter=None):
+    '''
+    ### Lê um CSV de extrato linha a linha (gerador)
+    - O delimitador é detectado sozinho (`;` é o padrão da maioria dos bancos brasileiros)
+    - Linha com data/valor ilegível sai como {"invalid": motivo, "line": n}: vai para o relatório e o resto continua
+    '''
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        if not delimiter:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=";,\t").delimiter
+        reader = csv.DictReader(f, delimiter=delimiter)
+        columns = {}
+        for field, aliases in CSV_COLUMNS.items():
+            for name in reader.fieldnames or []:
+                if name and name.strip().lower() in aliases:
+                    columns[field] = name
+                    break
+        missing = {"occurred_at", "amount"} - columns.keys()
+        if missing:
+            raise ValueError(f"Colunas obrigatórias ausentes no CSV: {', '.join(sorted(missing))}")
+
+        for line in reader:
+            if not (line.get(columns["amount"]) or "").strip():
+                continue
+            row = {field: (line.get(name) or "").strip() or None for field, name in columns.items()}
+            row["line"] = reader.line_num
+            try:
+                if not row["occurred_at"]:
+                    raise ValueError("Data ausente")
+                row["occurred_at"] = parse_date(row["occurred_at"])
+                amount = parse_amount(line[columns["amount"]])
+            except ValueError as e:
+                yield {"invalid": str(e), "line": reader.line_num}
+                continue
+            row["source_text"] = f"importado de {path.name}: {row.get('description') or ''}".strip()
+            yield _signed_row(amount, row)
+
+
+_OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|(?=</BANKTRANLIST>))", re.S | re.I)
+_OFX_FIELD = re.compile(r"<(\w+)>([^<\r\n]*)")
+_OFX_DATE = re.compile(r"(\d{8})(\d{6})?(?:\.\d+)?(?:\[([+-]?\d+(?:\.\d+)?)(?::\w+)?\])?")
+
+
+def parse_ofx_date(raw: str) -> datetime:
+    match = _OFX_DATE.match(raw.strip())
+    if not match:
+        raise ValueError(f"Data OFX inválida: {raw}")
+    day, clock, offset = match.groups()
+    parsed = datetime.strptime(day + (clock or "000000"), "%Y%m%d%H%M%S")
+    if offset is None:
+        return parsed.replace(tzinfo=TZ)
+    return parsed.replace(tzinfo=timezone(timedelta(hours=float(offset))))
+
+
+def read_ofx(path: Path):
+    '''
+    ### Lê as transações (<STMTTRN>) de um arquivo OFX 1.x (SGML) ou 2.x (XML)
+    - O FITID do banco vira o id externo, que é o que deduplica reimportações
+    - Transação com data/valor ilegível sai como {"invalid": motivo, "line": n} (linha do <STMTTRN> no arquivo)
+    '''
+    raw = path.read_bytes()
+    text = raw.decode("latin-1") if b"CHARSET:1252" in raw[:500] or b"ENCODING:USASCII" in raw[:500] else raw.decode("utf-8", "replace")
+    account = re.search(r"<ACCTID>([^<\r\n]+)", text)
+    account = account.group(1).strip() if account else ""
+
+    for match in _OFX_TRANSACTION.finditer(text):
+        fields = {tag.upper(): value.strip() for tag, value in _OFX_FIELD.findall(match.group(1))}
+        if "TRNAMT" not in fields or "DTPOSTED" not in fields:
+            continue
+        line_no = text.count("\n", 0, match.start()) + 1
+        try:
+            occurred = parse_ofx_date(fields["DTPOSTED"])
+            amount = parse_amount(fields["TRNAMT"])
+        except ValueError as e:
+            yield {"invalid": str(e), "line": line_no}
+            continue
+        description = fields.get("MEMO") or fields.get("NAME")
+        row = {
+            "line": line_no,
+            "occurred_at": occurred,
+            "description": description,
+            "source_text": f"importado de {path.name}: {description or ''}".strip(),
+            "external_id": f"ofx|{account}|{fields['FITID']}" if fields.get("FITID") else None,
+        }
+        if fields.get("TRNTYPE", "").upper() == "XFER":
+            row["type_name"] = "TRANSFER"
+        yield _signed_row(amount, row)
+
+
+def import_file(path, file_format=None, delimiter=None, chunk_size=1000) -> dict:
+    '''
+    ### Importa um extrato CSV ou OFX numa única transação do banco
+    - Retorna inseridas/ignoradas (já importadas), as linhas inválidas (puladas, com o número da linha) e a vazão
+    '''
+    path = Path(path)
+    file_format = (file_format or path.suffix.lstrip(".")).lower()
+    if file_format == "csv":
+        rows = read_csv(path, delimiter)
+    elif file_format in ("ofx", "qfx"):
+        rows = read_ofx(path)
+    else:
+        raise ValueError(f"Formato não suportado: {file_format} (use csv ou ofx)")
+    return insert_transactions_batch(rows, chunk_size=chunk_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa extratos bancários (CSV/OFX) para a tabela transactions")
+    parser.add_argument("files", nargs="+", help="Arquivos .csv ou .ofx")
+    parser.add_argument("--format", choices=["csv", "ofx"], help="Força o formato (padrão: pela extensão)")
+    parser.add_argument("--delimiter", help="Delimitador do CSV (padrão: detecta sozinho)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    for file in args.files:
+        result = import_file(file, args.format, args.delimiter, args.chunk_size)
+        print(f"{file}: {result['inserted']} inseridas, {result['skipped']} já existiam, "
+              f"{len(result['invalid'])} inválidas em {result['seconds']}s ({result['rows_per_second']} linhas/s)")
+        for problem in result["invalid"]:
+            print(f"  linha {problem['row']}: {problem['message']}")
@@ -0,0 +1,139 @@
+import sys
+import argparse
+
+from db import get_conn
+
+# Recalcula do zero, a partir de transactions, os mesmos números que os triggers mantêm
+_FRESH_DAILY = """
+    SELECT local_day(occurred_at) AS day, type, SUM(amount) AS total, COUNT(*) AS tx_count
+    FROM transactions
+    GROUP BY 1, 2
+"""
+
+_FRESH_TOTAL = "SELECT COALESCE(SUM(balance_signed(type, amount)), 0) FROM transactions"
+
+# Saldo total como o total_balance lê: somado de balance_daily
+STORED_TOTAL = "SELECT COALESCE(SUM(balance_signed(type, total)), 0) FROM balance_daily"
+
+# Rollups dos resumos (summarize_transactions): mesma chave das tabelas, sem categoria/forma de pagamento = 0/''
+_FRESH_SUMMARY_DAILY = """
+    SELECT local_day(occurred_at) AS day, type, COALESCE(category_id, 0) AS category_id,
+           COALESCE(payment_method, '') AS payment_method, SUM(amount) AS total, COUNT(*) AS tx_count
+    FROM transactions
+    GROUP BY 1, 2, 3, 4
+"""
+
+_FRESH_SUMMARY_MONTHLY = f"""
+    SELECT date_trunc('month', day)::date AS month, type, category_id, payment_method,
+           SUM(total) AS total, SUM(tx_count) AS tx_count
+    FROM ({_FRESH_SUMMARY_DAILY}) d
+    GROUP BY 1, 2, 3, 4
+"""
+
+
+def _summary_drift(cur, table, period, fresh):
+    # linhas do rollup `table` que divergem do recálculo
+    cur.execute(f"""
+        WITH fresh AS ({fresh})
+        SELECT COALESCE(f.{period}, s.{period}), COALESCE(f.type, s.type), COALESCE(f.category_id, s.category_id),
+               COALESCE(f.payment_method, s.payment_method), COALESCE(f.total, 0), COALESCE(s.total, 0),
+               COALESCE(f.tx_count, 0), COALESCE(s.tx_count, 0)
+        FROM fresh f
+        FULL OUTER JOIN {table} s
+            ON s.{period} = f.{period} AND s.type = f.type AND s.category_id = f.category_id
+           AND s.payment_method = f.payment_method
+        WHERE COALESCE(f.total, 0) <> COALESCE(s.total, 0)
+           OR COALESCE(f.tx_count, 0) <> COALESCE(s.tx_count, 0)
+        ORDER BY 1, 2, 3, 4;
+    """)
+    return [
+        {period: str(key), "type": type_id, "category_id": category_id, "payment_method": method,
+         "expected": expected, "stored": stored, "expected_count": expected_count, "stored_count": stored_count}
+        for key, type_id, category_id, method, expected, stored, expected_count, stored_count in cur.fetchall()
+    ]
+
+
+def verify():
+    '''
+    ### Compara os rollups com um recálculo completo
+    - Retorna {"ok": bool, "total": {...}, "daily": [dias/tipos divergentes], "summary": {"daily": [...], "monthly": [...]}}
+    - Roda num snapshot (REPEATABLE READ), então inserts concorrentes não geram falso alarme
+    '''
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cur.execute(f"""
+            WITH fresh AS ({_FRESH_DAILY})
+            SELECT COALESCE(f.day, b.day), COALESCE(f.type, b.type),
+                   COALESCE(f.total, 0), COALESCE(b.total, 0),
+                   COALESCE(f.tx_count, 0), COALESCE(b.tx_count, 0)
+            FROM fresh f
+            FULL OUTER JOIN balance_daily b ON b.day = f.day AND b.type = f.type
+            WHERE COALESCE(f.total, 0) <> COALESCE(b.total, 0)
+               OR COALESCE(f.tx_count, 0) <> COALESCE(b.tx_count, 0)
+            ORDER BY 1, 2;
+        """)
+        daily = [
+            {"day": str(day), "type": type_id, "expected": expected, "stored": stored,
+             "expected_count": expected_count, "stored_count": stored_count}
+            for day, type_id, expected, stored, expected_count, stored_count in cur.fetchall()
+        ]
+        cur.execute(f"SELECT ({_FRESH_TOTAL}), ({STORED_TOTAL});")
+        expected_total, stored_total = cur.fetchone()
+        summary = {"daily": _summary_drift(cur, "summary_daily", "day", _FRESH_SUMMARY_DAILY),
+                   "monthly": _summary_drift(cur, "summary_monthly", "month", _FRESH_SUMMARY_MONTHLY)}
+
+    return {
+        "ok": not daily and expected_total == stored_total and not summary["daily"] and not summary["monthly"],
+        "total": {"expected": expected_total, "stored": stored_total, "drift": (stored_total or 0) - expected_total},
+        "daily": daily,
+        "summary": summary,
+    }
+
+
+def rebuild():
+    '''
+    ### Recalcula todos os rollups do zero
+    - Trava escrita em transactions durante a carga para nenhum lançamento ficar de fora
+    '''
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("LOCK TABLE transactions IN SHARE ROW EXCLUSIVE MODE;")
+        cur.execute("DELETE FROM balance_daily;")
+        cur.execute(f"INSERT INTO balance_daily (day, type, total, tx_count) {_FRESH_DAILY};")
+        days = cur.rowcount
+        cur.execute("DELETE FROM summary_daily;")
+        cur.execute(f"INSERT INTO summary_daily (day, type, category_id, payment_method, total, tx_count) {_FRESH_SUMMARY_DAILY};")
+        summary_days = cur.rowcount
+        cur.execute("DELETE FROM summary_monthly;")
+        cur.execute("""
+            INSERT INTO summary_monthly (month, type, category_id, payment_method, total, tx_count)
+            SELECT date_trunc('month', day)::date, type, category_id, payment_method, SUM(total), SUM(tx_count)
+            FROM summary_daily
+            GROUP BY 1, 2, 3, 4;
+        """)
+        summary_months = cur.rowcount
+        conn.commit()
+    return {"daily_rows": days, "summary_daily_rows": summary_days, "summary_monthly_rows": summary_months}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica ou reconstrói os saldos agregados (rollups)")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        result = rebuild()
+        print(f"Rollups reconstruídos ({result['daily_rows']} linhas diárias; resumos: "
+              f"{result['summary_daily_rows']} diárias, {result['summary_monthly_rows']} mensais).")
+    else:
+        report = verify()
+        total = report["total"]
+        print(f"Saldo total: esperado {total['expected']}, gravado {total['stored']} (drift {total['drift']})")
+        for row in report["daily"]:
+            print(f"  {row['day']} tipo {row['type']}: esperado {row['expected']} ({row['expected_count']}), "
+                  f"gravado {row['stored']} ({row['stored_count']})")
+        for period in ("daily", "monthly"):
+            rows = report["summary"][period]
+            if rows:
+                print(f"Resumo {period}: {len(rows)} linha(s) divergente(s)")
+        print("OK" if report["ok"] else f"DRIFT em {len(report['daily'])} dia(s)/tipo(s)")
+        sys.exit(0 if report["ok"] else 1)
@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+LLM_CACHE = os.getenv('LLM_CACHE', '1') == '1'
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', '.llm_cache.sqlite')
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000'))
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', '604800'))   # segundos (7 dias)
+LLM_CACHE_EVICT_EVERY = 100                                   # gravações entre duas faxinas
+
+_bypass = contextvars.ContextVar('llm_cache_bypass', default=False)
+
+
+@contextmanager
+def llm_cache_bypass(active=True):
+    '''
+    ### Desliga o cache de respostas dentro do bloco (para trechos que não podem usar resposta guardada)
+    - Nem lê nem grava; vale para a task/thread atual e para o que ela chamar
+    '''
+    token = _bypass.set(bool(active) or _bypass.get())
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+class SQLiteLLMCache(BaseCache):
+    '''
+    ### Cache persistente de respostas de LLM em SQLite
+    - Chave: sha256 do `llm_string` (modelo + parâmetros + tools) e do prompt renderizado (lista de mensagens)
+    - Expira por TTL e, passando de `max_entries`, remove as menos usadas recentemente
+    - Hit não grava nada: o `used_at` dos hits fica em memória e vai para o banco junto da próxima gravação
+    '''
+
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_used_at ON llm_cache (used_at);")
+        self._conn.commit()
+        self._writes = 0
+        self._touched = {}   # key -> used_at dos hits ainda não gravados
+        self.stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'writes': 0, 'expired': 0, 'evicted': 0}
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        if _bypass.get():
+            with self._lock:
+                self.stats['bypassed'] += 1
+            return None
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats['expired'] += 1
+                row = None
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self._touched[key] = now
+            self.stats['hits'] += 1
+        return [loads(item) for item in json.loads(row[0])]
+
+    def update(self, prompt, llm_string, return_val):
+        if _bypass.get():
+            return
+        # resposta de contingência (circuito aberto no governor.py) nunca é guardada
+        if any(getattr(getattr(g, 'message', None), 'response_metadata', {}).get('degraded') for g in return_val):
+            return
+        key = self._key(prompt, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        with self._lock:
+            self._flush_touched()
+            self._conn.execute("INSERT OR REPLACE INTO llm_cache (key, value, created_at, used_at) VALUES (?, ?, ?, ?)",
+                               (key, value, now, now))
+            self.stats['writes'] += 1
+            self._writes += 1
+            if self._writes % LLM_CACHE_EVICT_EVERY == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany("UPDATE llm_cache SET used_at = ? WHERE key = ?",
+                                   [(used_at, key) for key, used_at in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self, now):
+        if self.ttl:
+            self.stats['expired'] += self._conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,)).rowcount
+        excess = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.stats['evicted'] += self._conn.execute("""
+                DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY used_at LIMIT ?)
+            """, (excess,)).rowcount
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self._touched.clear()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def llm_cache_for(temperature):
+    '''
+    ### Cache para um modelo: só com temperature=0 (resposta determinística); senão None (sem cache)
+    '''
+    global _cache
+    if not LLM_CACHE or temperature != 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SQLiteLLMCache()
+    return _cache
+
+
+def llm_cache_stats():
+    '''
+    ### Hits/misses/bypass e tamanho do cache de respostas (vazio se ele não foi criado)
+    '''
+    return _cache.snapshot() if _cache is not None else {}
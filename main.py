@@ -1,40 +1,376 @@
-from router import RouterAgent
-from orchestrator import OrchestratorAgent
-from financial import FinancialAgent
-from agenda import AgendaAgent
-from FAQ import FaqAgent
-
-router_chain = RouterAgent()
-orchestrator_chain = OrchestratorAgent()
-financial_chain = FinancialAgent()
-agenda_chain = AgendaAgent()
-faq_chain = FaqAgent().chain
+import time
+_started = time.perf_counter()
+
+from protocol import parse_protocol, route_message, keyword_route, likely_routes, ROUTER_CONFIDENCE
+from specialist_output import render_specialist_output
+from agents import AGENTS, warm, startup_profile
+from db import get_conn, run_db
+from tracing import TRACING, tracer, trace_turn, span, set_attrs
+
+from collections import Counter
+import asyncio
+import argparse
+import json
+import sys
+import os
+
+SPECULATIVE = os.getenv('SPECULATIVE', '0') == '1'                          # prefetch junto com o roteador (fluxo async)
+SPECULATIVE_FAQ_ANSWER = os.getenv('SPECULATIVE_FAQ_ANSWER', '1') == '1'    # com palpite faq, já gera a resposta inteira
+
+# Agentes construídos no primeiro uso (agents.py): a subida não paga PDF/FAISS nem especialistas que a sessão não usar
+router_chain = AGENTS['router']
+orchestrator_chain = AGENTS['orchestrator']
+financial_chain = AGENTS['financeiro']
+agenda_chain = AGENTS['agenda']
+faq_agent = AGENTS['faq']
+
+def _config(session_id):
+    config = {'configurable': {'session_id': session_id}}
+    if TRACING:
+        config['callbacks'] = [tracer]
+    return config
+
+speculation_metrics = {'turns': 0, 'skipped': 0, 'launched': Counter(), 'used': Counter(),
+                       'ready': Counter(), 'wasted': Counter(), 'failed': Counter()}
+
+def _aquecer_pool():
+    # retira e devolve uma conexão: cria o pool/conexão ou faz o health check antes do especialista precisar
+    with get_conn():
+        pass
+
+class Especulacao():
+    '''
+    ### Prefetches lançados junto com a chamada do roteador (SPECULATIVE=1)
+    - Palpite da rota pelas palavras-chave (`likely_routes`):
+      - faq: já gera a resposta do FAQ (sem efeitos colaterais); sem palpite: só busca os trechos do FAQ
+      - financeiro/agenda ou sem palpite: aquece uma conexão do pool
+    - Os especialistas financeiro/agenda não são adiantados: gravam histórico e podem chamar tools de escrita
+    - O que não for usado é cancelado em `encerrar()`
+    '''
+
+    def __init__(self, user_input):
+        self.user_input = user_input
+        self.tarefas = {}
+        rotas = likely_routes(user_input)
+        palpite = rotas[0] if rotas else None
+        if palpite == 'faq' and SPECULATIVE_FAQ_ANSWER:
+            self._lancar('faq_answer', _faq_resposta({'input': route_message('faq', user_input)}))
+        elif palpite in (None, 'faq'):
+            self._lancar('faq_context', _faq_contexto(user_input))
+        if palpite != 'faq':
+            self._lancar('db_pool', run_db(_aquecer_pool))
+
+    def _lancar(self, nome, coro):
+        tarefa = self.tarefas[nome] = asyncio.ensure_future(coro)
+        # erro de prefetch descartado não pode virar "Task exception was never retrieved"
+        tarefa.add_done_callback(lambda t: t.cancelled() or t.exception())
+        speculation_metrics['launched'][nome] += 1
+
+    def mesma_pergunta(self, resposta):
+        # o prefetch usou a mensagem crua; só vale se o roteador não reescreveu a pergunta nem pediu esclarecimento
+        return (resposta.get('PERGUNTA_ORIGINAL', '').strip() == ' '.join(self.user_input.split())
+                and not resposta.get('CLARIFY', '').strip())
+
+    async def pegar(self, nome):
+        '''
+        ### Resultado do prefetch `nome` (espera se ainda estiver rodando); None se não houver ou se falhou
+        '''
+        tarefa = self.tarefas.pop(nome, None)
+        if tarefa is None:
+            return None
+        if tarefa.done():
+            speculation_metrics['ready'][nome] += 1
+        try:
+            resultado = await tarefa
+        except Exception:
+            speculation_metrics['failed'][nome] += 1
+            return None
+        speculation_metrics['used'][nome] += 1
+        return resultado
+
+    def aproveitar(self, nome):
+        '''
+        ### Marca o prefetch `nome` como útil sem esperar por ele (ex.: aquecimento do pool, que só tem efeito colateral)
+        '''
+        tarefa = self.tarefas.pop(nome, None)
+        if tarefa is None:
+            return
+        if tarefa.done():
+            speculation_metrics['ready'][nome] += 1
+        speculation_metrics['used'][nome] += 1
+
+    def encerrar(self):
+        # tarefas em thread (busca do FAQ, banco) terminam sozinhas; o resultado só é descartado
+        for nome, tarefa in self.tarefas.items():
+            tarefa.cancel()
+            speculation_metrics['wasted'][nome] += 1
+        self.tarefas = {}
+
+async def _faq_resposta(entrada):
+    # não guarda no cache ainda: só quando a resposta especulada for de fato usada (_faq_especulado)
+    return await (await faq_agent.aget()).aanswer_deferred(entrada)
+
+async def _faq_contexto(user_input):
+    faq = await faq_agent.aget()
+    return await asyncio.to_thread(faq.get_faq_context, user_input)
+
+def speculation_stats():
+    '''
+    ### Quanto a especulação se pagou: por prefetch, lançados / usados (e prontos antes de precisar) / descartados
+    '''
+    m = speculation_metrics
+    stats = {'turns': m['turns'], 'skipped': m['skipped']}
+    for nome, lancados in m['launched'].items():
+        stats[nome] = {'launched': lancados, 'used': m['used'][nome], 'ready': m['ready'][nome],
+                       'wasted': m['wasted'][nome], 'failed': m['failed'][nome],
+                       'hit_rate': m['used'][nome] / lancados}
+    return stats
+
+async def _rotear(user_input, config):
+    '''
+    ### Chama o roteador; em modo especulativo, dispara os prefetches antes e em paralelo
+    - Retorna (saída do roteador, protocolo parseado, especulação ou None)
+    '''
+    especulacao = None
+    if SPECULATIVE:
+        speculation_metrics['turns'] += 1
+        rota, confianca = keyword_route(user_input)
+        if rota is not None and confianca >= ROUTER_CONFIDENCE:
+            speculation_metrics['skipped'] += 1   # o FastRouter decide localmente, não há o que esconder
+        else:
+            especulacao = Especulacao(user_input)
+    try:
+        with span('router'):
+            resposta_roteador = await (await router_chain.aget()).ainvoke({"input": user_input}, config=config)
+    except BaseException:
+        if especulacao:
+            especulacao.encerrar()
+        raise
+    resposta = parse_protocol(resposta_roteador)
+    set_attrs(route=resposta['ROUTE'] if resposta else 'direto', speculative=especulacao is not None)
+    return resposta_roteador, resposta, especulacao
+
+async def _faq_especulado(especulacao, resposta):
+    '''
+    ### (resposta pronta, trechos prontos) do prefetch do FAQ, se servirem para esta pergunta
+    '''
+    if especulacao is None or not especulacao.mesma_pergunta(resposta):
+        return None, None
+    pronta = await especulacao.pegar('faq_answer')
+    if pronta is not None:
+        pronta, guardar = pronta
+        guardar()
+    return pronta, await especulacao.pegar('faq_context')
+
+def orquestrar(saida_especialista, session_id) -> str:
+    '''
+    ### Entrega a resposta final a partir do JSON do especialista
+    - Renderiza localmente quando o JSON segue o contrato; só chama o OrchestratorAgent se não der
+    '''
+    texto = saida_especialista['output'] if isinstance(saida_especialista, dict) else saida_especialista
+    with span('orchestrator'):
+        renderizada = render_specialist_output(texto)
+        if renderizada is not None:
+            return renderizada
+        return orchestrator_chain.get().invoke(
+                {"input": f"ESPECIALISTA_JSON:\n{texto}"},
+                config=_config(session_id)
+            )
 
 def executar_fluxo_acessor(user_input, session_id) -> str:
-    global router_chain
-    resposta_roteador = router_chain.invoke(
-            {"input": user_input}, 
-            config={'configurable': {'session_id': session_id}}
-        )
-    if 'ROUTE=' in resposta_roteador:
-        resposta = dict([tuple(i.split('=')) for i in resposta_roteador.split('\n')])
-
-        if resposta['ROUTE'] == 'faq':
-            return faq_chain.invoke({'input': resposta_roteador})
-        elif resposta['ROUTE'] == 'financeiro':
-            return financial_chain.invoke({'input': resposta_roteador}, config={'configurable': {'session_id': session_id}})
-        elif resposta['ROUTE'] == 'agenda':
-            return agenda_chain.invoke({'input': resposta_roteador}, config={'configurable': {'session_id': session_id}}) 
+    with trace_turn(session_id, user_input):
+        with span('router'):
+            resposta_roteador = router_chain.get().invoke({"input": user_input}, config=_config(session_id))
+        resposta = parse_protocol(resposta_roteador)
+        set_attrs(route=resposta['ROUTE'] if resposta else 'direto')
+        if resposta:
+            if resposta['ROUTE'] == 'faq':
+                with span('faq'):
+                    return faq_agent.get().chain.invoke({'input': resposta_roteador}, config=_config(session_id))
+            especialista = {'financeiro': financial_chain, 'agenda': agenda_chain}.get(resposta['ROUTE'])
+            if especialista is not None:
+                with span('specialist', resposta['ROUTE']):
+                    saida = especialista.get().invoke({'input': resposta_roteador}, config=_config(session_id))
+                return orquestrar(saida, session_id)
+        else:
+            return resposta_roteador
+
+async def orquestrar_async(saida_especialista, session_id) -> str:
+    '''
+    ### Versão async de `orquestrar`
+    '''
+    texto = saida_especialista['output'] if isinstance(saida_especialista, dict) else saida_especialista
+    with span('orchestrator'):
+        renderizada = render_specialist_output(texto)
+        if renderizada is not None:
+            return renderizada
+        return await (await orchestrator_chain.aget()).ainvoke(
+                {"input": f"ESPECIALISTA_JSON:\n{texto}"},
+                config=_config(session_id)
+            )
+
+async def executar_fluxo_acessor_async(user_input, session_id) -> str:
+    '''
+    ### Mesmo fluxo de `executar_fluxo_acessor`, com `ainvoke` do roteador ao orquestrador
+    - Não bloqueia o event loop: várias sessões podem ser atendidas ao mesmo tempo (ver server.py)
+    '''
+    config = _config(session_id)
+    with trace_turn(session_id, user_input):
+        resposta_roteador, resposta, especulacao = await _rotear(user_input, config)
+        try:
+            if resposta:
+                if resposta['ROUTE'] == 'faq':
+                    with span('faq'):
+                        pronta, contexto = await _faq_especulado(especulacao, resposta)
+                        if pronta is not None:
+                            return pronta
+                        faq = await faq_agent.aget()
+                        return await faq.chain.ainvoke({'input': resposta_roteador, 'context': contexto}, config=config)
+                especialista = {'financeiro': financial_chain, 'agenda': agenda_chain}.get(resposta['ROUTE'])
+                if especialista is not None:
+                    if especulacao:
+                        especulacao.aproveitar('db_pool')
+                    with span('specialist', resposta['ROUTE']):
+                        saida = await (await especialista.aget()).ainvoke({'input': resposta_roteador}, config=config)
+                    return await orquestrar_async(saida, session_id)
+            else:
+                return resposta_roteador
+        finally:
+            if especulacao:
+                especulacao.encerrar()
+
+async def _especialista_stream(chain, entrada, config):
+    '''
+    ### Roda o especialista (AgentExecutor) emitindo eventos de tool; o último item é a saída final
+    '''
+    saida = None
+    async for evento in chain.astream_events(entrada, config=config, version='v2'):
+        tipo = evento['event']
+        if tipo == 'on_tool_start':
+            yield {'event': 'tool_start', 'tool': evento['name'], 'input': evento['data'].get('input')}
+        elif tipo == 'on_tool_end':
+            yield {'event': 'tool_end', 'tool': evento['name'], 'output': evento['data'].get('output')}
+        elif tipo == 'on_chain_end' and not evento['parent_ids']:
+            saida = evento['data'].get('output')
+    yield {'event': 'specialist_output', 'output': saida}
+
+async def orquestrar_stream(saida_especialista, session_id):
+    '''
+    ### Versão em streaming de `orquestrar`: devolve pedaços do texto final
+    - Renderização local sai de uma vez (linha a linha); o fallback do OrchestratorAgent sai token a token
+    '''
+    texto = saida_especialista['output'] if isinstance(saida_especialista, dict) else saida_especialista
+    renderizada = render_specialist_output(texto)
+    if renderizada is not None:
+        for linha in renderizada.splitlines(keepends=True):
+            yield linha
+        return
+    async for pedaco in (await orchestrator_chain.aget()).astream(
+            {"input": f"ESPECIALISTA_JSON:\n{texto}"},
+            config=_config(session_id)
+        ):
+        yield pedaco
+
+async def executar_fluxo_acessor_stream(user_input, session_id):
+    '''
+    ### Fluxo em streaming: gera eventos conforme ficam prontos
+    - `{'event': 'route', 'route': ...}` assim que o roteador decide
+    - `{'event': 'tool_start' | 'tool_end', 'tool': ...}` durante o AgentExecutor
+    - `{'event': 'token', 'text': ...}` com o texto final em pedaços
+    - `{'event': 'end', 'text': resposta completa}` no final
+    '''
+    config = _config(session_id)
+    with trace_turn(session_id, user_input):
+        resposta_roteador, resposta, especulacao = await _rotear(user_input, config)
+        try:
+            rota = resposta['ROUTE'] if resposta else None
+            yield {'event': 'route', 'route': rota or 'direto'}
+
+            if rota == 'faq':
+                pedacos = _faq_stream(especulacao, resposta, resposta_roteador, config)
+            elif rota in ('financeiro', 'agenda'):
+                if especulacao:
+                    especulacao.aproveitar('db_pool')
+                especialista = financial_chain if rota == 'financeiro' else agenda_chain
+                saida = None
+                with span('specialist', rota):
+                    chain = await especialista.aget()
+                    async for evento in _especialista_stream(chain, {'input': resposta_roteador}, config):
+                        if evento['event'] == 'specialist_output':
+                            saida = evento['output']
+                        else:
+                            yield evento
+                pedacos = orquestrar_stream(saida, session_id)
+            else:
+                pedacos = _um_pedaco('' if resposta else resposta_roteador)
+
+            texto = []
+            # no FAQ a resposta inteira (prefetch, busca e geração) roda enquanto os pedaços saem: span 'faq',
+            # como nos fluxos sync/async
+            with span('faq' if rota == 'faq' else 'answer'):
+                async for pedaco in pedacos:
+                    texto.append(pedaco)
+                    yield {'event': 'token', 'text': pedaco}
+            yield {'event': 'end', 'text': ''.join(texto)}
+        finally:
+            if especulacao:
+                especulacao.encerrar()
+
+async def _faq_stream(especulacao, resposta, resposta_roteador, config):
+    pronta, contexto = await _faq_especulado(especulacao, resposta)
+    if pronta is not None:
+        yield pronta
+        return
+    faq = await faq_agent.aget()
+    async for pedaco in faq.astream_answer({'input': resposta_roteador, 'context': contexto}, config):
+        yield pedaco
+
+async def _um_pedaco(texto):
+    if texto:
+        yield texto
+
+def _profile_startup(agents='all', as_json=False):
+    '''
+    ### Perfil de subida: constrói os agentes pedidos e mostra o tempo de import e de construção de cada um
+    - roda aqui (e não em `python agents.py`) para medir o mesmo registro `AGENTS` que o terminal usa
+    '''
+    names = list(AGENTS) if agents == 'all' else [n.strip() for n in agents.split(',') if n.strip()]
+    for name in names:
+        AGENTS[name].get()
+    profile = startup_profile()
+    profile['total_ms'] = round((time.perf_counter() - _started) * 1000, 1)
+
+    if as_json:
+        print(json.dumps(profile, indent=2))
     else:
-        return resposta_roteador
+        for kind in ('import_ms', 'build_ms'):
+            for name, ms in profile[kind].items():
+                print(f"{kind[:-3]:6} {name:14} {ms:>10.1f} ms")
+        print(f"{'total':21} {profile['total_ms']:>10.1f} ms")
 
-while True:
-    user_input = input("> ")
-    if user_input.lower in ('sair', 'end', 'fim', 'tchau', 'bye'):
-        print('Encerrando a conversa.')
-        break
-    try:
-        resposta = executar_fluxo_acessor(user_input, 'PRECISA_MAS_NAO_IMPORTA')
-        print(resposta)
-    except Exception as e:
-        print('Erro ao consumir a API: ', e)
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Assistente financeiro no terminal")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Mostra o tempo de import e de construção de cada agente e sai")
+    parser.add_argument('--agents', default='all', help="Com --profile-startup: 'all' ou lista por vírgula: " + ', '.join(AGENTS))
+    parser.add_argument('--json', action='store_true', help="Com --profile-startup: imprime o perfil em JSON")
+    args = parser.parse_args()
+    if args.profile_startup:
+        _profile_startup(args.agents, args.json)
+        sys.exit(0)
+
+    warm()
+    if os.getenv('STARTUP_PROFILE', '0') == '1':
+        print(f"[startup] main pronto em {(time.perf_counter() - _started) * 1000:.0f} ms", file=sys.stderr)
+    while True:
+        user_input = input("> ")
+        if user_input.lower() in ('sair', 'end', 'fim', 'tchau', 'bye'):
+            print('Encerrando a conversa.')
+            break
+        try:
+            resposta = executar_fluxo_acessor(user_input, 'PRECISA_MAS_NAO_IMPORTA')
+            print(resposta)
+        except Exception as e:
+            print('Erro ao consumir a API: ', e)
+    if os.getenv('STARTUP_PROFILE', '0') == '1':
+        print(json.dumps(startup_profile(), indent=2), file=sys.stderr)
@@ -0,0 +1,460 @@
+import argparse
+
+from zoneinfo import ZoneInfo
+
+from db import get_conn, LOCAL_TIMEZONE
+
+ZoneInfo(LOCAL_TIMEZONE)   # falha aqui, e não no meio de uma migração, se o fuso configurado não existir
+_TZ_SQL = LOCAL_TIMEZONE.replace("'", "''")
+
+# Lista ordenada de migrações: (versão, transacional?, [comandos SQL])
+# As não transacionais rodam em autocommit, o que permite CREATE INDEX CONCURRENTLY
+# sem travar escrita na tabela de transações em produção.
+MIGRATIONS = [
+    ("0001_base_schema", True, [
+        """
+        CREATE TABLE IF NOT EXISTS transaction_types (
+            id   SERIAL PRIMARY KEY,
+            type TEXT NOT NULL UNIQUE
+        );
+        """,
+        """
+        INSERT INTO transaction_types (id, type)
+        VALUES (1, 'INCOME'), (2, 'EXPENSES'), (3, 'TRANSFER')
+        ON CONFLICT DO NOTHING;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS categories (
+            id   SERIAL PRIMARY KEY,
+            name TEXT NOT NULL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id             SERIAL PRIMARY KEY,
+            amount         NUMERIC(14, 2) NOT NULL,
+            type           INTEGER NOT NULL REFERENCES transaction_types (id),
+            category_id    INTEGER REFERENCES categories (id),
+            description    TEXT,
+            payment_method TEXT,
+            occurred_at    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            source_text    TEXT
+        );
+        """,
+    ]),
+    ("0002_transactions_time_indexes", False, [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_occurred_at ON transactions (occurred_at);",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_type_occurred_at ON transactions (type, occurred_at);",
+        "ANALYZE transactions;",
+    ]),
+    # Saldos mantidos por trigger: total geral (1 linha) e total por dia local/tipo.
+    # total_balance e daily_balance viram buscas por chave em vez de SUM na tabela toda.
+    ("0003_balance_rollups", True, [
+        """
+        CREATE TABLE IF NOT EXISTS balance_totals (
+            id         SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            balance    NUMERIC(16, 2) NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """,
+        "INSERT INTO balance_totals (id) VALUES (1) ON CONFLICT DO NOTHING;",
+        """
+        CREATE TABLE IF NOT EXISTS balance_daily (
+            day      DATE NOT NULL,
+            type     INTEGER NOT NULL,
+            total    NUMERIC(16, 2) NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, type)
+        );
+        """,
+        """
+        CREATE OR REPLACE FUNCTION balance_signed(t_type INTEGER, t_amount NUMERIC) RETURNS NUMERIC AS $$
+            SELECT CASE WHEN t_type = 1 THEN t_amount WHEN t_type = 2 THEN -t_amount ELSE 0 END;
+        $$ LANGUAGE SQL IMMUTABLE;
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION balance_apply(t_occurred TIMESTAMPTZ, t_type INTEGER, t_amount NUMERIC, t_sign INTEGER)
+        RETURNS VOID AS $$
+        BEGIN
+            INSERT INTO balance_daily (day, type, total, tx_count)
+            VALUES ((t_occurred AT TIME ZONE '{_TZ_SQL}')::date, t_type, t_sign * t_amount, t_sign)
+            ON CONFLICT (day, type) DO UPDATE
+                SET total = balance_daily.total + EXCLUDED.total,
+                    tx_count = balance_daily.tx_count + EXCLUDED.tx_count;
+            UPDATE balance_totals
+                SET balance = balance + t_sign * balance_signed(t_type, t_amount), updated_at = NOW()
+                WHERE id = 1;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION transactions_rollup_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM balance_apply(OLD.occurred_at, OLD.type, OLD.amount, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM balance_apply(NEW.occurred_at, NEW.type, NEW.amount, 1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION transactions_rollup_truncate() RETURNS TRIGGER AS $$
+        BEGIN
+            DELETE FROM balance_daily;
+            UPDATE balance_totals SET balance = 0, updated_at = NOW() WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS trg_transactions_rollup ON transactions;",
+        """
+        CREATE TRIGGER trg_transactions_rollup
+            AFTER INSERT OR UPDATE OF amount, type, occurred_at OR DELETE ON transactions
+            FOR EACH ROW EXECUTE FUNCTION transactions_rollup_trigger();
+        """,
+        "DROP TRIGGER IF EXISTS trg_transactions_rollup_truncate ON transactions;",
+        """
+        CREATE TRIGGER trg_transactions_rollup_truncate
+            AFTER TRUNCATE ON transactions
+            FOR EACH STATEMENT EXECUTE FUNCTION transactions_rollup_truncate();
+        """,
+        # Carga inicial com a tabela travada para escrita, assim nenhum insert escapa entre a carga e o trigger
+        "LOCK TABLE transactions IN SHARE ROW EXCLUSIVE MODE;",
+        "DELETE FROM balance_daily;",
+        f"""
+        INSERT INTO balance_daily (day, type, total, tx_count)
+        SELECT (occurred_at AT TIME ZONE '{_TZ_SQL}')::date, type, SUM(amount), COUNT(*)
+        FROM transactions
+        GROUP BY 1, 2;
+        """,
+        """
+        UPDATE balance_totals
+            SET balance = (SELECT COALESCE(SUM(balance_signed(type, amount)), 0) FROM transactions),
+                updated_at = NOW()
+            WHERE id = 1;
+        """,
+    ]),
+    # Hash de conteúdo para importação em lote idempotente (NULL para lançamentos feitos um a um)
+    ("0004_transactions_content_hash", False, [
+        "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS content_hash TEXT;",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_transactions_content_hash ON transactions (content_hash);",
+    ]),
+    # Histórico das conversas (HISTORY_BACKEND=postgres): só INSERT, lido pelas últimas N mensagens da sessão
+    ("0005_chat_messages", True, [
+        """
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id         BIGSERIAL PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            message    JSONB NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages (session_id, id);",
+    ]),
+    # Agenda: cada evento guarda o intervalo da 1ª ocorrência (during) e, se recorrente, a regra (freq/intervalo/até).
+    # `span` cobre a série inteira (até recur_until ou sem fim) e é o que o índice GiST consulta:
+    # uma busca por janela (&&) acha eventos simples e séries ativas; as ocorrências são expandidas só dentro dela.
+    # Sem exclusion constraint de propósito: sobreposição é permitida e reportada (find_conflicts).
+    ("0006_events", True, [
+        """
+        CREATE TABLE IF NOT EXISTS events (
+            id             SERIAL PRIMARY KEY,
+            title          TEXT NOT NULL,
+            during         TSTZRANGE NOT NULL CHECK (NOT isempty(during) AND NOT upper_inf(during)),
+            location       TEXT,
+            participants   TEXT[],
+            freq           TEXT CHECK (freq IN ('DAILY', 'WEEKLY', 'MONTHLY')),
+            recur_interval INTEGER NOT NULL DEFAULT 1 CHECK (recur_interval > 0),
+            recur_until    TIMESTAMPTZ,
+            exdates        TIMESTAMPTZ[] NOT NULL DEFAULT '{}',
+            status         TEXT NOT NULL DEFAULT 'confirmed' CHECK (status IN ('confirmed', 'cancelled')),
+            source_text    TEXT,
+            created_at     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            span           TSTZRANGE GENERATED ALWAYS AS (
+                CASE WHEN freq IS NULL THEN during ELSE tstzrange(lower(during), recur_until, '[)') END
+            ) STORED
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_events_span ON events USING GIST (span) WHERE status = 'confirmed';",
+    ]),
+    # Rollups para resumos (summarize_transactions): totais por dia local e por mês, quebrados por tipo,
+    # categoria e forma de pagamento. Meses inteiros saem de summary_monthly (tamanho fixo por mês);
+    # só as pontas da janela e agrupamentos por dia/semana leem summary_daily.
+    # Sem categoria / forma de pagamento vira 0 / '' para caber na chave primária.
+    ("0007_summary_rollups", True, [
+        """
+        CREATE TABLE IF NOT EXISTS summary_daily (
+            day            DATE NOT NULL,
+            type           INTEGER NOT NULL,
+            category_id    INTEGER NOT NULL,
+            payment_method TEXT NOT NULL,
+            total          NUMERIC(16, 2) NOT NULL DEFAULT 0,
+            tx_count       INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, type, category_id, payment_method)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS summary_monthly (
+            month          DATE NOT NULL,
+            type           INTEGER NOT NULL,
+            category_id    INTEGER NOT NULL,
+            payment_method TEXT NOT NULL,
+            total          NUMERIC(16, 2) NOT NULL DEFAULT 0,
+            tx_count       INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, type, category_id, payment_method)
+        );
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION summary_apply(t_occurred TIMESTAMPTZ, t_type INTEGER, t_category INTEGER,
+                                                 t_method TEXT, t_amount NUMERIC, t_sign INTEGER)
+        RETURNS VOID AS $$
+        DECLARE
+            t_day DATE := (t_occurred AT TIME ZONE '{_TZ_SQL}')::date;
+        BEGIN
+            INSERT INTO summary_daily (day, type, category_id, payment_method, total, tx_count)
+            VALUES (t_day, t_type, COALESCE(t_category, 0), COALESCE(t_method, ''), t_sign * t_amount, t_sign)
+            ON CONFLICT (day, type, category_id, payment_method) DO UPDATE
+                SET total = summary_daily.total + EXCLUDED.total,
+                    tx_count = summary_daily.tx_count + EXCLUDED.tx_count;
+            INSERT INTO summary_monthly (month, type, category_id, payment_method, total, tx_count)
+            VALUES (date_trunc('month', t_day)::date, t_type, COALESCE(t_category, 0), COALESCE(t_method, ''),
+                    t_sign * t_amount, t_sign)
+            ON CONFLICT (month, type, category_id, payment_method) DO UPDATE
+                SET total = summary_monthly.total + EXCLUDED.total,
+                    tx_count = summary_monthly.tx_count + EXCLUDED.tx_count;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION transactions_summary_trigger() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM summary_apply(OLD.occurred_at, OLD.type, OLD.category_id, OLD.payment_method, OLD.amount, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM summary_apply(NEW.occurred_at, NEW.type, NEW.category_id, NEW.payment_method, NEW.amount, 1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION transactions_rollup_truncate() RETURNS TRIGGER AS $$
+        BEGIN
+            DELETE FROM balance_daily;
+            DELETE FROM summary_daily;
+            DELETE FROM summary_monthly;
+            UPDATE balance_totals SET balance = 0, updated_at = NOW() WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS trg_transactions_summary ON transactions;",
+        """
+        CREATE TRIGGER trg_transactions_summary
+            AFTER INSERT OR UPDATE OF amount, type, occurred_at, category_id, payment_method OR DELETE ON transactions
+            FOR EACH ROW EXECUTE FUNCTION transactions_summary_trigger();
+        """,
+        "LOCK TABLE transactions IN SHARE ROW EXCLUSIVE MODE;",
+        "DELETE FROM summary_daily;",
+        "DELETE FROM summary_monthly;",
+        f"""
+        INSERT INTO summary_daily (day, type, category_id, payment_method, total, tx_count)
+        SELECT (occurred_at AT TIME ZONE '{_TZ_SQL}')::date, type, COALESCE(category_id, 0),
+               COALESCE(payment_method, ''), SUM(amount), COUNT(*)
+        FROM transactions
+        GROUP BY 1, 2, 3, 4;
+        """,
+        """
+        INSERT INTO summary_monthly (month, type, category_id, payment_method, total, tx_count)
+        SELECT date_trunc('month', day)::date, type, category_id, payment_method, SUM(total), SUM(tx_count)
+        FROM summary_daily
+        GROUP BY 1, 2, 3, 4;
+        """,
+    ]),
+    # Paginação por keyset em query_transactions: ORDER BY occurred_at DESC, id DESC + (occurred_at, id) < cursor.
+    # O índice novo também atende os filtros só por data, então o antigo (só occurred_at) sai.
+    ("0008_transactions_keyset_index", False, [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_occurred_at_id ON transactions (occurred_at, id);",
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_transactions_occurred_at;",
+    ]),
+    # Busca por texto em query_transactions: full-text em português sem acentos (description peso A, source_text B)
+    # num tsvector gerado com índice GIN, e trigramas na description (nomes de estabelecimento, LIKE '%x%' e
+    # busca aproximada). unaccent() não é IMMUTABLE, então índices e a coluna gerada usam o wrapper f_unaccent.
+    # ADD COLUMN ... STORED reescreve a tabela (trava escrita enquanto roda): em base grande, rodar fora do pico.
+    ("0009_transactions_text_search", False, [
+        "CREATE EXTENSION IF NOT EXISTS unaccent;",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+        """
+        CREATE OR REPLACE FUNCTION f_unaccent(TEXT) RETURNS TEXT AS $$
+            SELECT public.unaccent('public.unaccent'::regdictionary, $1);
+        $$ LANGUAGE SQL IMMUTABLE PARALLEL SAFE STRICT;
+        """,
+        """
+        ALTER TABLE transactions ADD COLUMN IF NOT EXISTS search_tsv TSVECTOR GENERATED ALWAYS AS (
+            setweight(to_tsvector('portuguese', f_unaccent(COALESCE(description, ''))), 'A') ||
+            setweight(to_tsvector('portuguese', f_unaccent(COALESCE(source_text, ''))), 'B')
+        ) STORED;
+        """,
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_search_tsv ON transactions USING GIN (search_tsv);",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_description_trgm
+            ON transactions USING GIN (f_unaccent(lower(description)) gin_trgm_ops);
+        """,
+        "ANALYZE transactions;",
+    ]),
+    # Saldo total derivado de balance_daily (SUM de poucas linhas por dia) em vez da linha única balance_totals:
+    # todo insert/update/delete atualizava a mesma linha e os escritores concorrentes ficavam em fila nela.
+    # local_day() centraliza o fuso (LOCAL_TIMEZONE, o mesmo do utils.TZ) para triggers e recálculos.
+    # Trocar LOCAL_TIMEZONE depois exige recriar local_day e rodar `python ledger.py rebuild`.
+    ("0010_balance_total_from_daily", True, [
+        f"""
+        CREATE OR REPLACE FUNCTION local_day(t_ts TIMESTAMPTZ) RETURNS DATE AS $$
+            SELECT (t_ts AT TIME ZONE '{_TZ_SQL}')::date;
+        $$ LANGUAGE SQL IMMUTABLE PARALLEL SAFE STRICT;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION balance_apply(t_occurred TIMESTAMPTZ, t_type INTEGER, t_amount NUMERIC, t_sign INTEGER)
+        RETURNS VOID AS $$
+        BEGIN
+            INSERT INTO balance_daily (day, type, total, tx_count)
+            VALUES (local_day(t_occurred), t_type, t_sign * t_amount, t_sign)
+            ON CONFLICT (day, type) DO UPDATE
+                SET total = balance_daily.total + EXCLUDED.total,
+                    tx_count = balance_daily.tx_count + EXCLUDED.tx_count;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION summary_apply(t_occurred TIMESTAMPTZ, t_type INTEGER, t_category INTEGER,
+                                                 t_method TEXT, t_amount NUMERIC, t_sign INTEGER)
+        RETURNS VOID AS $$
+        DECLARE
+            t_day DATE := local_day(t_occurred);
+        BEGIN
+            INSERT INTO summary_daily (day, type, category_id, payment_method, total, tx_count)
+            VALUES (t_day, t_type, COALESCE(t_category, 0), COALESCE(t_method, ''), t_sign * t_amount, t_sign)
+            ON CONFLICT (day, type, category_id, payment_method) DO UPDATE
+                SET total = summary_daily.total + EXCLUDED.total,
+                    tx_count = summary_daily.tx_count + EXCLUDED.tx_count;
+            INSERT INTO summary_monthly (month, type, category_id, payment_method, total, tx_count)
+            VALUES (date_trunc('month', t_day)::date, t_type, COALESCE(t_category, 0), COALESCE(t_method, ''),
+                    t_sign * t_amount, t_sign)
+            ON CONFLICT (month, type, category_id, payment_method) DO UPDATE
+                SET total = summary_monthly.total + EXCLUDED.total,
+                    tx_count = summary_monthly.tx_count + EXCLUDED.tx_count;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION transactions_rollup_truncate() RETURNS TRIGGER AS $$
+        BEGIN
+            DELETE FROM balance_daily;
+            DELETE FROM summary_daily;
+            DELETE FROM summary_monthly;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TABLE IF EXISTS balance_totals;",
+    ]),
+    # span das séries terminava em recur_until, mas a última ocorrência começa antes dele e vai até
+    # recur_until + duração: esse trecho final ficava fora do índice GiST e sumia das buscas de conflito/agenda.
+    # O CHECK (NOT VALID: não revalida linhas antigas) barra recur_until antes do início, que quebraria o tstzrange.
+    ("0011_events_span_duration", True, [
+        "ALTER TABLE events DROP COLUMN IF EXISTS span;",
+        """
+        ALTER TABLE events ADD COLUMN span TSTZRANGE GENERATED ALWAYS AS (
+            CASE WHEN freq IS NULL THEN during
+                 ELSE tstzrange(lower(during), recur_until + (upper(during) - lower(during)), '[)') END
+        ) STORED;
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_events_span ON events USING GIST (span) WHERE status = 'confirmed';",
+        """
+        ALTER TABLE events ADD CONSTRAINT events_recur_until_after_start
+            CHECK (recur_until IS NULL OR recur_until > lower(during)) NOT VALID;
+        """,
+    ]),
+]
+
+# Chave qualquer, só para dois processos não migrarem ao mesmo tempo
+_LOCK_KEY = 7301
+
+
+def _applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version    TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """)
+    cur.execute("SELECT version FROM schema_migrations;")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(verbose=True):
+    '''
+    ### Aplica as migrações pendentes, na ordem
+    - Retorna a lista de versões aplicadas nesta execução
+    '''
+    applied_now = []
+    with get_conn() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(%s);", (_LOCK_KEY,))
+                try:
+                    done = _applied_versions(cur)
+                    for version, transactional, statements in MIGRATIONS:
+                        if version in done:
+                            continue
+                        if verbose:
+                            print(f"Aplicando {version}...")
+                        if transactional:
+                            cur.execute("BEGIN;")
+                            try:
+                                for sql in statements:
+                                    cur.execute(sql)
+                                cur.execute("INSERT INTO schema_migrations (version) VALUES (%s);", (version,))
+                                cur.execute("COMMIT;")
+                            except Exception:
+                                cur.execute("ROLLBACK;")
+                                raise
+                        else:
+                            # comandos idempotentes (IF NOT EXISTS), então dá pra rodar de novo se cair no meio
+                            for sql in statements:
+                                cur.execute(sql)
+                            cur.execute("INSERT INTO schema_migrations (version) VALUES (%s);", (version,))
+                        applied_now.append(version)
+                finally:
+                    cur.execute("SELECT pg_advisory_unlock(%s);", (_LOCK_KEY,))
+        finally:
+            conn.autocommit = False
+    return applied_now
+
+
+def status():
+    '''
+    ### Retorna [(versão, aplicada?)] para todas as migrações conhecidas
+    '''
+    with get_conn() as conn, conn.cursor() as cur:
+        done = _applied_versions(cur)
+        conn.commit()
+    return [(version, version in done) for version, _, _ in MIGRATIONS]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrações do banco do Assessor.AI")
+    parser.add_argument("--status", action="store_true", help="Só mostra quais migrações já foram aplicadas")
+    args = parser.parse_args()
+
+    if args.status:
+        for version, done in status():
+            print(f"[{'x' if done else ' '}] {version}")
+    else:
+        applied = migrate()
+        print(f"{len(applied)} migração(ões) aplicada(s).")
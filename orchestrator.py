@@ -14,6 +14,9 @@ from utils import (
     llm_fast,
     get_session_history
 )
+from history_window import compact_history
+
+from specialist_output import INTENCOES, parse_specialist_json, render_specialist, render_specialist_output
 
 class OrchestratorAgent(RunnableWithMessageHistory):
     def get_chain(self):
@@ -43,10 +46,6 @@ class OrchestratorAgent(RunnableWithMessageHistory):
                 <ação prática e imediata>     # omita esta seção se não houver recomendação
                 - *Acompanhamento* (opcional):
                 <pergunta/minipróximo passo>  # omita se nada for necessário
-
-
-                ### HISTÓRICO DA CONVERSA
-                {chat_history}
             """
         )
 
@@ -82,12 +81,13 @@ class OrchestratorAgent(RunnableWithMessageHistory):
         
         prompt = ChatPromptTemplate.from_messages([
             system_prompt,
+            MessagesPlaceholder("history_summary", optional=True),   # resumo dos turnos antigos, junto do system prompt
             fewshots,
             MessagesPlaceholder("chat_history"),
             ("human", "{input}")
         ]).partial(today_local=today.isoformat())
         
-        return prompt | llm_fast | StrOutputParser()
+        return compact_history('orchestrator', prompt) | prompt | llm_fast | StrOutputParser()
     
     def __init__(self):
         super().__init__(
@@ -1,16 +1,21 @@
 import os
-from dotenv import load_dotenv
-import psycopg2
-from typing import Optional
+import base64
+import hashlib
+import threading
+from calendar import monthrange
+from itertools import islice
+from typing import Iterable, List, Optional
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from time import perf_counter
 from langchain.tools import tool
 from pydantic import BaseModel, Field
+from psycopg2.extras import execute_values
 
-load_dotenv()
-
-DATABASE_URL = os.getenv("DATABASE_URL")  
-
-def get_conn():
-    return psycopg2.connect(DATABASE_URL)
+from db import get_conn, run_db
+from tracing import traced
+from transaction_types import TYPE_ALIASES, TYPE_NAMES
+from utils import TZ
 
 # Essa classe garante que o objeto de Python passe todos esses campos
 class AddTransactionArgs(BaseModel):
@@ -26,8 +31,6 @@ class AddTransactionArgs(BaseModel):
     description: Optional[str] = Field(default=None, description="Descrição (opcional).")
     payment_method: Optional[str] = Field(default=None, description="Forma de pagamento (opcional).")
 
-TYPE_ALIASES = {"INCOME": "INCOME", "ENTRADA": "INCOME", "GANHEI": "INCOME", "RECEITA": "INCOME", "SALÁRIO": "INCOME", "EXPENSE": "EXPENSES", "EXPENSES": "EXPENSES", "GASTO": "EXPENSES", "COMPREI": "EXPENSES", "COMPRA": "EXPENSES", "GASTEI": "EXPENSES", "TRANSFERENCIA": "TRANSFER", "TRANSFER": "TRANSFER"}
-
 #Garante que o campo type da tabela transactions receba um id válido (1=INCOME, 2=EXPENSES, 3=TRANSFER
 def _resolve_type_id(cur, type_id: Optional[int], type_name: Optional[str]) -> Optional[int]:
     if type_name:
@@ -42,8 +45,24 @@ def _resolve_type_id(cur, type_id: Optional[int], type_name: Optional[str]) -> O
     return 2
 
 
+# Converte datas locais (YYYY-MM-DD) no intervalo [início, fim) em America/Sao_Paulo.
+# Comparar occurred_at direto com timestamptz deixa o Postgres usar o índice,
+# diferente de DATE(occurred_at), que obriga a varrer a tabela inteira.
+def _local_range(date_from: str, date_to: Optional[str] = None) -> tuple:
+    start = datetime.combine(date.fromisoformat(date_from), time.min, tzinfo=TZ)
+    end_day = date.fromisoformat(date_to or date_from) + timedelta(days=1)
+    end = datetime.combine(end_day, time.min, tzinfo=TZ)
+    return start, end
+
+
+# Data/hora local compacta (sem segundos) para as respostas das tools
+def _fmt_local(value: datetime) -> str:
+    return value.astimezone(TZ).strftime('%Y-%m-%dT%H:%M')
+
+
 # Tool: add_transaction
 @tool("add_transaction", args_schema=AddTransactionArgs)
+@traced('db')
 def add_transaction(
     amount: float,
     source_text: str,
@@ -57,60 +76,319 @@ def add_transaction(
     """
     Insere uma transação financeira no banco de dados Postgres.
     """ # docstring obrigatório da @tools do langchain (estranho, mas legal né?)
-    conn = get_conn()
-    cur = conn.cursor()
     try:
-        resolved_type_id = _resolve_type_id(cur, type_id, type_name)
-        if not resolved_type_id:
-            return {"status": "error", "message": "Tipo inválido (use type_id ou type_name: INCOME/EXPENSES/TRANSFER)."}
+        with get_conn() as conn, conn.cursor() as cur:
+            resolved_type_id = _resolve_type_id(cur, type_id, type_name)
+            if not resolved_type_id:
+                return {"status": "error", "message": "Tipo inválido (use type_id ou type_name: INCOME/EXPENSES/TRANSFER)."}
 
-        if occurred_at:
-            cur.execute(
-                """
-                INSERT INTO transactions
-                    (amount, type, category_id, description, payment_method, occurred_at, source_text)
-                VALUES
-                    (%s, %s, %s, %s, %s, %s::timestamptz, %s)
-                RETURNING id, occurred_at;
-                """,
-                (amount, resolved_type_id, category_id, description, payment_method, occurred_at, source_text),
-            )
-        else:
-            cur.execute(
-                """
-                INSERT INTO transactions
-                    (amount, type, category_id, description, payment_method, occurred_at, source_text)
-                VALUES
-                    (%s, %s, %s, %s, %s, NOW(), %s)
-                RETURNING id, occurred_at;
-                """,
-                (amount, resolved_type_id, category_id, description, payment_method, source_text),
-            )
+            if occurred_at:
+                cur.execute(
+                    """
+                    INSERT INTO transactions
+                        (amount, type, category_id, description, payment_method, occurred_at, source_text)
+                    VALUES
+                        (%s, %s, %s, %s, %s, %s::timestamptz, %s)
+                    RETURNING id, occurred_at;
+                    """,
+                    (amount, resolved_type_id, category_id, description, payment_method, occurred_at, source_text),
+                )
+            else:
+                cur.execute(
+                    """
+                    INSERT INTO transactions
+                        (amount, type, category_id, description, payment_method, occurred_at, source_text)
+                    VALUES
+                        (%s, %s, %s, %s, %s, NOW(), %s)
+                    RETURNING id, occurred_at;
+                    """,
+                    (amount, resolved_type_id, category_id, description, payment_method, source_text),
+                )
+
+            new_id, occurred = cur.fetchone()
+            conn.commit()
+            return {"status": "ok", "id": new_id, "occurred_at": str(occurred)}
+
+    # se der erro, o get_conn() já desfaz a transação e devolve a conexão ao pool
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+# Resolve os tipos uma vez só por lote: {"INCOME": 1, "EXPENSES": 2, ...} já com os apelidos do TYPE_ALIASES
+def _load_type_ids(cur) -> dict:
+    cur.execute("SELECT id, UPPER(type) FROM transaction_types;")
+    ids = {name: type_id for type_id, name in cur.fetchall()}
+    for alias, name in TYPE_ALIASES.items():
+        if name in ids:
+            ids.setdefault(alias, ids[name])
+    return ids
+
+
+def _as_datetime(value) -> datetime:
+    if value is None:
+        return datetime.now(TZ)
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=TZ)
+    if isinstance(value, date):
+        return datetime.combine(value, time.min, tzinfo=TZ)
+    parsed = datetime.fromisoformat(str(value))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=TZ)
+
+
+# Chave de conteúdo do lançamento (ou o id externo do banco, quando o extrato tem, ex.: FITID do OFX)
+def _content_key(row: dict, type_id: int, occurred: datetime) -> str:
+    if row.get("external_id"):
+        return f"ext|{row['external_id']}"
+    return "|".join([
+        occurred.astimezone(TZ).isoformat(),
+        f"{abs(Decimal(str(row['amount']))):.2f}",
+        str(type_id),
+        (row.get("description") or "").strip().lower(),
+        (row.get("payment_method") or "").strip().lower(),
+    ])
 
-        new_id, occurred = cur.fetchone()
+
+def insert_transactions_batch(rows: Iterable[dict], chunk_size: int = 1000) -> dict:
+    '''
+    ### Insere várias transações numa única transação do banco
+    - rows: dicts com amount, occurred_at, type_name/type_id, category_id, description, payment_method, source_text,
+      external_id e, opcionalmente, line (número da linha no arquivo, usado no relatório de inválidas)
+    - Usa execute_values em blocos de `chunk_size` e ignora linhas já importadas (content_hash)
+    - Linhas inválidas (tipo/categoria inexistente, valor ilegível ou {"invalid": motivo} vindo do leitor) são puladas
+      e listadas em `invalid`; o resto do lote entra
+    - Sem occurred_at (e sem external_id) a linha entra com a hora atual e sem content_hash: não há chave estável
+      para deduplicar, então ela nunca é tratada como já importada
+    - Aceita um gerador, então arquivos grandes não precisam caber na memória
+    '''
+    start = perf_counter()
+    inserted_ids, total, invalid = [], 0, []
+    seen = {}
+    rows = iter(rows)
+
+    with get_conn() as conn, conn.cursor() as cur:
+        type_ids = _load_type_ids(cur)
+        valid_types = set(type_ids.values())
+        cur.execute("SELECT id FROM categories;")
+        valid_categories = {r[0] for r in cur.fetchall()}
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            values = []
+            for row in chunk:
+                total += 1
+                line = row.get("line", total)
+                if row.get("invalid"):
+                    invalid.append({"row": line, "message": row["invalid"]})
+                    continue
+                try:
+                    if row.get("type_name"):
+                        type_id = type_ids.get(row["type_name"].strip().upper())
+                        if not type_id:
+                            raise ValueError(f"Tipo inválido: {row['type_name']}")
+                    else:
+                        type_id = int(row["type_id"]) if row.get("type_id") else 2
+                        if type_id not in valid_types:
+                            raise ValueError(f"Tipo inválido: {row['type_id']}")
+                    category_id = int(row["category_id"]) if row.get("category_id") else None
+                    if category_id is not None and category_id not in valid_categories:
+                        raise ValueError(f"Categoria inexistente: {row['category_id']}")
+                    amount = abs(Decimal(str(row["amount"])))
+                    try:
+                        occurred = _as_datetime(row.get("occurred_at"))
+                    except ValueError:
+                        raise ValueError(f"Data inválida: {row['occurred_at']}") from None
+                except (ValueError, TypeError, ArithmeticError) as e:
+                    invalid.append({"row": line, "message": str(e)})
+                    continue
+                content_hash = None
+                if row.get("occurred_at") or row.get("external_id"):
+                    # lançamentos idênticos no mesmo lote (ex.: dois cafés iguais no dia) recebem um ordinal diferente:
+                    # reimportar o mesmo extrato não duplica nada, mas os dois cafés entram
+                    key = _content_key(row, type_id, occurred)
+                    ordinal = seen.get(key, 0)
+                    seen[key] = ordinal + 1
+                    content_hash = hashlib.sha256(f"{key}|{ordinal}".encode("utf-8")).hexdigest()
+                values.append((
+                    amount, type_id, category_id, row.get("description"),
+                    row.get("payment_method"), occurred, row.get("source_text") or row.get("description") or "",
+                    content_hash,
+                ))
+            if values:
+                result = execute_values(
+                    cur,
+                    """
+                    INSERT INTO transactions
+                        (amount, type, category_id, description, payment_method, occurred_at, source_text, content_hash)
+                    VALUES %s
+                    ON CONFLICT (content_hash) DO NOTHING
+                    RETURNING id;
+                    """,
+                    values,
+                    page_size=chunk_size,
+                    fetch=True,
+                )
+                inserted_ids.extend(r[0] for r in result)
         conn.commit()
-        return {"status": "ok", "id": new_id, "occurred_at": str(occurred)}
 
+    elapsed = perf_counter() - start
+    return {
+        "status": "ok",
+        "inserted": len(inserted_ids),
+        "skipped": total - len(inserted_ids) - len(invalid),
+        "invalid": invalid,
+        "ids": inserted_ids,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(total / elapsed, 1) if elapsed else None,
+    }
+
+
+class BatchTransaction(BaseModel):
+    amount: float = Field(..., description="Valor da transação (use positivo).")
+    occurred_at: Optional[str] = Field(default=None, description="Timestamp ISO 8601; se ausente, usa o momento atual (e a linha não é deduplicada).")
+    type_name: Optional[str] = Field(default=None, description="Nome do tipo em inglês: INCOME | EXPENSES | TRANSFER.")
+    category_id: Optional[int] = Field(default=None, description="FK de categories (opcional).")
+    description: Optional[str] = Field(default=None, description="Descrição (opcional).")
+    payment_method: Optional[str] = Field(default=None, description="Forma de pagamento (opcional).")
+
+class AddTransactionsBatchArgs(BaseModel):
+    transactions: List[BatchTransaction] = Field(..., description="Lista de transações a inserir de uma vez.")
+    source_text: str = Field(..., description="Texto original do usuário (ex.: o extrato colado).")
+
+@tool("add_transactions_batch", args_schema=AddTransactionsBatchArgs)
+@traced('db')
+def add_transactions_batch(transactions: List[BatchTransaction], source_text: str) -> dict:
+    """
+    Insere várias transações de uma vez (ex.: extrato colado pelo usuário). Prefira esta tool a chamar add_transaction várias vezes.
+    """
+    try:
+        rows = []
+        for t in transactions:
+            row = t.model_dump() if isinstance(t, BaseModel) else dict(t)
+            row["source_text"] = source_text
+            rows.append(row)
+        result = insert_transactions_batch(rows)
+        result.pop("ids", None)
+        return result
     except Exception as e:
-        conn.rollback()
         return {"status": "error", "message": str(e)}
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except Exception:
-            pass
+
+
+QUERY_MAX_LIMIT = int(os.getenv('QUERY_MAX_LIMIT', '200'))          # teto de linhas por página
+QUERY_TEXT_MAX_CHARS = int(os.getenv('QUERY_TEXT_MAX_CHARS', '60'))  # textos longos são cortados na resposta da tool
+EXPORT_BATCH_SIZE = 5000
+
+# Colunas que podem ser pedidas -> expressão SQL (alias t); source_text fica de fora do padrão por ser longo
+TRANSACTION_COLUMNS = {
+    "id": "t.id",
+    "occurred_at": "t.occurred_at",
+    "amount": "t.amount",
+    "type": "t.type",
+    "category_id": "t.category_id",
+    "description": "t.description",
+    "payment_method": "t.payment_method",
+    "source_text": "t.source_text",
+}
+DEFAULT_COLUMNS = ["id", "occurred_at", "amount", "type", "description", "payment_method"]
+QUERY_ORDERS = ("recent", "relevance")
+
+# Busca por texto (migração 0009): full-text em português sem acentos + trigramas na description
+_TEXT_DOC = "f_unaccent(lower(t.description))"
+_TEXT_QUERY = "websearch_to_tsquery('portuguese', f_unaccent(%s))"
+
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _text_match(text: str) -> tuple:
+    # palavras (GIN do search_tsv, com radical: "mercados" acha "mercado") OU trecho da description (GIN de trigramas,
+    # que atende LIKE com % na frente: "uber" acha "UBER *TRIP")
+    return (f"(t.search_tsv @@ {_TEXT_QUERY} OR {_TEXT_DOC} LIKE '%%' || f_unaccent(lower(%s)) || '%%')",
+            [text, _like_escape(text)])
+
+
+def _transaction_filters(text=None, type_name=None, date_local=None, date_from_local=None, date_to_local=None,
+                         fuzzy=False):
+    # WHERE (sem a palavra) + parâmetros, compartilhado pela tool paginada e pela exportação
+    # fuzzy: troca o filtro de texto pela similaridade de trigramas da description (operador % do pg_trgm, limiar 0.3)
+    clauses, params = ["TRUE"], []
+    if text and fuzzy:
+        clauses.append(f"{_TEXT_DOC} %% f_unaccent(lower(%s))")
+        params.append(text)
+    elif text:
+        clause, text_params = _text_match(text)
+        clauses.append(clause)
+        params.extend(text_params)
+    if type_name:
+        t = type_name.strip().upper()
+        clauses.append("t.type = (SELECT id FROM transaction_types WHERE UPPER(type)=%s)")
+        params.append(TYPE_ALIASES.get(t, t))
+    if date_local:
+        clauses.append("t.occurred_at >= %s AND t.occurred_at < %s")
+        params.extend(_local_range(date_local))
+    if date_from_local:
+        clauses.append("t.occurred_at >= %s")
+        params.append(_local_range(date_from_local)[0])
+    if date_to_local:
+        clauses.append("t.occurred_at < %s")
+        params.append(_local_range(date_to_local)[1])
+    return " AND ".join(clauses), params
+
+
+def _select_columns(columns: Optional[List[str]]) -> list:
+    columns = list(dict.fromkeys(columns or DEFAULT_COLUMNS))
+    unknown = [c for c in columns if c not in TRANSACTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Colunas inválidas: {unknown} (use {', '.join(TRANSACTION_COLUMNS)}).")
+    return columns
+
+
+def encode_cursor(occurred_at: datetime, row_id: int) -> str:
+    '''
+    ### Token opaco da próxima página: posição (occurred_at, id) da última linha entregue
+    '''
+    raw = f"{occurred_at.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple:
+    raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+    occurred_at, row_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(occurred_at), int(row_id)
+
+
+def _compact(column: str, value, max_chars: Optional[int] = QUERY_TEXT_MAX_CHARS):
+    # valores curtos e serializáveis: número em vez de Decimal, data local sem segundos, texto cortado
+    if value is None:
+        return None
+    if column == "amount":
+        return float(value)
+    if column == "occurred_at":
+        return _fmt_local(value)
+    if column == "type":
+        return TYPE_NAMES.get(value, value)
+    if isinstance(value, str) and max_chars and len(value) > max_chars:
+        return value[:max_chars - 1] + "…"
+    return value
 
 
 class QueryTransactionsArgs(BaseModel):
-    text: Optional[str] = Field(None, description="Filtro por texto (description/source_text).")
+    text: Optional[str] = Field(None, description="Filtro por texto: palavras inteiras da descrição ou do texto original (\"mercados\" acha \"mercado\"), ou trecho do nome na descrição (\"uber\" acha \"UBER *TRIP\"); trecho de palavra não é buscado no texto original.")
     type_name: Optional[str] = Field(None, description="Nome do tipo: INCOME | EXPENSES | TRANSFER.")
     date_local: Optional[str] = Field(None, description="Data específica (YYYY-MM-DD).")
     date_from_local: Optional[str] = Field(None, description="Data inicial (YYYY-MM-DD).")
     date_to_local: Optional[str] = Field(None, description="Data final (YYYY-MM-DD).")
-    limit: int = Field(20, description="Número máximo de transações para retornar.")
+    limit: int = Field(20, description="Número máximo de transações por página.")
+    cursor: Optional[str] = Field(None, description="`next_cursor` da página anterior, para continuar a listagem.")
+    columns: Optional[List[str]] = Field(
+        None, description="Colunas desejadas (padrão: id, occurred_at, amount, type, description, payment_method; "
+                          "também category_id, source_text)."
+    )
+    order_by: str = Field("recent", description="'recent' (mais recentes, paginado) ou, com `text`, 'relevance' (top `limit` pelos melhores resultados, sem `cursor`).")
 
 @tool("query_transactions", args_schema=QueryTransactionsArgs)
+@traced('db')
 def query_transactions(
     text: Optional[str] = None,
     type_name: Optional[str] = None,
@@ -118,67 +396,237 @@ def query_transactions(
     date_from_local: Optional[str] = None,
     date_to_local: Optional[str] = None,
     limit: int = 20,
+    cursor: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    order_by: str = "recent",
 ) -> dict:
     """
-    Consulta transações com filtros opcionais.
+    Consulta transações com filtros opcionais, da mais recente para a mais antiga, em páginas. Resposta em colunas: `columns` + `rows`; se houver mais, `next_cursor` traz a próxima página. Para totais use summarize_transactions.
     """
-    conn = get_conn()
-    cur = conn.cursor()
     try:
-        query = """
-            SELECT id, amount, type, category_id, description, payment_method, occurred_at, source_text
-            FROM transactions
-            WHERE 1=1
-        """
-        params = []
+        columns = _select_columns(columns)
+        limit = max(1, min(int(limit), QUERY_MAX_LIMIT))
+        if order_by not in QUERY_ORDERS:
+            return {"status": "error", "message": f"order_by inválido: {order_by}. Use: {', '.join(QUERY_ORDERS)}."}
+        relevance = order_by == "relevance"
+        if relevance and not text:
+            return {"status": "error", "message": "order_by='relevance' precisa de `text`."}
+        if relevance and cursor:
+            return {"status": "error", "message": "A ordem por relevância não pagina: use `cursor` só com order_by='recent'."}
+        filters = {"text": text, "type_name": type_name, "date_local": date_local,
+                   "date_from_local": date_from_local, "date_to_local": date_to_local}
+
+        def fetch(fuzzy=False):
+            where, params = _transaction_filters(fuzzy=fuzzy, **filters)
+            order, order_params = "t.occurred_at DESC, t.id DESC", []
+            if relevance or fuzzy:
+                # ranking: peso das palavras (description > source_text), depois parecença do nome, depois data
+                order = (f"ts_rank_cd(t.search_tsv, {_TEXT_QUERY}) DESC, "
+                         f"similarity({_TEXT_DOC}, f_unaccent(lower(%s))) DESC, {order}")
+                order_params = [text, text]
+            elif cursor:
+                # keyset: continua depois da última linha entregue; custo O(página) em qualquer profundidade
+                # (índice em occurred_at, id — migração 0008)
+                where += " AND (t.occurred_at, t.id) < (%s, %s)"
+                params.extend(decode_cursor(cursor))
+            query = f"""
+                SELECT {', '.join(TRANSACTION_COLUMNS[c] for c in columns)}, t.occurred_at, t.id
+                FROM transactions t
+                WHERE {where}
+                ORDER BY {order}
+                LIMIT %s
+            """
+            with get_conn() as conn, conn.cursor() as cur:
+                cur.execute(query, params + order_params + [limit + 1])   # +1: só para saber se há próxima página
+                return cur.fetchall()
+
+        rows, match = fetch(), None
+        if text and not rows and not cursor:
+            # nada por palavra nem por trecho: tenta nome parecido (erro de digitação, abreviação).
+            # Só na 1ª página: com `cursor` a listagem por data continua e uma página vazia quer dizer fim
+            rows, match = fetch(fuzzy=True), "fuzzy"
+
+        page = rows[:limit]
+        result = {"columns": columns,
+                  "rows": [[_compact(c, v) for c, v in zip(columns, row)] for row in page]}
+        if match:
+            result["match"] = match
+        if len(rows) > limit:
+            if relevance or match:
+                # ranqueado não pagina: é o top `limit`; avisa que ficou coisa de fora em vez de cortar calado
+                result["truncated"] = True
+            else:
+                result["next_cursor"] = encode_cursor(*page[-1][-2:])
+        return result
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def iter_transactions(columns: Optional[List[str]] = None, batch_size: int = EXPORT_BATCH_SIZE, **filters):
+    '''
+    ### Percorre todas as transações dos filtros (mesmos de `query_transactions`) sem carregar tudo na memória
+    - Cursor nomeado (server-side): o Postgres manda `batch_size` linhas por ida; devolve dicts com valores crus
+    - Para exportações grandes (ver exporter.py); não é tool do agente
+    '''
+    columns = _select_columns(columns)
+    where, params = _transaction_filters(**filters)
+    with get_conn() as conn:
+        cur = conn.cursor(name=f"export_{os.getpid()}_{threading.get_ident()}")
+        cur.itersize = batch_size
+        try:
+            cur.execute(f"""
+                SELECT {', '.join(TRANSACTION_COLUMNS[c] for c in columns)}
+                FROM transactions t
+                WHERE {where}
+                ORDER BY t.occurred_at DESC, t.id DESC
+            """, params)
+            for row in cur:
+                yield dict(zip(columns, row))
+        finally:
+            # quem consome pode parar antes do fim (GeneratorExit): o get_conn devolve a conexão mesmo assim
+            cur.close()
+            conn.rollback()
+
+# Dimensões aceitas no group_by do resumo -> expressão sobre os rollups (alias s)
+SUMMARY_DIMENSIONS = {
+    "category": "NULLIF(s.category_id, 0)",
+    "type": "s.type",
+    "payment_method": "NULLIF(s.payment_method, '')",
+    "day": "s.day",
+    "week": "date_trunc('week', s.day)::date",
+    "month": "date_trunc('month', s.day)::date",
+}
+
+
+def _full_months(first_day: date, last_day: date) -> tuple:
+    # meses inteiros dentro de [first_day, last_day]: [início, fim) em 1º dias de mês (vazio se início >= fim)
+    start = first_day if first_day.day == 1 else (first_day.replace(day=1) + timedelta(days=32)).replace(day=1)
+    end = (last_day + timedelta(days=1)).replace(day=1)
+    return start, max(start, end)
 
-        if text:
-            query += " AND (description ILIKE %s OR source_text ILIKE %s)"
-            params.extend([f"%{text}%", f"%{text}%"])
+
+def _money(value) -> float:
+    return float(value or 0)
+
+
+class SummarizeTransactionsArgs(BaseModel):
+    date_from_local: Optional[str] = Field(None, description="Data inicial (YYYY-MM-DD); padrão: 1º dia do mês atual.")
+    date_to_local: Optional[str] = Field(None, description="Data final (YYYY-MM-DD), inclusiva; padrão: hoje.")
+    group_by: List[str] = Field(
+        default_factory=lambda: ["category"],
+        description="Agrupamentos (combináveis): category | type | payment_method | day | week | month.",
+    )
+    type_name: Optional[str] = Field(None, description="Só um tipo: INCOME | EXPENSES | TRANSFER (opcional).")
+
+@tool("summarize_transactions", args_schema=SummarizeTransactionsArgs)
+@traced('db')
+def summarize_transactions(
+    date_from_local: Optional[str] = None,
+    date_to_local: Optional[str] = None,
+    group_by: Optional[List[str]] = None,
+    type_name: Optional[str] = None,
+) -> dict:
+    """
+    Resumo de transações num período, já somado no banco: entradas, gastos e quantidade por categoria, tipo, forma de pagamento e/ou dia/semana/mês. Use esta tool para totais e resumos em vez de somar query_transactions.
+    """
+    try:
+        group_by = group_by if group_by is not None else ["category"]
+        unknown = [g for g in group_by if g not in SUMMARY_DIMENSIONS]
+        if unknown:
+            return {"status": "error", "message": f"group_by inválido: {unknown} (use {', '.join(SUMMARY_DIMENSIONS)})."}
+
+        today_local = datetime.now(TZ).date()
+        first_day = date.fromisoformat(date_from_local) if date_from_local else today_local.replace(day=1)
+        last_day = date.fromisoformat(date_to_local) if date_to_local else today_local
+        if last_day < first_day:
+            return {"status": "error", "message": "date_to_local precisa ser igual ou posterior a date_from_local."}
+
+        # meses inteiros vêm do rollup mensal; as pontas (e tudo, se agrupar por dia/semana) do diário
+        if "day" in group_by or "week" in group_by:
+            month_start = month_end = first_day
+        else:
+            month_start, month_end = _full_months(first_day, last_day)
+
+        dims = ''.join(f"{SUMMARY_DIMENSIONS[g]} AS {g}, " for g in group_by)
+        query = f"""
+            WITH s AS (
+                SELECT day, type, category_id, payment_method, total, tx_count
+                FROM summary_daily
+                WHERE day >= %(first)s AND day <= %(last)s AND NOT (day >= %(month_start)s AND day < %(month_end)s)
+                UNION ALL
+                SELECT month, type, category_id, payment_method, total, tx_count
+                FROM summary_monthly
+                WHERE month >= %(month_start)s AND month < %(month_end)s
+            )
+            SELECT {dims}
+                   SUM(s.total) FILTER (WHERE s.type = 1) AS income,
+                   SUM(s.total) FILTER (WHERE s.type = 2) AS expenses,
+                   SUM(s.total) FILTER (WHERE s.type = 3) AS transfers,
+                   SUM(s.tx_count) AS tx_count
+            FROM s
+            WHERE s.tx_count <> 0
+        """
+        params = {"first": first_day, "last": last_day, "month_start": month_start, "month_end": month_end}
         if type_name:
-            query += " AND type = (SELECT id FROM transaction_types WHERE UPPER(type)=%s)"
-            params.append(type_name.upper())
-        if date_local:
-            query += " AND DATE(occurred_at) = %s"
-            params.append(date_local)
-        if date_from_local and date_to_local:
-            query += " AND DATE(occurred_at) BETWEEN %s AND %s"
-            params.extend([date_from_local, date_to_local])
-
-        query += " ORDER BY occurred_at DESC LIMIT %s"
-        params.append(limit)
-
-        cur.execute(query, params)
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-
-        return {"transactions": rows}
+            t = type_name.strip().upper()
+            query += " AND s.type = (SELECT id FROM transaction_types WHERE UPPER(type)=%(type)s)"
+            params["type"] = TYPE_ALIASES.get(t, t)
+        if group_by:
+            positions = ', '.join(str(i + 1) for i in range(len(group_by)))
+            query += f" GROUP BY {positions} ORDER BY {positions}"
+
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            # nomes em vez de ids (tabelas pequenas)
+            types, categories = {}, {}
+            if "type" in group_by:
+                cur.execute("SELECT id, type FROM transaction_types;")
+                types = dict(cur.fetchall())
+            if "category" in group_by:
+                cur.execute("SELECT id, name FROM categories;")
+                categories = dict(cur.fetchall())
+
+        groups = []
+        totals = {"income": 0.0, "expenses": 0.0, "transfers": 0.0, "count": 0}
+        for row in rows:
+            keys, (income, expenses, transfers, count) = row[:len(group_by)], row[len(group_by):]
+            item = {}
+            for name, value in zip(group_by, keys):
+                if name == "type":
+                    value = types.get(value, value)
+                elif name == "category":
+                    value = categories.get(value, value)
+                elif isinstance(value, date):
+                    value = value.isoformat()
+                item[name] = value
+            item.update({"income": _money(income), "expenses": _money(expenses), "count": int(count or 0)})
+            if transfers:
+                item["transfers"] = _money(transfers)
+            groups.append(item)
+            totals["income"] += _money(income)
+            totals["expenses"] += _money(expenses)
+            totals["transfers"] += _money(transfers)
+            totals["count"] += int(count or 0)
+
+        totals = {k: round(v, 2) if isinstance(v, float) else v for k, v in totals.items()}
+        totals["net"] = round(totals["income"] - totals["expenses"], 2)
+        return {"period": {"from": first_day.isoformat(), "to": last_day.isoformat()}, "groups": groups, "totals": totals}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 @tool("total_balance")
+@traced('db')
 def total_balance() -> dict:
     """
     Retorna o saldo total.
     """
-    conn = get_conn()
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            SELECT 
-                COALESCE(SUM(
-                    CASE 
-                        WHEN t.type = 1 THEN amount
-                        WHEN t.type = 2 THEN -amount
-                        ELSE 0
-                    END
-                ), 0) as balance
-            FROM transactions t
-        """)
-        balance = cur.fetchone()[0]
-        cur.close()
-        conn.close()
+        # soma do rollup diário mantido por trigger (ver migrations.py / ledger.py): poucas linhas por dia,
+        # sem varrer transactions e sem uma linha única disputada por todos os escritores
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(SUM(balance_signed(type, total)), 0) FROM balance_daily;")
+            balance = cur.fetchone()[0]
         return {"total_balance": balance}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -188,33 +636,460 @@ class DailyBalanceArgs(BaseModel):
     date_local: str = Field(..., description="Data (YYYY-MM-DD).")
 
 @tool("daily_balance", args_schema=DailyBalanceArgs)
+@traced('db')
 def daily_balance(date_local: str) -> dict:
     """
     Retorna o saldo de um dia específico.
     """
-    conn = get_conn()
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            SELECT 
-                COALESCE(SUM(
-                    CASE 
-                        WHEN t.type = 1 THEN amount
-                        WHEN t.type = 2 THEN -amount
-                        ELSE 0
-                    END
-                ), 0) as balance
-            FROM transactions t
-            WHERE DATE(occurred_at) = %s
-        """, (date_local,))
-        balance = cur.fetchone()[0]
-        cur.close()
-        conn.close()
+        # no máximo uma linha por tipo no dia (chave primária day, type)
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT COALESCE(SUM(balance_signed(type, total)), 0) as balance
+                FROM balance_daily
+                WHERE day = %s
+            """, (date.fromisoformat(date_local),))
+            balance = cur.fetchone()[0]
         return {"daily_balance": balance}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
-TOOLS = [add_transaction, query_transactions, total_balance, daily_balance]
+# ---------- Agenda (tabela events, ver migração 0006_events) ----------
+
+AGENDA_DAY_START = os.getenv('AGENDA_DAY_START', '08:00')            # expediente usado na busca de horários livres
+AGENDA_DAY_END = os.getenv('AGENDA_DAY_END', '18:00')
+AGENDA_MAX_WINDOW_DAYS = int(os.getenv('AGENDA_MAX_WINDOW_DAYS', '92'))  # janela máxima de uma consulta
+AGENDA_CONFLICT_HORIZON = timedelta(days=28)                          # até onde checar conflitos de uma série nova
+RECURRENCE_FREQS = ('DAILY', 'WEEKLY', 'MONTHLY')
+
+_EVENT_COLUMNS = ('id', 'title', 'start', 'end', 'location', 'participants', 'freq', 'recur_interval',
+                  'recur_until', 'exdates')
+
+
+def _window(date_from: Optional[str], date_to: Optional[str], default_days: int = 7) -> tuple:
+    # janela [início, fim) em datas locais; sem datas, de hoje até `default_days` dias à frente
+    date_from = date_from or datetime.now(TZ).date().isoformat()
+    date_to = date_to or (date.fromisoformat(date_from) + timedelta(days=default_days - 1)).isoformat()
+    start, end = _local_range(date_from, date_to)
+    if end <= start:
+        raise ValueError("date_to_local precisa ser igual ou posterior a date_from_local.")
+    if end - start > timedelta(days=AGENDA_MAX_WINDOW_DAYS):
+        raise ValueError(f"Janela maior que {AGENDA_MAX_WINDOW_DAYS} dias; divida a consulta.")
+    return start, end
+
+
+def _fetch_events(cur, start: datetime, end: datetime, exclude_id: Optional[int] = None) -> list:
+    # busca pelo índice GiST de `span`: eventos simples e séries recorrentes que tocam a janela
+    query = """
+        SELECT id, title, lower(during), upper(during), location, participants, freq, recur_interval,
+               recur_until, exdates
+        FROM events
+        WHERE status = 'confirmed' AND span && tstzrange(%s, %s, '[)')
+    """
+    params = [start, end]
+    if exclude_id is not None:
+        query += " AND id <> %s"
+        params.append(exclude_id)
+    cur.execute(query + " ORDER BY lower(during);", params)
+    return [dict(zip(_EVENT_COLUMNS, row)) for row in cur.fetchall()]
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    year, month = divmod(value.month - 1 + months, 12)
+    year += value.year
+    return value.replace(year=year, month=month + 1, day=min(value.day, monthrange(year, month + 1)[1]))
+
+
+def _occurrences(event: dict, start: datetime, end: datetime):
+    '''
+    ### Ocorrências (início, fim) do evento que cruzam a janela [start, end)
+    - Séries são expandidas sob demanda, só dentro da janela: pula direto para perto de `start` em vez de
+      gerar tudo desde a 1ª ocorrência; o horário local se mantém (09:00 continua 09:00)
+    '''
+    first, duration = event['start'], event['end'] - event['start']
+    if not event['freq']:
+        if first < end and first + duration > start:
+            yield first, first + duration
+        return
+
+    local_first = first.astimezone(TZ).replace(tzinfo=None)
+    interval = event['recur_interval'] or 1
+    excluded = {d.astimezone(TZ).replace(tzinfo=None) for d in event['exdates'] or ()}
+    if event['freq'] == 'MONTHLY':
+        local_start = start.astimezone(TZ)
+        months = (local_start.year - local_first.year) * 12 + local_start.month - local_first.month
+        nth = lambda n: _add_months(local_first, n * interval)
+        n = max(months // interval - 1, 0)
+    else:
+        step = timedelta(days=interval * (7 if event['freq'] == 'WEEKLY' else 1))
+        nth = lambda n: local_first + n * step
+        n = max(int((start - duration - first) / step) - 1, 0)
+
+    while True:
+        local = nth(n)
+        occurrence = local.replace(tzinfo=TZ)
+        if occurrence >= end or (event['recur_until'] and occurrence >= event['recur_until']):
+            return
+        if occurrence + duration > start and local not in excluded:
+            yield occurrence, occurrence + duration
+        n += 1
+
+
+def _is_occurrence(event: dict, instant: datetime) -> bool:
+    # alguma ocorrência (ainda não cancelada) da série começa exatamente em `instant`
+    return any(s == instant for s, _ in _occurrences(event, instant, instant + timedelta(seconds=1)))
+
+
+def _expand(events: list, start: datetime, end: datetime) -> list:
+    # todas as ocorrências da janela, ordenadas por início: [(início, fim, evento)]
+    return sorted(((s, e, ev) for ev in events for s, e in _occurrences(ev, start, end)), key=lambda item: item[:2])
+
+
+def _occurrence_dict(occurrence_start: datetime, occurrence_end: datetime, event: dict) -> dict:
+    item = {"id": event['id'], "title": event['title'], "start": _fmt_local(occurrence_start),
+            "end": _fmt_local(occurrence_end)}
+    if event['location']:
+        item["location"] = event['location']
+    if event['participants']:
+        item["participants"] = event['participants']
+    if event['freq']:
+        item["recurring"] = event['freq']
+    return item
+
+
+def _conflicts_with(cur, intervals: list, exclude_id: Optional[int] = None) -> list:
+    # ocorrências já marcadas que sobrepõem algum dos intervalos (início, fim) propostos
+    if not intervals:
+        return []
+    start, end = min(s for s, _ in intervals), max(e for _, e in intervals)
+    found = []
+    for busy_start, busy_end, event in _expand(_fetch_events(cur, start, end, exclude_id), start, end):
+        if any(busy_start < e and busy_end > s for s, e in intervals):
+            found.append(_occurrence_dict(busy_start, busy_end, event))
+    return found
+
+
+def _proposed(cur_start: datetime, cur_end: datetime, freq: Optional[str], recur_interval: int,
+              recur_until: Optional[datetime]) -> list:
+    # intervalos a checar por conflito: o próprio evento, ou as ocorrências da série no horizonte de conflito
+    event = {'start': cur_start, 'end': cur_end, 'freq': freq, 'recur_interval': recur_interval,
+             'recur_until': recur_until, 'exdates': []}
+    return list(_occurrences(event, cur_start, cur_start + AGENDA_CONFLICT_HORIZON)) if freq else [(cur_start, cur_end)]
+
+
+def _event_times(start: str, end: Optional[str], duration_minutes: Optional[int]) -> tuple:
+    event_start = _as_datetime(start)
+    event_end = _as_datetime(end) if end else event_start + timedelta(minutes=duration_minutes or 60)
+    if event_end <= event_start:
+        raise ValueError("O fim do evento precisa ser depois do início.")
+    return event_start, event_end
+
+
+def _recurrence(freq: Optional[str], recur_until: Optional[str], start: datetime) -> tuple:
+    freq = freq.strip().upper() if freq else None
+    if freq and freq not in RECURRENCE_FREQS:
+        raise ValueError("Recorrência inválida (use DAILY | WEEKLY | MONTHLY).")
+    # data final inclusiva: a série vale até o fim daquele dia local
+    until = _local_range(recur_until)[1] if freq and recur_until else None
+    if until is not None and until <= start:
+        raise ValueError("A data final da repetição (recur_until) não pode ser antes do início do evento.")
+    return freq, until
+
+
+class CreateEventArgs(BaseModel):
+    title: str = Field(..., description="Título do evento.")
+    start: str = Field(..., description="Início, ISO 8601 local (YYYY-MM-DDTHH:MM).")
+    end: Optional[str] = Field(None, description="Fim, ISO 8601 local; se ausente, usa duration_minutes.")
+    duration_minutes: Optional[int] = Field(60, description="Duração em minutos quando `end` não vier.")
+    location: Optional[str] = Field(None, description="Local (opcional).")
+    participants: Optional[List[str]] = Field(None, description="Participantes (opcional).")
+    recurrence: Optional[str] = Field(None, description="Repetição: DAILY | WEEKLY | MONTHLY (opcional).")
+    recur_interval: int = Field(1, description="A cada quantos dias/semanas/meses repete.")
+    recur_until: Optional[str] = Field(None, description="Última data da repetição (YYYY-MM-DD); vazio = sem fim.")
+    source_text: Optional[str] = Field(None, description="Texto original do usuário.")
+
+@tool("create_event", args_schema=CreateEventArgs)
+@traced('db')
+def create_event(
+    title: str,
+    start: str,
+    end: Optional[str] = None,
+    duration_minutes: Optional[int] = 60,
+    location: Optional[str] = None,
+    participants: Optional[List[str]] = None,
+    recurrence: Optional[str] = None,
+    recur_interval: int = 1,
+    recur_until: Optional[str] = None,
+    source_text: Optional[str] = None,
+) -> dict:
+    """
+    Cria um evento na agenda (opcionalmente recorrente). Retorna também os eventos que ficam em conflito com ele.
+    """
+    try:
+        event_start, event_end = _event_times(start, end, duration_minutes)
+        freq, until = _recurrence(recurrence, recur_until, event_start)
+        with get_conn() as conn, conn.cursor() as cur:
+            conflicts = _conflicts_with(cur, _proposed(event_start, event_end, freq, recur_interval, until))
+            cur.execute(
+                """
+                INSERT INTO events (title, during, location, participants, freq, recur_interval, recur_until, source_text)
+                VALUES (%s, tstzrange(%s, %s, '[)'), %s, %s, %s, %s, %s, %s)
+                RETURNING id;
+                """,
+                (title, event_start, event_end, location, participants, freq, recur_interval, until, source_text),
+            )
+            new_id = cur.fetchone()[0]
+            conn.commit()
+        return {"status": "ok", "id": new_id, "start": _fmt_local(event_start), "end": _fmt_local(event_end),
+                "conflicts": conflicts}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+class UpdateEventArgs(BaseModel):
+    id: int = Field(..., description="ID do evento.")
+    title: Optional[str] = Field(None, description="Novo título.")
+    start: Optional[str] = Field(None, description="Novo início, ISO 8601 local (mantém a duração se `end` não vier).")
+    end: Optional[str] = Field(None, description="Novo fim, ISO 8601 local.")
+    location: Optional[str] = Field(None, description="Novo local.")
+    participants: Optional[List[str]] = Field(None, description="Nova lista de participantes.")
+
+@tool("update_event", args_schema=UpdateEventArgs)
+@traced('db')
+def update_event(
+    id: int,
+    title: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    location: Optional[str] = None,
+    participants: Optional[List[str]] = None,
+) -> dict:
+    """
+    Altera um evento da agenda (título, horário, local, participantes). Retorna os conflitos do novo horário.
+    """
+    try:
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT lower(during), upper(during), freq, recur_interval, recur_until
+                FROM events WHERE id = %s AND status = 'confirmed' FOR UPDATE;
+            """, (id,))
+            row = cur.fetchone()
+            if not row:
+                return {"status": "error", "message": f"Evento {id} não encontrado."}
+            old_start, old_end, freq, recur_interval, until = row
+            new_start = _as_datetime(start) if start else old_start
+            new_end = _as_datetime(end) if end else new_start + (old_end - old_start)
+            if new_end <= new_start:
+                return {"status": "error", "message": "O fim do evento precisa ser depois do início."}
+            if until is not None and new_start >= until:
+                return {"status": "error", "message": "O novo início fica depois do fim da repetição (recur_until)."}
+
+            conflicts = []
+            if start or end:
+                conflicts = _conflicts_with(cur, _proposed(new_start, new_end, freq, recur_interval, until), exclude_id=id)
+            cur.execute(
+                """
+                UPDATE events
+                SET title = COALESCE(%s, title),
+                    during = tstzrange(%s, %s, '[)'),
+                    location = COALESCE(%s, location),
+                    participants = COALESCE(%s, participants),
+                    updated_at = NOW()
+                WHERE id = %s;
+                """,
+                (title, new_start, new_end, location, participants, id),
+            )
+            conn.commit()
+        return {"status": "ok", "id": id, "start": _fmt_local(new_start), "end": _fmt_local(new_end),
+                "conflicts": conflicts}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+class CancelEventArgs(BaseModel):
+    id: int = Field(..., description="ID do evento.")
+    occurrence_start: Optional[str] = Field(
+        None, description="Só para eventos recorrentes: início (ISO 8601 local) da ocorrência a cancelar; vazio cancela a série."
+    )
+
+@tool("cancel_event", args_schema=CancelEventArgs)
+@traced('db')
+def cancel_event(id: int, occurrence_start: Optional[str] = None) -> dict:
+    """
+    Cancela um evento da agenda (ou uma única ocorrência de um evento recorrente).
+    """
+    try:
+        with get_conn() as conn, conn.cursor() as cur:
+            if occurrence_start:
+                cur.execute("""
+                    SELECT id, title, lower(during), upper(during), location, participants, freq, recur_interval,
+                           recur_until, exdates
+                    FROM events WHERE id = %s AND status = 'confirmed' AND freq IS NOT NULL FOR UPDATE;
+                """, (id,))
+                row = cur.fetchone()
+                if not row:
+                    return {"status": "error", "message": f"Evento {id} não encontrado (ou não é recorrente)."}
+                instant = _as_datetime(occurrence_start)
+                # um exdate fora da série não cancela nada e ainda diria "ok" ao usuário
+                if not _is_occurrence(dict(zip(_EVENT_COLUMNS, row)), instant):
+                    return {"status": "error",
+                            "message": f"O evento {id} não tem ocorrência começando em {_fmt_local(instant)}."}
+                cur.execute("""
+                    UPDATE events SET exdates = array_append(exdates, %s), updated_at = NOW()
+                    WHERE id = %s
+                    RETURNING id;
+                """, (instant, id))
+            else:
+                cur.execute("""
+                    UPDATE events SET status = 'cancelled', updated_at = NOW()
+                    WHERE id = %s AND status = 'confirmed'
+                    RETURNING id;
+                """, (id,))
+            if not cur.fetchone():
+                return {"status": "error", "message": f"Evento {id} não encontrado (ou não é recorrente)."}
+            conn.commit()
+        return {"status": "ok", "id": id, "cancelled": occurrence_start or "serie"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+class AgendaWindowArgs(BaseModel):
+    date_from_local: Optional[str] = Field(None, description="Data inicial (YYYY-MM-DD); padrão hoje.")
+    date_to_local: Optional[str] = Field(None, description="Data final (YYYY-MM-DD), inclusiva; padrão 7 dias depois.")
+
+class ListEventsArgs(AgendaWindowArgs):
+    limit: int = Field(50, description="Número máximo de ocorrências para retornar.")
+
+@tool("list_events", args_schema=ListEventsArgs)
+@traced('db')
+def list_events(date_from_local: Optional[str] = None, date_to_local: Optional[str] = None, limit: int = 50) -> dict:
+    """
+    Lista os eventos (ocorrências) da agenda num período.
+    """
+    try:
+        start, end = _window(date_from_local, date_to_local)
+        with get_conn() as conn, conn.cursor() as cur:
+            occurrences = _expand(_fetch_events(cur, start, end), start, end)
+        return {"events": [_occurrence_dict(*item) for item in occurrences[:limit]],
+                "total": len(occurrences)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def free_slots(busy: list, start: datetime, end: datetime, day_start: time, day_end: time,
+               min_minutes: int = 30) -> list:
+    '''
+    ### Varredura de intervalos: horários livres dentro do expediente de cada dia da janela
+    - busy: [(início, fim)] ordenado por início (como sai de `_expand`); os sobrepostos são unidos na passada
+    - Um passe só sobre os ocupados, mesmo em janelas de várias semanas
+    '''
+    merged = []
+    for busy_start, busy_end in busy:
+        if merged and busy_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], busy_end)
+        else:
+            merged.append([busy_start, busy_end])
+
+    minimum = timedelta(minutes=min_minutes)
+    slots, i = [], 0
+    day, last_day = start.astimezone(TZ).date(), (end - timedelta(microseconds=1)).astimezone(TZ).date()
+    while day <= last_day:
+        cursor = max(start, datetime.combine(day, day_start, tzinfo=TZ))
+        closing = min(end, datetime.combine(day, day_end, tzinfo=TZ))
+        while i < len(merged) and merged[i][1] <= cursor:
+            i += 1
+        j = i
+        while j < len(merged) and merged[j][0] < closing:
+            if merged[j][0] - cursor >= minimum:
+                slots.append((cursor, merged[j][0]))
+            cursor = max(cursor, merged[j][1])
+            j += 1
+        if closing - cursor >= minimum:
+            slots.append((cursor, closing))
+        day += timedelta(days=1)
+    return slots
+
+
+class FindFreeSlotsArgs(AgendaWindowArgs):
+    min_minutes: int = Field(30, description="Duração mínima do horário livre, em minutos.")
+    day_start: Optional[str] = Field(None, description="Início do expediente (HH:MM); padrão AGENDA_DAY_START.")
+    day_end: Optional[str] = Field(None, description="Fim do expediente (HH:MM); padrão AGENDA_DAY_END.")
+
+@tool("find_free_slots", args_schema=FindFreeSlotsArgs)
+@traced('db')
+def find_free_slots(
+    date_from_local: Optional[str] = None,
+    date_to_local: Optional[str] = None,
+    min_minutes: int = 30,
+    day_start: Optional[str] = None,
+    day_end: Optional[str] = None,
+) -> dict:
+    """
+    Horários livres da agenda num período (dentro do expediente), para perguntas de disponibilidade.
+    """
+    try:
+        start, end = _window(date_from_local, date_to_local)
+        with get_conn() as conn, conn.cursor() as cur:
+            occurrences = _expand(_fetch_events(cur, start, end), start, end)
+        slots = free_slots([(s, e) for s, e, _ in occurrences], start, end,
+                           time.fromisoformat(day_start or AGENDA_DAY_START),
+                           time.fromisoformat(day_end or AGENDA_DAY_END), min_minutes)
+        return {"free_slots": [{"start": _fmt_local(s), "end": _fmt_local(e),
+                                "minutes": int((e - s).total_seconds() // 60)} for s, e in slots]}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+class FindConflictsArgs(AgendaWindowArgs):
+    start: Optional[str] = Field(None, description="Início de um horário proposto (ISO 8601 local).")
+    end: Optional[str] = Field(None, description="Fim do horário proposto; se ausente, usa duration_minutes.")
+    duration_minutes: Optional[int] = Field(60, description="Duração do horário proposto, em minutos.")
+
+@tool("find_conflicts", args_schema=FindConflictsArgs)
+@traced('db')
+def find_conflicts(
+    date_from_local: Optional[str] = None,
+    date_to_local: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    duration_minutes: Optional[int] = 60,
+) -> dict:
+    """
+    Conflitos da agenda: com `start`, os eventos que batem com aquele horário; sem `start`, os pares de eventos sobrepostos no período.
+    """
+    try:
+        with get_conn() as conn, conn.cursor() as cur:
+            if start:
+                return {"conflicts": _conflicts_with(cur, [_event_times(start, end, duration_minutes)])}
+            window_start, window_end = _window(date_from_local, date_to_local)
+            occurrences = _expand(_fetch_events(cur, window_start, window_end), window_start, window_end)
+
+        # varredura por início: cada ocorrência só é comparada com as que ainda estão "abertas"
+        pairs, active = [], []
+        for occ_start, occ_end, event in occurrences:
+            active = [item for item in active if item[1] > occ_start]
+            for other in active:
+                pairs.append([_occurrence_dict(*other), _occurrence_dict(occ_start, occ_end, event)])
+            active.append((occ_start, occ_end, event))
+        return {"conflicts": pairs}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+# Versão async das tools (usada pelo AgentExecutor no ainvoke): a mesma função, rodando no pool de threads do banco
+def _with_async(db_tool):
+    func = db_tool.func
+
+    async def _arun(**kwargs):
+        return await run_db(func, **kwargs)
+
+    db_tool.coroutine = _arun
+    return db_tool
+
+
+TOOLS = [_with_async(t) for t in (add_transaction, add_transactions_batch, query_transactions, summarize_transactions,
+                                    total_balance, daily_balance)]
 
-AGENDA_TOOLS = []
\ No newline at end of file
+AGENDA_TOOLS = [_with_async(t) for t in (create_event, update_event, cancel_event, list_events, find_free_slots,
+                                           find_conflicts)]
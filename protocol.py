@@ -0,0 +1,97 @@
+import os
+import re
+
+from textnorm import normalize, tokenize
+from transaction_types import TYPE_ALIASES
+
+# Protocolo de encaminhamento e regras locais do roteador, sem LangChain nem modelos:
+# o main.py importa daqui sem pagar a subida do router.py
+
+# Persona numa linha só, para o protocolo emitido localmente (o parser do protocolo é por linha)
+PERSONA_SISTEMA = "Assessor.AI: objetivo, confiável e empático; respostas curtas e aplicáveis, sem jargões e sem inventar dados."
+
+ROUTE_KEYS = ('ROUTE', 'PERGUNTA_ORIGINAL', 'PERSONA', 'CLARIFY')
+
+
+def parse_protocol(text):
+    '''
+    ### Lê o protocolo de encaminhamento (ROUTE=..., PERGUNTA_ORIGINAL=..., ...) em um dict
+    - Linhas que não começam com uma chave conhecida são continuação do campo anterior (ex.: PERSONA em várias linhas)
+    - Retorna None se não houver ROUTE=
+    '''
+    fields, current = {}, None
+    for line in text.strip().split('\n'):
+        key, sep, value = line.partition('=')
+        if sep and key.strip() in ROUTE_KEYS:
+            current = key.strip()
+            fields[current] = value.strip()
+        elif current:
+            fields[current] += '\n' + line
+    return fields if fields.get('ROUTE') else None
+
+
+def route_message(route, user_input, clarify=''):
+    pergunta = ' '.join(user_input.split())
+    return f"ROUTE={route}\nPERGUNTA_ORIGINAL={pergunta}\nPERSONA={PERSONA_SISTEMA}\nCLARIFY={clarify}"
+
+
+GREETING_REPLY = "Olá! Posso te ajudar com finanças ou agenda; por onde quer começar?"
+GREETINGS = {'oi', 'ola', 'opa', 'eai', 'hey', 'hello', 'bom', 'boa', 'dia', 'tarde', 'noite', 'tudo', 'bem', 'beleza', 'blz', 'td'}
+
+# Palavras-chave (já normalizadas como no tokenize: sem acento e sem plural)
+ROUTE_KEYWORDS = {
+    'financeiro': set(tokenize(' '.join(TYPE_ALIASES))) | {
+        'gastei', 'gasto', 'paguei', 'pagamento', 'recebi', 'saldo', 'despesa', 'extrato', 'transacao',
+        'lancamento', 'lancar', 'orcamento', 'dinheiro', 'reai', 'debito', 'credito', 'pix', 'fatura', 'custou',
+    },
+    'agenda': {
+        'reuniao', 'compromisso', 'agenda', 'agendar', 'marcar', 'evento', 'lembrete', 'lembrar',
+        'disponibilidade', 'disponivel', 'livre', 'horario', 'remarcar', 'desmarcar', 'calendario', 'encontro',
+    },
+    'faq': {
+        'suporte', 'e-mail', 'email', 'telefone', 'lgpd', 'privacidade', 'funcionalidade', 'funciona',
+        'consegue', 'permitido', 'termo', 'politica', 'atendimento', 'contato', 'seguranca',
+    },
+}
+_MONEY = re.compile(r'r\$\s*\d|\d+,\d{2}\b')
+
+# uma palavra-chave de um domínio só dá 0.75 no keyword_route e já passa do padrão ("quanto gastei ontem?");
+# palavras de domínios diferentes nunca decidem localmente (confiança 0)
+ROUTER_CONFIDENCE = float(os.getenv('ROUTER_CONFIDENCE', '0.7'))
+
+
+def keyword_hits(user_input):
+    '''
+    ### Quantas palavras-chave de cada rota aparecem na mensagem
+    '''
+    tokens = tokenize(user_input)
+    hits = {route: sum(1 for t in tokens if t in keywords) for route, keywords in ROUTE_KEYWORDS.items()}
+    if _MONEY.search(normalize(user_input)):
+        hits['financeiro'] += 1
+    return hits
+
+
+def likely_routes(user_input):
+    '''
+    ### Rotas com alguma palavra-chave, da mais para a menos provável (palpite para a execução especulativa)
+    '''
+    hits = keyword_hits(user_input)
+    return sorted((route for route, n in hits.items() if n), key=lambda route: -hits[route])
+
+
+def keyword_route(user_input):
+    '''
+    ### Regras locais de roteamento
+    - Retorna (rota, confiança); rota 'direto' = saudação respondida sem especialista; (None, 0) se não der pra decidir
+    '''
+    words = normalize(user_input).replace('?', ' ').replace('!', ' ').replace(',', ' ').split()
+    if words and len(words) <= 4 and all(w.strip('.') in GREETINGS for w in words):
+        return 'direto', 0.95
+
+    hits = keyword_hits(user_input)
+    matched = [route for route, n in hits.items() if n]
+    if len(matched) != 1:
+        # nada ou mais de um domínio (ex.: "agendar pagamento amanhã") -> ambíguo, quem decide é o LLM
+        return None, 0.0
+    route = matched[0]
+    return route, min(0.6 + 0.15 * hits[route], 0.95)
@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import threading
+import statistics
+from collections import OrderedDict
+
+from langchain_core.runnables import RunnableLambda
+
+from history import HISTORY_BACKEND
+
+REPLAY_CONCURRENCY = int(os.getenv('REPLAY_CONCURRENCY', '8'))   # sessões processadas ao mesmo tempo
+
+
+def record_hash(line):
+    return hashlib.sha256(line.strip().encode('utf-8')).hexdigest()[:16]
+
+
+def load_turns(path):
+    '''
+    ### Lê o JSONL de mensagens e agrupa por sessão, mantendo a ordem do arquivo
+    - Cada linha: {"session_id": ..., "message": ...} (aceita também "input"/"text"); outros campos vão junto para a saída
+    - Linhas sem mensagem são ignoradas; sem session_id, cada linha vira uma sessão própria
+    - Cada turno leva o hash da linha (`record_hash`), conferido ao retomar
+    '''
+    sessions = OrderedDict()
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            message = record.get('message') or record.get('input') or record.get('text')
+            if not message:
+                continue
+            session_id = str(record.get('session_id') or f'replay-{line_no}')
+            sessions.setdefault(session_id, []).append({**record, 'line': line_no, 'session_id': session_id,
+                                                        'message': message, 'record_hash': record_hash(line)})
+    return sessions
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+def load_checkpoint(output_path, input_path):
+    '''
+    ### Linhas já processadas {linha: hash}: a própria saída é o checkpoint (cada resultado é gravado assim que termina)
+    - Cada resultado guarda o arquivo de entrada e o hash da linha; se a saída for de outra entrada
+      (ou de uma versão editada dela), levanta `CheckpointMismatch` em vez de pular as linhas erradas
+    '''
+    done = {}
+    if not os.path.exists(output_path):
+        return done
+    input_path = os.path.abspath(input_path)
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                line_no = result['line']
+            except (ValueError, KeyError):
+                continue   # linha cortada por uma interrupção no meio da gravação
+            if result.get('input_path') != input_path or 'record_hash' not in result:
+                raise CheckpointMismatch(f"{output_path} não é checkpoint de {input_path} "
+                                         f"(foi gerado a partir de {result.get('input_path') or 'outra versão do replay'}); "
+                                         "use outro --output")
+            done[line_no] = result['record_hash']
+    return done
+
+
+class ResultWriter():
+    '''
+    ### Anexa os resultados no JSONL de saída, um por linha, com flush a cada registro (para retomar depois)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.latencies = []
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, result):
+        with self._lock:
+            self._file.write(json.dumps(result, ensure_ascii=False, default=str) + '\n')
+            self._file.flush()
+            self.latencies.append(result['latency_ms'])
+            self.errors += result['error'] is not None
+
+    def close(self):
+        self._file.close()
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {'processed': 0, 'errors': 0}
+        return {'processed': len(latencies), 'errors': self.errors,
+                'p50_ms': round(statistics.median(latencies), 1),
+                'p95_ms': round(latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))], 1)}
+
+
+def _result(turn, input_path, response, started, error=None):
+    return {**turn, 'input_path': input_path, 'response': response, 'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            'error': error, 'ts': time.time()}
+
+
+def session_runner(writer, input_path):
+    '''
+    ### Runnable que processa os turnos de UMA sessão em sequência (a ordem da sessão nunca é quebrada)
+    - Usado com `.abatch`/`.batch` sobre a lista de sessões; `max_concurrency` limita quantas rodam juntas
+    - Erro num turno é registrado e a sessão continua
+    '''
+    from main import executar_fluxo_acessor, executar_fluxo_acessor_async
+    input_path = os.path.abspath(input_path)
+
+    def run(turns):
+        for turn in turns:
+            started = time.perf_counter()
+            try:
+                writer.write(_result(turn, input_path, executar_fluxo_acessor(turn['message'], turn['session_id']), started))
+            except Exception as e:
+                writer.write(_result(turn, input_path, None, started, f'{type(e).__name__}: {e}'))
+        return len(turns)
+
+    async def arun(turns):
+        for turn in turns:
+            started = time.perf_counter()
+            try:
+                response = await executar_fluxo_acessor_async(turn['message'], turn['session_id'])
+                writer.write(_result(turn, input_path, response, started))
+            except Exception as e:
+                writer.write(_result(turn, input_path, None, started, f'{type(e).__name__}: {e}'))
+        return len(turns)
+
+    return RunnableLambda(run, afunc=arun)
+
+
+def replay(input_path, output_path, concurrency=REPLAY_CONCURRENCY, use_async=True, limit=None):
+    '''
+    ### Roda as mensagens do `input_path` pelo pipeline e grava resposta + latência em `output_path`
+    - Retoma de onde parou: linhas que já estão na saída são puladas (se o conteúdo da linha não mudou)
+    - Turnos de sessões retomadas saem com `"resumed": true`: com `HISTORY_BACKEND=memory` eles rodam sem o
+      histórico dos turnos anteriores, então as respostas podem divergir de uma execução corrida
+    '''
+    done = load_checkpoint(output_path, input_path)
+    sessions = []
+    pending = resumed = 0
+    for turns in load_turns(input_path).values():
+        for t in turns:
+            if t['line'] in done and done[t['line']] != t['record_hash']:
+                raise CheckpointMismatch(f"linha {t['line']} de {input_path} mudou desde o checkpoint em {output_path}; "
+                                         "use outro --output")
+        remaining = [t for t in turns if t['line'] not in done]
+        if limit is not None:
+            remaining = remaining[:max(limit - pending, 0)]
+        if not remaining:
+            continue
+        if any(t['line'] in done for t in turns):
+            remaining = [{**t, 'resumed': True} for t in remaining]
+            resumed += 1
+        sessions.append(remaining)
+        pending += len(remaining)
+
+    print(f"{pending} mensagem(ns) em {len(sessions)} sessão(ões); {len(done)} já processada(s)", file=sys.stderr)
+    if resumed and HISTORY_BACKEND == 'memory':
+        print(f"atenção: {resumed} sessão(ões) retomada(s) no meio rodam sem o histórico dos turnos anteriores "
+              "(HISTORY_BACKEND=memory); os resultados saem com \"resumed\": true", file=sys.stderr)
+    writer = ResultWriter(output_path)
+    runner = session_runner(writer, input_path)
+    config = {'max_concurrency': concurrency}
+    started = time.perf_counter()
+    try:
+        if use_async:
+            asyncio.run(runner.abatch(sessions, config=config, return_exceptions=True))
+        else:
+            runner.batch(sessions, config=config, return_exceptions=True)
+    finally:
+        writer.close()
+    summary = writer.summary()
+    elapsed = time.perf_counter() - started
+    summary['seconds'] = round(elapsed, 1)
+    summary['messages_per_second'] = round(summary['processed'] / elapsed, 2) if elapsed else None
+    summary['resumed_sessions'] = resumed
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay em lote de mensagens gravadas (JSONL) pelo pipeline")
+    parser.add_argument('input', help="JSONL de entrada, ex.: requests.jsonl")
+    parser.add_argument('--output', default='replay_results.jsonl', help="JSONL de saída (também serve de checkpoint)")
+    parser.add_argument('--concurrency', type=int, default=REPLAY_CONCURRENCY)
+    parser.add_argument('--sync', action='store_true', help="Usa .batch (threads) em vez de .abatch")
+    parser.add_argument('--limit', type=int, default=None, help="Processa no máximo N mensagens")
+    parser.add_argument('--fake-models', action='store_true', help="Troca o Gemini pelos modelos falsos (teste de carga)")
+    parser.add_argument('--fake-latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.fake_models:
+        os.environ.setdefault('GEMINI_API_KEY', 'replay-offline')   # o cliente do Gemini exige a chave mesmo sem chamar a API
+        from fake_models import install_fakes
+        install_fakes(args.fake_latency_ms / 1000, args.fake_latency_ms / 1000)
+
+    try:
+        summary = replay(args.input, args.output, args.concurrency, not args.sync, args.limit)
+    except CheckpointMismatch as e:
+        sys.exit(f"replay: {e}")
+    print(json.dumps(summary, indent=2))
@@ -12,8 +12,53 @@ from langchain_core.runnables.history import RunnableWithMessageHistory
 from utils import (
     today,
     llm_fast,
+    embeddings,
     get_session_history
 )
+from history_window import compact_history
+from protocol import (
+    PERSONA_SISTEMA, GREETING_REPLY, ROUTER_CONFIDENCE,
+    parse_protocol, route_message, keyword_hits, likely_routes, keyword_route
+)
+
+import os
+import json
+import asyncio
+import threading
+import numpy as np
+
+ROUTER_SHOTS = [
+    # 1) Saudação -> resposta direta
+    {
+        "human": "Oi, tudo bem?",
+        "ai": GREETING_REPLY
+    },
+    # 2) Fora de escopo -> recusar e redirecionar
+    {
+        "human": "Me conta uma piada.",
+        "ai": "Consigo ajudar apenas com finanças ou agenda. Prefere olhar seus gastos ou marcar um compromisso?"
+    },
+    # 3) Finanças -> encaminhar (protocolo textual)
+    {
+        "human": "Quanto gastei com mercado no mês passado?",
+        "ai": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Quanto gastei com mercado no mês passado?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY="
+    },
+    # 4) Ambíguo -> pedir 1 clarificação mínima (texto direto, sem encaminhar)
+    {
+        "human": "Agendar pagamento amanhã às 9h",
+        "ai": "Você quer lançar uma transação (finanças) ou criar um compromisso no calendário (agenda)?"
+    },
+    # 5) Agenda -> encaminhar (protocolo textual) — exemplo explícito
+    {
+        "human": "Tenho reunião amanhã às 9h?",
+        "ai": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Tenho reunião amanhã às 9h?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY="
+    },
+    {
+        "human": "Qual o e-mail do suporte?",
+        "ai": "ROUTE=faq\nPERGUNTA_ORIGINAL=Qual o e-mail do suporte?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY="
+    }
+]
+
 
 class RouterAgent(RunnableWithMessageHistory):
     def get_chain(self):
@@ -58,10 +103,6 @@ class RouterAgent(RunnableWithMessageHistory):
                 ### SAÍDAS POSSÍVEIS
                 - Resposta direta (texto curto) quando saudação ou fora de escopo.
                 - Encaminhamento ao especialista usando exatamente o protocolo acima.
-
-
-                ### HISTÓRICO DA CONVERSA
-                {chat_history}
                 
             """
         )
@@ -71,50 +112,19 @@ class RouterAgent(RunnableWithMessageHistory):
             AIMessagePromptTemplate.from_template("{ai}"),
         ])
 
-        shots = [
-            # 1) Saudação -> resposta direta
-            {
-                "human": "Oi, tudo bem?",
-                "ai": "Olá! Posso te ajudar com finanças ou agenda; por onde quer começar?"
-            },
-            # 2) Fora de escopo -> recusar e redirecionar
-            {
-                "human": "Me conta uma piada.",
-                "ai": "Consigo ajudar apenas com finanças ou agenda. Prefere olhar seus gastos ou marcar um compromisso?"
-            },
-            # 3) Finanças -> encaminhar (protocolo textual)
-            {
-                "human": "Quanto gastei com mercado no mês passado?",
-                "ai": "ROUTE=financeiro\nPERGUNTA_ORIGINAL=Quanto gastei com mercado no mês passado?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY="
-            },
-            # 4) Ambíguo -> pedir 1 clarificação mínima (texto direto, sem encaminhar)
-            {
-                "human": "Agendar pagamento amanhã às 9h",
-                "ai": "Você quer lançar uma transação (finanças) ou criar um compromisso no calendário (agenda)?"
-            },
-            # 5) Agenda -> encaminhar (protocolo textual) — exemplo explícito
-            {
-                "human": "Tenho reunião amanhã às 9h?",
-                "ai": "ROUTE=agenda\nPERGUNTA_ORIGINAL=Tenho reunião amanhã às 9h?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY="
-            },
-            {
-                "human": "Qual o e-mail do suporte?",
-                "ai": "ROUTE=faq\nPERGUNTA_ORIGINAL=Qual o e-mail do suporte?\nPERSONA={PERSONA_SISTEMA}\nCLARIFY="
-            }
-        ]
-
         fewshots = FewShotChatMessagePromptTemplate(
-            examples=shots,
+            examples=ROUTER_SHOTS,
             example_prompt=prompt_base
         )
         
         prompt = ChatPromptTemplate.from_messages([
             system_prompt,
+            MessagesPlaceholder("history_summary", optional=True),   # resumo dos turnos antigos, junto do system prompt
             fewshots,
             MessagesPlaceholder("chat_history"),
             ("human", "{input}")
         ]).partial(today_local=today.isoformat())
-        return prompt | llm_fast | StrOutputParser()
+        return compact_history('router', prompt) | prompt | llm_fast | StrOutputParser()
     
     def __init__(self):
         super().__init__(
@@ -122,4 +132,154 @@ class RouterAgent(RunnableWithMessageHistory):
             get_session_history=get_session_history,
             input_messages_key="input",
             history_messages_key="chat_history"
-        )
\ No newline at end of file
+        )
+
+
+ROUTER_CENTROIDS = os.getenv('ROUTER_CENTROIDS', '0') == '1'
+ROUTER_CENTROID_MIN_SIM = float(os.getenv('ROUTER_CENTROID_MIN_SIM', '0.75'))
+ROUTER_CENTROID_MARGIN = float(os.getenv('ROUTER_CENTROID_MARGIN', '0.05'))
+ROUTER_LOG_EXAMPLES = os.getenv('ROUTER_LOG_EXAMPLES', '0') == '1'
+ROUTER_EXAMPLES_PATH = os.getenv('ROUTER_EXAMPLES_PATH', '.router_examples.jsonl')
+
+
+class CentroidClassifier():
+    '''
+    ### Classificador por centróide de embeddings (opcional, ROUTER_CENTROIDS=1)
+    - Treinado com os few-shots do roteador + exemplos registrados das decisões do LLM
+    '''
+
+    def __init__(self, examples):
+        by_route = {}
+        for text, route in examples:
+            by_route.setdefault(route, []).append(text)
+        self.routes = list(by_route)
+        centroids = []
+        for route in self.routes:
+            vectors = np.asarray(embeddings.embed_documents(by_route[route]), dtype='float32')
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) or 1))
+        self.centroids = np.stack(centroids) if centroids else None
+
+    def predict(self, user_input):
+        if self.centroids is None or len(self.routes) < 2:
+            return None, 0.0
+        query = np.asarray(embeddings.embed_query(user_input), dtype='float32')
+        scores = self.centroids @ (query / (np.linalg.norm(query) or 1))
+        order = np.argsort(scores)[::-1]
+        best, second = scores[order[0]], scores[order[1]]
+        if best < ROUTER_CENTROID_MIN_SIM or best - second < ROUTER_CENTROID_MARGIN:
+            return None, float(best)
+        return self.routes[order[0]], float(best)
+
+
+def training_examples(path=ROUTER_EXAMPLES_PATH):
+    '''
+    ### (texto, rota) dos few-shots com ROUTE= + os exemplos registrados em `path`
+    '''
+    examples = []
+    for shot in ROUTER_SHOTS:
+        fields = parse_protocol(shot["ai"])
+        if fields:
+            examples.append((shot["human"], fields['ROUTE']))
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    examples.append((item['input'], item['route']))
+    return examples
+
+
+class FastRouter():
+    '''
+    ### Pré-roteador local na frente do RouterAgent
+    - Saudações e intenções óbvias são decididas por regras (e opcionalmente pelo classificador de centróides)
+      e devolvem o mesmo protocolo do LLM, sem chamada ao modelo
+    - Só cai no LLM quando é ambíguo; `stats()` mostra confiança média e taxa de fallback
+    '''
+
+    def __init__(self, router=None, use_centroids=ROUTER_CENTROIDS):
+        self.router = router or RouterAgent()
+        self.classifier = CentroidClassifier(training_examples()) if use_centroids else None
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()   # só para o arquivo de exemplos: não segura o lock das métricas durante a escrita
+        self.metrics = {'total': 0, 'local': 0, 'fallback': 0, 'by_rule': 0, 'by_centroid': 0, 'confidence_sum': 0.0}
+
+    def decide(self, user_input):
+        '''
+        ### Decisão local: (resposta no formato do roteador, confiança, fonte) ou (None, confiança, None)
+        '''
+        route, confidence = keyword_route(user_input)
+        source = 'by_rule'
+        if (route is None or confidence < ROUTER_CONFIDENCE) and self.classifier is not None:
+            route, confidence = self.classifier.predict(user_input)
+            source = 'by_centroid'
+        if route is None or confidence < ROUTER_CONFIDENCE:
+            return None, confidence, None
+        if route == 'direto':
+            return GREETING_REPLY, confidence, source
+        return route_message(route, user_input), confidence, source
+
+    def _count(self, output, confidence, source):
+        with self._lock:
+            self.metrics['total'] += 1
+            if output is not None:
+                self.metrics['local'] += 1
+                self.metrics[source] += 1
+                self.metrics['confidence_sum'] += confidence
+            else:
+                self.metrics['fallback'] += 1
+
+    def _remember(self, user_input, output, config):
+        # mantém o histórico igual ao que o RouterAgent gravaria
+        session_id = ((config or {}).get('configurable') or {}).get('session_id')
+        if session_id is not None:
+            history = get_session_history(session_id)
+            history.add_user_message(user_input)
+            history.add_ai_message(output)
+
+    def invoke(self, inputs, config=None):
+        user_input = inputs['input']
+        output, confidence, source = self.decide(user_input)
+        self._count(output, confidence, source)
+
+        if output is None:
+            output = self.router.invoke(inputs, config=config)
+            self._log_example(user_input, output)
+            return output
+
+        self._remember(user_input, output, config)
+        return output
+
+    async def ainvoke(self, inputs, config=None):
+        user_input = inputs['input']
+        if self.classifier is not None:
+            # o classificador de centróides pode precisar do embedding da frase (chamada bloqueante)
+            output, confidence, source = await asyncio.to_thread(self.decide, user_input)
+        else:
+            output, confidence, source = self.decide(user_input)
+        self._count(output, confidence, source)
+
+        if output is None:
+            output = await self.router.ainvoke(inputs, config=config)
+            if ROUTER_LOG_EXAMPLES:
+                await asyncio.to_thread(self._log_example, user_input, output)   # escrita em arquivo fora do loop
+            return output
+
+        # o histórico pode estar no Postgres: gravar fora do event loop
+        await asyncio.to_thread(self._remember, user_input, output, config)
+        return output
+
+    def _log_example(self, user_input, output):
+        fields = parse_protocol(output)
+        if not (ROUTER_LOG_EXAMPLES and fields):
+            return
+        with self._log_lock, open(ROUTER_EXAMPLES_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'input': user_input, 'route': fields['ROUTE']}, ensure_ascii=False) + '\n')
+
+    def stats(self):
+        with self._lock:
+            m = dict(self.metrics)
+        m['fallback_rate'] = m['fallback'] / m['total'] if m['total'] else 0.0
+        m['avg_local_confidence'] = m.pop('confidence_sum') / m['local'] if m['local'] else 0.0
+        return m
@@ -0,0 +1,179 @@
+import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+import uvicorn
+
+from main import executar_fluxo_acessor_async, executar_fluxo_acessor_stream, speculation_stats
+from agents import warm, startup_profile
+from db import pool_stats
+from governor import governor_stats
+
+SERVER_HOST = os.getenv('SERVER_HOST', '127.0.0.1')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8000'))
+MAX_CONCURRENCY = int(os.getenv('SERVER_MAX_CONCURRENCY', '32'))   # turnos processados ao mesmo tempo (todas as sessões)
+QUEUE_TIMEOUT = float(os.getenv('SERVER_QUEUE_TIMEOUT', '30'))      # segundos esperando vaga antes de responder 503
+SERVER_WARMUP = os.getenv('AGENT_WARMUP', 'all')                    # no servidor, todos os agentes sobem em segundo plano
+
+
+class SessionLocks():
+    '''
+    ### Um asyncio.Lock por sessão: mensagens da mesma sessão são processadas na ordem de chegada
+    - Sessões diferentes rodam em paralelo; o lock some quando ninguém mais está esperando por ele
+    '''
+
+    def __init__(self):
+        self._locks = {}   # session_id -> [lock, usuários]
+
+    @asynccontextmanager
+    async def hold(self, session_id):
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class ChatRequest(BaseModel):
+    session_id: str
+    message: str
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # o servidor já aceita conexões enquanto os agentes são construídos; quem chegar antes espera só o agente que usar
+    warm(SERVER_WARMUP)
+    yield
+
+
+app = FastAPI(title='Assessor.AI', lifespan=lifespan)
+session_locks = SessionLocks()
+metrics = {'turns': 0, 'errors': 0, 'rejected': 0, 'in_flight': 0}
+_slots = None
+
+
+def _get_slots():
+    # criado dentro do event loop do servidor
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _slots
+
+
+@asynccontextmanager
+async def turno(session_id):
+    '''
+    ### Vaga para processar um turno respeitando a ordem da sessão e o limite global de concorrência
+    - A ordem é garantida antes de pegar uma vaga, então uma sessão com fila não ocupa vagas à toa
+    '''
+    async with session_locks.hold(session_id):
+        slots = _get_slots()
+        try:
+            await asyncio.wait_for(slots.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics['rejected'] += 1
+            raise HTTPException(status_code=503, detail='Servidor ocupado, tente novamente.')
+        metrics['in_flight'] += 1
+        try:
+            yield
+            metrics['turns'] += 1
+        except Exception:
+            metrics['errors'] += 1
+            raise
+        finally:
+            metrics['in_flight'] -= 1
+            slots.release()
+
+
+async def responder(session_id, message):
+    async with turno(session_id):
+        return await executar_fluxo_acessor_async(message, session_id)
+
+
+async def responder_stream(session_id, message):
+    '''
+    ### Eventos do turno em streaming (ver `executar_fluxo_acessor_stream`)
+    '''
+    async with turno(session_id):
+        async for evento in executar_fluxo_acessor_stream(message, session_id):
+            yield evento
+
+
+def _linha(evento):
+    # saídas das tools podem ter Decimal/datetime
+    return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+@app.post('/chat')
+async def chat(request: ChatRequest):
+    return {'session_id': request.session_id, 'resposta': await responder(request.session_id, request.message)}
+
+
+@app.post('/chat/stream')
+async def chat_stream(request: ChatRequest):
+    '''
+    ### Mesmo turno do /chat, mas devolve os eventos conforme saem (NDJSON, um evento por linha)
+    '''
+    async def corpo():
+        try:
+            async for evento in responder_stream(request.session_id, request.message):
+                yield _linha(evento) + '\n'
+        except HTTPException as e:
+            yield _linha({'event': 'error', 'message': e.detail}) + '\n'
+        except Exception as e:
+            yield _linha({'event': 'error', 'message': f'Erro ao consumir a API: {e}'}) + '\n'
+    return StreamingResponse(corpo(), media_type='application/x-ndjson')
+
+
+@app.websocket('/ws/{session_id}')
+async def chat_ws(websocket: WebSocket, session_id: str, stream: bool = False):
+    '''
+    ### Conversa por WebSocket: cada mensagem de texto recebida é um turno
+    - Sem `?stream=1`, a resposta volta como texto; com, volta um JSON por evento (route, tool_start, token, end...)
+    '''
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            if stream:
+                try:
+                    async for evento in responder_stream(session_id, message):
+                        await websocket.send_text(_linha(evento))
+                except HTTPException as e:
+                    await websocket.send_text(_linha({'event': 'error', 'message': e.detail}))
+                except WebSocketDisconnect:
+                    raise
+                except Exception as e:
+                    await websocket.send_text(_linha({'event': 'error', 'message': f'Erro ao consumir a API: {e}'}))
+                continue
+            try:
+                resposta = await responder(session_id, message)
+            except HTTPException as e:
+                resposta = e.detail
+            except Exception as e:
+                resposta = f'Erro ao consumir a API: {e}'
+            await websocket.send_text(resposta or '')
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get('/stats')
+async def stats():
+    return {'server': dict(metrics, sessions_active=len(session_locks), max_concurrency=MAX_CONCURRENCY),
+            'db_pool': pool_stats(), 'speculation': speculation_stats(), 'governor': governor_stats(),
+            'startup': startup_profile()}
+
+
+if __name__ == '__main__':
+    uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
@@ -0,0 +1,65 @@
+import re
+import json
+
+# Contrato de saída dos especialistas (ver prompts de financial.py e agenda.py), sem LangChain:
+# o main.py renderiza o JSON localmente antes de precisar do orquestrador
+INTENCOES = {
+    'financeiro': {'consultar', 'inserir', 'atualizar', 'deletar', 'resumo'},
+    'agenda': {'consultar', 'criar', 'atualizar', 'cancelar', 'listar', 'disponibilidade', 'conflitos'},
+}
+_FENCE = re.compile(r'```(?:json)?\s*(.*?)```', re.S | re.I)
+
+
+def parse_specialist_json(text):
+    '''
+    ### Extrai e valida o JSON do especialista
+    - Tolera cercas de código (```json) e texto antes/depois do objeto
+    - Retorna o dict, ou None se não bater com o contrato
+    '''
+    if not isinstance(text, str):
+        return None
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    start = text.find('{')
+    if start < 0:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text[start:])
+    except ValueError:
+        return None
+
+    if not isinstance(data, dict):
+        return None
+    if data.get('intencao') not in INTENCOES.get(data.get('dominio'), ()):
+        return None
+    if not isinstance(data.get('resposta'), str) or not data['resposta'].strip():
+        return None
+    for key in ('recomendacao', 'esclarecer', 'acompanhamento'):
+        if data.get(key) is not None and not isinstance(data[key], str):
+            return None
+    return data
+
+
+def render_specialist(data):
+    '''
+    ### Monta a resposta final no FORMATO DE SAÍDA do orquestrador, sem LLM
+    - Mesmas regras do prompt: `resposta` na primeira linha, *Recomendação* se houver,
+      *Acompanhamento* com `esclarecer` ou, na falta dele, `acompanhamento`
+    '''
+    lines = [data['resposta'].strip()]
+    recomendacao = (data.get('recomendacao') or '').strip()
+    if recomendacao:
+        lines += ['- *Recomendação*:', recomendacao]
+    acompanhamento = (data.get('esclarecer') or '').strip() or (data.get('acompanhamento') or '').strip()
+    if acompanhamento:
+        lines += ['- *Acompanhamento* (opcional):', acompanhamento]
+    return '\n'.join(lines)
+
+
+def render_specialist_output(text):
+    '''
+    ### Resposta final renderizada localmente, ou None se o JSON não puder ser usado (aí vai pro LLM)
+    '''
+    data = parse_specialist_json(text)
+    return render_specialist(data) if data else None
@@ -1,3 +1,3 @@
 from pg_tools import get_conn
-conn = get_conn()
-cur = conn.cursor()
\ No newline at end of file
+with get_conn() as conn:
+    cur = conn.cursor()
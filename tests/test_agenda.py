@@ -0,0 +1,98 @@
+import os
+from datetime import datetime, time, timedelta
+
+import pytest
+
+os.environ.setdefault('GEMINI_API_KEY', 'test-offline')   # o utils cria os clientes do Gemini no import
+pg_tools = pytest.importorskip('pg_tools')
+
+from pg_tools import TZ, _is_occurrence, _occurrences, _recurrence, free_slots
+
+
+def local(*args):
+    return datetime(*args, tzinfo=TZ)
+
+
+def event(start, minutes=60, freq=None, interval=1, until=None, exdates=()):
+    return {'start': start, 'end': start + timedelta(minutes=minutes), 'freq': freq, 'recur_interval': interval,
+            'recur_until': until, 'exdates': list(exdates)}
+
+
+def starts(ev, start, end):
+    return [s for s, _ in _occurrences(ev, start, end)]
+
+
+# ---------- _occurrences ----------
+
+def test_single_event_overlapping_the_window():
+    ev = event(local(2026, 3, 2, 9))
+    assert starts(ev, local(2026, 3, 2, 9, 30), local(2026, 3, 3)) == [local(2026, 3, 2, 9)]
+    assert starts(ev, local(2026, 3, 2, 10), local(2026, 3, 3)) == []
+
+
+def test_monthly_series_clamps_to_the_last_day_of_the_month():
+    ev = event(local(2026, 1, 31, 10), freq='MONTHLY')
+    assert starts(ev, local(2026, 1, 1), local(2026, 5, 1)) == [
+        local(2026, 1, 31, 10), local(2026, 2, 28, 10), local(2026, 3, 31, 10), local(2026, 4, 30, 10)]
+
+
+def test_exdates_remove_single_occurrences():
+    ev = event(local(2026, 3, 2, 9), freq='WEEKLY', exdates=[local(2026, 3, 9, 9)])
+    assert starts(ev, local(2026, 3, 1), local(2026, 3, 24)) == [
+        local(2026, 3, 2, 9), local(2026, 3, 16, 9), local(2026, 3, 23, 9)]
+
+
+def test_series_stops_at_recur_until():
+    ev = event(local(2026, 3, 2, 9), freq='DAILY', until=local(2026, 3, 5))
+    assert starts(ev, local(2026, 3, 1), local(2026, 4, 1)) == [
+        local(2026, 3, 2, 9), local(2026, 3, 3, 9), local(2026, 3, 4, 9)]
+
+
+def test_window_far_from_the_first_occurrence():
+    ev = event(local(2020, 1, 13, 9), freq='WEEKLY', interval=2)
+    assert starts(ev, local(2026, 3, 1), local(2026, 3, 31)) == [local(2026, 3, 2, 9), local(2026, 3, 16, 9),
+                                                                 local(2026, 3, 30, 9)]
+    monthly = event(local(2019, 5, 15, 14), freq='MONTHLY', interval=3)
+    assert starts(monthly, local(2026, 1, 1), local(2026, 12, 31)) == [
+        local(2026, 2, 15, 14), local(2026, 5, 15, 14), local(2026, 8, 15, 14), local(2026, 11, 15, 14)]
+
+
+def test_occurrence_started_before_the_window_is_kept():
+    ev = event(local(2020, 1, 1, 23), minutes=120, freq='DAILY')
+    assert starts(ev, local(2026, 3, 2, 0, 30), local(2026, 3, 2, 12)) == [local(2026, 3, 1, 23)]
+
+
+def test_is_occurrence_only_matches_real_starts():
+    ev = event(local(2026, 3, 2, 9), freq='WEEKLY', exdates=[local(2026, 3, 9, 9)])
+    assert _is_occurrence(ev, local(2026, 3, 16, 9))
+    assert not _is_occurrence(ev, local(2026, 3, 16, 9, 30))   # dentro da ocorrência, mas não no início
+    assert not _is_occurrence(ev, local(2026, 3, 17, 9))       # dia fora da série
+    assert not _is_occurrence(ev, local(2026, 3, 9, 9))        # já cancelada
+    assert not _is_occurrence(ev, local(2026, 2, 23, 9))       # antes da 1ª ocorrência
+
+
+def test_recur_until_before_start_is_rejected():
+    with pytest.raises(ValueError):
+        _recurrence('WEEKLY', '2026-03-01', local(2026, 3, 2, 9))
+    assert _recurrence('weekly', '2026-03-02', local(2026, 3, 2, 9)) == ('WEEKLY', local(2026, 3, 3))
+
+
+# ---------- free_slots ----------
+
+def test_free_slots_merges_overlaps_and_skips_short_gaps():
+    busy = [(local(2026, 3, 2, 9), local(2026, 3, 2, 10)),
+            (local(2026, 3, 2, 9, 30), local(2026, 3, 2, 11)),
+            (local(2026, 3, 2, 11, 15), local(2026, 3, 2, 12))]
+    slots = free_slots(busy, local(2026, 3, 2), local(2026, 3, 3), time(8), time(18), min_minutes=30)
+    assert slots == [(local(2026, 3, 2, 8), local(2026, 3, 2, 9)), (local(2026, 3, 2, 12), local(2026, 3, 2, 18))]
+
+
+def test_free_slots_spans_several_days_and_respects_the_window():
+    busy = [(local(2026, 3, 2, 17), local(2026, 3, 3, 9))]
+    slots = free_slots(busy, local(2026, 3, 2, 12), local(2026, 3, 3, 12), time(8), time(18))
+    assert slots == [(local(2026, 3, 2, 12), local(2026, 3, 2, 17)), (local(2026, 3, 3, 9), local(2026, 3, 3, 12))]
+
+
+def test_free_slots_with_a_fully_busy_day():
+    busy = [(local(2026, 3, 2, 7), local(2026, 3, 2, 19))]
+    assert free_slots(busy, local(2026, 3, 2), local(2026, 3, 3), time(8), time(18)) == []
@@ -0,0 +1,24 @@
+import pytest
+
+faq_cache = pytest.importorskip('faq_cache')
+
+from faq_cache import AnswerCache
+
+
+def test_new_index_version_drops_old_answers():
+    cache = AnswerCache(version='v1')
+    cache.put('Qual o e-mail do suporte?', 'suporte@antigo', [1.0, 0.0], version='v1')
+    assert cache.get_exact('qual o e-mail do suporte') == 'suporte@antigo'
+
+    cache.set_version('v2')
+    assert cache.get_exact('Qual o e-mail do suporte?') is None
+    assert cache.get_similar([1.0, 0.0]) is None
+
+
+def test_answer_generated_with_an_old_index_is_not_stored():
+    cache = AnswerCache(version='v1')
+    cache.set_version('v2')   # reload no meio da geração
+    cache.put('Qual o e-mail do suporte?', 'suporte@antigo', version='v1')
+    assert cache.get_exact('Qual o e-mail do suporte?') is None
+    cache.put('Qual o e-mail do suporte?', 'suporte@novo', version='v2')
+    assert cache.get_exact('Qual o e-mail do suporte?') == 'suporte@novo'
@@ -0,0 +1,209 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from governor import CallGovernor, CircuitBreaker, CircuitOpenError, GovernorSaturated, GovernorTimeout, InFlightLimit
+
+
+def _governor(max_in_flight=4, failures=2, retries=0, timeout=1.0):
+    policy = {'rate': 0.0, 'burst': 1, 'timeout': timeout, 'deadline': 2.0, 'retries': retries, 'hedge': False}
+    governor = CallGovernor({'llm': policy}, max_in_flight=max_in_flight)
+    governor.breakers['llm'] = CircuitBreaker(failures=failures, reset_timeout=0)
+    return governor
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+class BadRequest(Exception):
+    code = 400
+
+
+def _fail(error):
+    def fn():
+        raise error
+    return fn
+
+
+# ---------- CircuitBreaker ----------
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, reset_timeout=60)
+    for _ in range(2):
+        assert breaker.allow() == 'closed'
+        breaker.failure()
+    assert breaker.state == 'closed'
+    breaker.failure()
+    assert breaker.state == 'open'
+    assert breaker.allow() is None
+
+
+def test_breaker_success_resets_the_count():
+    breaker = CircuitBreaker(failures=2, reset_timeout=60)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0)
+    breaker.failure()
+    assert breaker.allow() == 'probe'
+    assert breaker.state == 'half_open'
+    assert breaker.allow() is None
+
+
+def test_probe_success_closes_and_failure_reopens():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0)
+    breaker.failure()
+    breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed'
+
+    breaker.failure()
+    breaker.allow()
+    breaker.reset_timeout = 60
+    breaker.failure()
+    assert breaker.state == 'open'
+    assert breaker.allow() is None
+
+
+def test_release_frees_only_the_probe():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0)
+    breaker.failure()
+    ticket = breaker.allow()
+    breaker.release('closed')   # chamada antiga, de quando o circuito estava fechado
+    assert breaker.allow() is None
+    breaker.release(ticket)
+    assert breaker.state == 'half_open'
+    assert breaker.allow() == 'probe'
+
+
+# ---------- CallGovernor ----------
+
+def test_transient_errors_open_the_circuit():
+    governor = _governor(failures=2)
+    for _ in range(2):
+        with pytest.raises(Unavailable):
+            governor.call('llm', _fail(Unavailable()))
+    assert governor.breakers['llm'].state == 'open'
+
+
+def test_client_errors_do_not_count_as_failures():
+    governor = _governor(failures=1)
+    for _ in range(3):
+        with pytest.raises(BadRequest):
+            governor.call('llm', _fail(BadRequest()))
+    assert governor.breakers['llm'].state == 'closed'
+    assert governor.stats['llm']['failures'] == 3
+
+
+def test_open_circuit_uses_fallback():
+    governor = _governor(failures=1)
+    governor.breakers['llm'].reset_timeout = 60
+    with pytest.raises(Unavailable):
+        governor.call('llm', _fail(Unavailable()))
+    assert governor.call('llm', lambda: 'ok', fallback=lambda: 'canned') == 'canned'
+    with pytest.raises(CircuitOpenError):
+        governor.call('llm', lambda: 'ok')
+
+
+def test_probe_rejected_by_a_full_queue_is_released():
+    governor = _governor(max_in_flight=1, failures=1)
+    with pytest.raises(Unavailable):
+        governor.call('llm', _fail(Unavailable()))
+    breaker = governor.breakers['llm']
+
+    governor._slots.acquire(time.monotonic() + 1)   # ocupa a única vaga
+    governor.policies['llm']['deadline'] = 0.05
+    with pytest.raises(GovernorSaturated):
+        governor.call('llm', lambda: 'ok')
+    assert breaker.state == 'half_open'   # fila local cheia não é culpa do provedor
+    governor._slots.release()
+
+    governor.policies['llm']['deadline'] = 2.0
+    assert governor.call('llm', lambda: 'ok') == 'ok'
+    assert breaker.state == 'closed'
+
+
+def test_cancelled_probe_is_released():
+    governor = _governor(failures=1)
+    with pytest.raises(Unavailable):
+        governor.call('llm', _fail(Unavailable()))
+
+    async def scenario():
+        task = asyncio.ensure_future(governor.acall('llm', lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await governor.acall('llm', lambda: asyncio.sleep(0, result='ok'))
+
+    assert asyncio.run(scenario()) == 'ok'
+    assert governor.breakers['llm'].state == 'closed'
+
+
+def test_guard_releases_probe_when_the_stream_stops_early():
+    governor = _governor(failures=1)
+    with pytest.raises(Unavailable):
+        governor.call('llm', _fail(Unavailable()))
+
+    def stream():
+        with governor.guard('llm'):
+            yield 'a'
+            yield 'b'
+
+    chunks = stream()
+    next(chunks)
+    chunks.close()   # o consumidor parou no meio (GeneratorExit)
+    assert governor.breakers['llm'].allow() == 'probe'
+
+
+def test_timed_out_attempt_keeps_its_slot_until_the_thread_ends():
+    governor = _governor(max_in_flight=1, timeout=0.05)
+    release = threading.Event()
+    with pytest.raises(GovernorTimeout):
+        governor.call('llm', lambda: release.wait(5))
+    assert governor._slots.in_flight == 1   # a thread ainda está esperando o "provedor"
+    release.set()
+    deadline = time.monotonic() + 2
+    while governor._slots.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert governor._slots.in_flight == 0
+
+
+# ---------- InFlightLimit ----------
+
+def test_async_waiter_is_woken_by_release():
+    slots = InFlightLimit(1)
+
+    async def scenario():
+        await slots.aacquire(time.monotonic() + 1)
+        waiter = asyncio.ensure_future(slots.aacquire(time.monotonic() + 1))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        started = time.monotonic()
+        slots.release()
+        await waiter
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.1
+    assert slots.in_flight == 1
+
+
+def test_async_waiter_gives_up_at_the_deadline():
+    slots = InFlightLimit(1)
+    slots.acquire(time.monotonic() + 1)
+
+    async def scenario():
+        with pytest.raises(GovernorSaturated):
+            await slots.aacquire(time.monotonic() + 0.02)
+
+    asyncio.run(scenario())
+    assert not slots._waiters
+    slots.release()
+    assert slots.in_flight == 0
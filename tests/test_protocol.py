@@ -0,0 +1,36 @@
+from protocol import ROUTER_CONFIDENCE, keyword_route, likely_routes, parse_protocol, route_message
+from specialist_output import render_specialist_output
+
+
+def test_route_message_round_trips():
+    fields = parse_protocol(route_message('agenda', 'Tenho   reunião\namanhã?'))
+    assert fields['ROUTE'] == 'agenda'
+    assert fields['PERGUNTA_ORIGINAL'] == 'Tenho reunião amanhã?'
+    assert parse_protocol('Olá! Como posso ajudar?') is None
+
+
+def test_single_unambiguous_keyword_decides_locally():
+    route, confidence = keyword_route('quanto gastei ontem?')
+    assert route == 'financeiro'
+    assert confidence >= ROUTER_CONFIDENCE
+
+
+def test_two_keywords_decide_locally():
+    route, confidence = keyword_route('gastei 50 reais no mercado')
+    assert route == 'financeiro'
+    assert confidence >= ROUTER_CONFIDENCE
+
+
+def test_mixed_domains_are_ambiguous():
+    assert keyword_route('agendar pagamento amanhã') == (None, 0.0)
+    assert set(likely_routes('agendar pagamento amanhã')) == {'agenda', 'financeiro'}
+
+
+def test_greeting_is_answered_directly():
+    assert keyword_route('Oi, tudo bem?') == ('direto', 0.95)
+
+
+def test_specialist_json_is_rendered_locally():
+    text = '```json\n{"dominio": "agenda", "intencao": "listar", "resposta": "Você tem 2 compromissos.", "acompanhamento": "Quer ver os detalhes?"}\n```'
+    assert render_specialist_output(text) == 'Você tem 2 compromissos.\n- *Acompanhamento* (opcional):\nQuer ver os detalhes?'
+    assert render_specialist_output('{"dominio": "agenda", "intencao": "inserir", "resposta": "x"}') is None
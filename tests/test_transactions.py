@@ -0,0 +1,70 @@
+import os
+from contextlib import contextmanager
+
+import pytest
+
+os.environ.setdefault('GEMINI_API_KEY', 'test-offline')   # o utils cria os clientes do Gemini no import
+pg_tools = pytest.importorskip('pg_tools')
+
+
+class FakeCursor():
+    def __init__(self):
+        self.inserted = []
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if 'transaction_types' in sql:
+            self._rows = [(1, 'INCOME'), (2, 'EXPENSES'), (3, 'TRANSFER')]
+        elif 'categories' in sql:
+            self._rows = [(1,)]
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConn():
+    def __init__(self):
+        self.cur = FakeCursor()
+        self.committed = False
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.committed = True
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    conn = FakeConn()
+
+    @contextmanager
+    def get_conn():
+        yield conn
+
+    def execute_values(cur, sql, values, page_size=None, fetch=False):
+        start = len(cur.inserted)
+        cur.inserted.extend(values)
+        return [(start + i + 1,) for i in range(len(values))]
+
+    monkeypatch.setattr(pg_tools, 'get_conn', get_conn)
+    monkeypatch.setattr(pg_tools, 'execute_values', execute_values)
+    return conn
+
+
+def test_bad_date_is_reported_and_the_rest_of_the_batch_goes_in(fake_db):
+    result = pg_tools.insert_transactions_batch([
+        {'amount': 10, 'occurred_at': '2024-02-10T12:00', 'type_name': 'EXPENSES', 'description': 'café'},
+        {'amount': 20, 'occurred_at': '31/02/2024', 'type_name': 'EXPENSES', 'description': 'mercado'},
+        {'amount': 30, 'occurred_at': '2024-02-11', 'type_name': 'INCOME', 'description': 'pix'},
+    ])
+    assert result['inserted'] == 2
+    assert result['invalid'] == [{'row': 2, 'message': 'Data inválida: 31/02/2024'}]
+    assert [v[3] for v in fake_db.cur.inserted] == ['café', 'pix']
+    assert fake_db.committed
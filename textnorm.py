@@ -0,0 +1,31 @@
+import re
+import unicodedata
+
+# Normalização de texto sem dependências: usada pelo BM25 do FAQ, pelas palavras-chave do roteador e pelos caches
+
+# Palavras muito comuns em português que só atrapalham o BM25
+STOPWORDS = set("""
+a o as os um uma uns umas de do da dos das no na nos nas em por para pra com sem que e ou se
+ao aos à às é ser sao são foi como qual quais quando onde meu minha seu sua eu voce você isso
+esse essa este esta ele ela nao não mais muito tem ter há ha pelo pela pelos pelas sobre até ate
+""".split())
+
+
+def normalize(text):
+    '''
+    ### Minúsculas e sem acento ("Exclusão" -> "exclusao")
+    '''
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def _stem(token):
+    # radical bem leve: só tira o plural ("lancamentos" -> "lancamento")
+    if len(token) > 4 and token.endswith('s') and token.isalpha():
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    tokens = (t.strip('.-') for t in re.findall(r'[\w@.\-]+', normalize(text)))
+    return [_stem(t) for t in tokens if len(t) > 1 and t not in STOPWORDS]
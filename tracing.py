@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import argparse
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACING = os.getenv('TRACING', '0') == '1'
+# requests.jsonl é o log de mensagens (entrada do replay); os traces vão para um arquivo próprio
+TRACE_PATH = os.getenv('TRACE_PATH', 'traces.jsonl')
+TRACE_FLUSH_EVERY = int(os.getenv('TRACE_FLUSH_EVERY', '50'))           # registros acumulados antes de gravar
+TRACE_FLUSH_INTERVAL = float(os.getenv('TRACE_FLUSH_INTERVAL', '2'))    # segundos máximos até gravar
+
+_trace = contextvars.ContextVar('trace', default=None)
+_span = contextvars.ContextVar('span', default=None)
+
+
+class Trace():
+    '''
+    ### Um turno da conversa: spans em árvore (id/parent), gravados como um único registro JSONL
+    '''
+
+    def __init__(self, session_id, user_input):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.input_chars = len(user_input or '')
+        self.attrs = {}
+        self.spans = []
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self.root = self.start('turn', 'turn')
+
+    def start(self, stage, name, parent=None, **attrs):
+        span = {'id': None, 'parent': parent, 'stage': stage, 'name': name,
+                'start_ms': round((time.perf_counter() - self._t0) * 1000, 3), 'duration_ms': None, **attrs}
+        with self._lock:
+            span['id'] = len(self.spans)
+            self.spans.append(span)
+        return span
+
+    def end(self, span, **attrs):
+        span['duration_ms'] = round((time.perf_counter() - self._t0) * 1000 - span['start_ms'], 3)
+        span.update(attrs)
+
+    def open_span(self, stage):
+        # span mais recente ainda aberto de um estágio (ex.: a tool em que o acesso ao banco aconteceu)
+        with self._lock:
+            for span in reversed(self.spans):
+                if span['stage'] == stage and span['duration_ms'] is None:
+                    return span
+        return None
+
+    def record(self):
+        return {'trace_id': self.id, 'session_id': self.session_id, 'ts': time.time(),
+                'duration_ms': self.root['duration_ms'], 'input_chars': self.input_chars, **self.attrs,
+                'spans': self.spans}
+
+
+class TraceWriter():
+    '''
+    ### Grava os registros numa thread de fundo, em lotes (por quantidade ou por tempo)
+    - O turno só faz um `put` na fila; o disco fica fora do caminho da resposta
+    '''
+
+    def __init__(self, path=TRACE_PATH, flush_every=TRACE_FLUSH_EVERY, flush_interval=TRACE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='trace-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        self._queue.put(record)
+
+    def _run(self):
+        pending, last = [], time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            stop = item is _STOP
+            if item is not None and not stop:
+                pending.append(item)
+            if pending and (stop or len(pending) >= self.flush_every or time.monotonic() - last >= self.flush_interval):
+                self._write(pending)
+                pending, last = [], time.monotonic()
+            if stop:
+                return
+
+    def _write(self, records):
+        # falha de disco não pode derrubar a thread (nem o atendimento); o lote é perdido
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        except OSError:
+            pass
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=5)
+
+
+_STOP = object()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = TraceWriter()
+                atexit.register(_writer.close)
+    return _writer
+
+
+@contextmanager
+def trace_turn(session_id, user_input):
+    '''
+    ### Abre o trace de um turno (no-op com TRACING=0); ao sair, o registro vai para a fila de gravação
+    '''
+    if not TRACING:
+        yield None
+        return
+    trace = Trace(session_id, user_input)
+    trace_token = _trace.set(trace)
+    span_token = _span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        trace.end(trace.root)
+        _span.reset(span_token)
+        _trace.reset(trace_token)
+        get_writer().put(trace.record())
+
+
+@contextmanager
+def span(stage, name=None, **attrs):
+    '''
+    ### Span filho do span atual (router, faq, specialist, orchestrator...); no-op fora de um trace
+    '''
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _span.get()
+    current = trace.start(stage, name or stage, parent['id'] if parent else None, **attrs)
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current['error'] = type(e).__name__
+        raise
+    finally:
+        trace.end(current)
+        _span.reset(token)
+
+
+def set_attrs(**attrs):
+    '''
+    ### Atributos no registro do turno atual (ex.: route)
+    '''
+    trace = _trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def traced(stage):
+    '''
+    ### Decorator: mede a função como um span `stage` (ex.: @traced('db') nas tools do pg_tools)
+    - Dentro de uma tool, o span fica pendurado nela; fora de um trace, só chama a função
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _trace.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            parent = trace.open_span('tool') or _span.get()
+            current = trace.start(stage, func.__name__, parent['id'] if parent else None)
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                current['error'] = type(e).__name__
+                raise
+            finally:
+                trace.end(current)
+        return wrapper
+    return decorator
+
+
+def _usage(response):
+    # Gemini devolve usage_metadata na mensagem; outros modelos em llm_output['token_usage']
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+            if usage:
+                return usage.get('input_tokens'), usage.get('output_tokens')
+    usage = (response.llm_output or {}).get('token_usage') or {}
+    return usage.get('prompt_tokens'), usage.get('completion_tokens')
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    '''
+    ### Callback do LangChain que vira spans `llm` e `tool` no trace do turno atual
+    - Passe em `config={'callbacks': [tracer]}`; uma instância serve para todos os turnos
+    '''
+
+    run_inline = True
+
+    def __init__(self):
+        self._runs = {}   # run_id -> (trace, span)
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, stage, name, **attrs):
+        trace = _trace.get()
+        if trace is None:
+            return
+        parent = _span.get()
+        current = trace.start(stage, name, parent['id'] if parent else None, **attrs)
+        with self._lock:
+            self._runs[run_id] = (trace, current)
+
+    def _end(self, run_id, **attrs):
+        with self._lock:
+            entry = self._runs.pop(run_id, None)
+        if entry:
+            entry[0].end(entry[1], **attrs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, invocation_params=None, **kwargs):
+        model = (metadata or {}).get('ls_model_name') or (invocation_params or {}).get('model')
+        self._start(run_id, 'llm', model or 'llm', model=model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, invocation_params=None, **kwargs):
+        model = (metadata or {}).get('ls_model_name') or (invocation_params or {}).get('model')
+        self._start(run_id, 'llm', model or 'llm', model=model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = _usage(response)
+        self._end(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get('name') or kwargs.get('name') or 'tool'
+        self._start(run_id, 'tool', name, args_size=len(input_str or ''))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_size=len(str(output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+
+tracer = TraceCallbackHandler()
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def summarize(path=TRACE_PATH, by_name=False):
+    '''
+    ### p50/p95/p99 (ms) por estágio (ou estágio:nome) a partir do arquivo de traces
+    '''
+    durations = defaultdict(list)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for s in json.loads(line)['spans']:
+                if s['duration_ms'] is None:
+                    continue
+                key = f"{s['stage']}:{s['name']}" if by_name and s['stage'] != 'turn' else s['stage']
+                durations[key].append(s['duration_ms'])
+    return {key: {'count': len(values), 'p50_ms': _percentile(values, 50), 'p95_ms': _percentile(values, 95),
+                  'p99_ms': _percentile(values, 99)}
+            for key, values in sorted(durations.items())}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Latência por estágio (p50/p95/p99) a partir dos traces")
+    parser.add_argument('--path', default=TRACE_PATH)
+    parser.add_argument('--by-name', action='store_true', help="Separa por modelo/tool/função dentro do estágio")
+    parser.add_argument('--json', action='store_true', help="Imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    report = summarize(args.path, args.by_name)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, m in report.items():
+            print(f"{key:32} n={m['count']:<6} p50={m['p50_ms']:.1f}ms  p95={m['p95_ms']:.1f}ms  p99={m['p99_ms']:.1f}ms")
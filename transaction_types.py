@@ -0,0 +1,6 @@
+# Tipos de transação e seus apelidos, sem dependências: importado pelo pg_tools e pelo roteador
+# (o roteador só precisa das palavras, não do banco)
+
+TYPE_NAMES = {1: "INCOME", 2: "EXPENSES", 3: "TRANSFER"}   # mesmos ids da migração 0001
+
+TYPE_ALIASES = {"INCOME": "INCOME", "ENTRADA": "INCOME", "GANHEI": "INCOME", "RECEITA": "INCOME", "SALÁRIO": "INCOME", "EXPENSE": "EXPENSES", "EXPENSES": "EXPENSES", "GASTO": "EXPENSES", "COMPREI": "EXPENSES", "COMPRA": "EXPENSES", "GASTEI": "EXPENSES", "TRANSFERENCIA": "TRANSFER", "TRANSFER": "TRANSFER"}
@@ -1,38 +1,123 @@
 from dotenv import load_dotenv
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.memory import ChatMessageHistory
+import asyncio
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from db import LOCAL_TIMEZONE
+from governor import GOVERNOR, POLICIES, CANNED_REPLY, CircuitOpenError
 
-TZ = ZoneInfo("America/Sao_Paulo")
+TZ = ZoneInfo(LOCAL_TIMEZONE)
 today = datetime.now(TZ).date()
 
-store = {}
+load_dotenv()
+
+from history import make_history_store
+from llm_cache import llm_cache_for
+
+# Históricos das sessões: em memória com LRU/TTL ou no Postgres (HISTORY_BACKEND)
+store = make_history_store()
 
 def get_session_history(session_id):
     '''
     ### Função que retorna o histórico de uma sessão específica
     - session_id: id da sessão
     '''
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
+    return store.get(session_id)
+
+# ---------- clientes do Gemini governados ----------
+
+def _canned_result():
+    # marcada como degradada para o cache de respostas (llm_cache.py) não guardar
+    message = AIMessage(content=CANNED_REPLY, response_metadata={'degraded': True})
+    return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _canned_chunk():
+    return ChatGenerationChunk(message=AIMessageChunk(content=CANNED_REPLY, response_metadata={'degraded': True}))
+
+
+class GovernedChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    '''
+    ### ChatGoogleGenerativeAI com todas as chamadas passando pelo GOVERNOR (política `governor_key`)
+    - Circuito aberto: devolve CANNED_REPLY na hora em vez de esperar o provedor
+    '''
+
+    governor_key: str = 'llm'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        generate = super()._generate
+        return GOVERNOR.call(self.governor_key, lambda: generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+                             fallback=_canned_result)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        agenerate = super()._agenerate
+        return await GOVERNOR.acall(
+            self.governor_key, lambda: agenerate(messages, stop=stop, run_manager=run_manager, **kwargs),
+            fallback=_canned_result)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        try:
+            with GOVERNOR.guard(self.governor_key):
+                yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except CircuitOpenError:
+            yield _canned_chunk()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        try:
+            async with GOVERNOR.aguard(self.governor_key):
+                async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    yield chunk
+        except CircuitOpenError:
+            yield _canned_chunk()
+
+
+class GovernedGoogleGenerativeAIEmbeddings(GoogleGenerativeAIEmbeddings):
+    '''
+    ### Embeddings do Gemini pelo GOVERNOR (política `embeddings`); circuito aberto levanta CircuitOpenError
+    '''
+
+    def embed_documents(self, texts, *args, **kwargs):
+        embed = super().embed_documents
+        return GOVERNOR.call('embeddings', lambda: embed(texts, *args, **kwargs))
+
+    def embed_query(self, text, *args, **kwargs):
+        embed = super().embed_query
+        return GOVERNOR.call('embeddings', lambda: embed(text, *args, **kwargs))
+
+    # o cliente é síncrono: cada tentativa roda numa thread, e o hedge/cancelamento ficam no lado async
+    async def aembed_documents(self, texts, *args, **kwargs):
+        embed = super().embed_documents
+        return await GOVERNOR.acall('embeddings', lambda: asyncio.to_thread(embed, texts, *args, **kwargs))
+
+    async def aembed_query(self, text, *args, **kwargs):
+        embed = super().embed_query
+        return await GOVERNOR.acall('embeddings', lambda: asyncio.to_thread(embed, text, *args, **kwargs))
 
-load_dotenv()
 
-llm = ChatGoogleGenerativeAI(
+# Os três clientes passam pelo governor.py (taxa, prazos, retries, hedge e circuit breaker);
+# max_retries=1 desliga o retry interno do SDK para não somar com o do governor
+llm = GovernedChatGoogleGenerativeAI(
+    governor_key="llm",
     model="gemini-2.5-flash",
     temperature=0.7,
     top_p=0.95,
-    google_api_key=os.getenv("GEMINI_API_KEY")
+    google_api_key=os.getenv("GEMINI_API_KEY"),
+    timeout=POLICIES["llm"]["timeout"],
+    max_retries=1,
+    cache=llm_cache_for(temperature=0.7)
 )
 
-llm_fast = ChatGoogleGenerativeAI(
+llm_fast = GovernedChatGoogleGenerativeAI(
+    governor_key="llm_fast",
     model="gemini-2.0-flash",
     temperature=0,
-    google_api_key=os.getenv("GEMINI_API_KEY")
+    google_api_key=os.getenv("GEMINI_API_KEY"),
+    timeout=POLICIES["llm_fast"]["timeout"],
+    max_retries=1,
+    cache=llm_cache_for(temperature=0)  # respostas determinísticas: cache persistente (llm_cache.py)
 )
 
-embeddings = GoogleGenerativeAIEmbeddings(model="text-embedding-004", google_api_key=os.getenv('GEMINI_API_KEY'))
\ No newline at end of file
+embeddings = GovernedGoogleGenerativeAIEmbeddings(model="text-embedding-004", google_api_key=os.getenv('GEMINI_API_KEY'))
\ No newline at end of file